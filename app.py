@@ -5,13 +5,25 @@ Main Streamlit Application
 import streamlit as st
 import json
 import os
+import re
+import threading
 from pathlib import Path
+from typing import Dict
+
+import pandas as pd
 
 # Import our custom modules
 from src.config import Config
 from src.agents.log_analyzer import LogAnalyzerAgent
 from src.utils.code_mapper import CodeMapper
+from src.utils.code_watcher import CodeWatcher
 from src.utils.anomaly_detector import AnomalyDetector
+from src.utils.log_follower import LogFollower
+from src.utils.log_index import LogTimeIndex, index_path_for
+from src.utils.log_parser import iter_records
+from src.utils.log_reader import MappedLogReader
+from src.utils.log_timestamps import format_timestamp_ms
+from src.utils.token_index import LogTokenIndex, query_tokens
 
 # Page configuration
 st.set_page_config(
@@ -86,12 +98,62 @@ def initialize_session_state():
         st.session_state.code_context = None
     if 'anomalies' not in st.session_state:
         st.session_state.anomalies = None
-    if 'log_content' not in st.session_state:
-        st.session_state.log_content = None
+    if 'log_records' not in st.session_state:
+        st.session_state.log_records = None
     if 'user_query' not in st.session_state:
         st.session_state.user_query = ""
 
 
+INDEX_STAGE_LABELS = {'scan': "Scanning directories", 'read': "Reading files", 'parse': "Parsing files"}
+
+
+@st.cache_resource
+def get_code_indexer() -> Dict:
+    """
+    Build the app's CodeMapper in a background thread, once per process
+    
+    The returned state dict is updated while indexing runs (stage, done,
+    total) and holds the mapper once it is ready. A watcher then keeps it
+    current with the codebase, swapping in files changed by a deploy.
+    """
+    state = {'stage': 'scan', 'done': 0, 'total': 0, 'mapper': None, 'error': None}
+    
+    def report(stage: str, done: int, total: int):
+        state.update(stage=stage, done=done, total=total)
+    
+    def build():
+        try:
+            code_mapper = CodeMapper(Config.CODEBASE_DIR, index_file=Config.CODE_INDEX_FILE,
+                                     io_workers=Config.INDEX_IO_WORKERS,
+                                     parse_workers=Config.INDEX_PARSE_WORKERS, progress=report)
+            CodeWatcher(code_mapper).start()
+            state['mapper'] = code_mapper
+        except Exception as e:
+            state['error'] = str(e)
+    
+    threading.Thread(target=build, name='code-indexer', daemon=True).start()
+    return state
+
+
+def get_code_mapper() -> CodeMapper:
+    """The indexed CodeMapper, or an unindexed one reading files on demand while indexing runs"""
+    code_mapper = get_code_indexer()['mapper']
+    return code_mapper if code_mapper is not None else CodeMapper(Config.CODEBASE_DIR)
+
+
+def render_index_status():
+    """Show codebase indexing progress"""
+    state = get_code_indexer()
+    if state['mapper'] is not None:
+        st.markdown(f"💻 **Codebase**: 🟢 {len(state['mapper'].file_paths)} files indexed")
+    elif state['error']:
+        st.markdown(f"💻 **Codebase**: 🔴 Indexing failed ({state['error']})")
+    else:
+        label = INDEX_STAGE_LABELS.get(state['stage'], state['stage'])
+        fraction = state['done'] / state['total'] if state['total'] else 0.0
+        st.progress(min(fraction, 1.0), text=f"💻 {label}: {state['done']}/{state['total']}")
+
+
 def load_log_file(log_path: str) -> str:
     """Load log file content"""
     try:
@@ -102,6 +164,151 @@ def load_log_file(log_path: str) -> str:
         return ""
 
 
+# "what happened at 09:15?" / "errors around 9:15:30"
+QUERY_TIME_PATTERN = re.compile(r'\b([01]?\d|2[0-3]):([0-5]\d)(?::([0-5]\d))?\b')
+
+# Log window loaded around a time mentioned in the question
+QUERY_WINDOW_MS = 5 * 60 * 1000
+
+# A question whose tokens match more records than this is too broad for a token search
+MAX_QUERY_MATCHES = 200
+
+
+def extract_query_time(user_query: str):
+    """Get the first HH:MM[:SS] time of day mentioned in a question, as 'HH:MM:SS'"""
+    match = QUERY_TIME_PATTERN.search(user_query)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return f"{int(hours):02d}:{minutes}:{seconds or '00'}"
+
+
+def load_log_window(log_path: str, clock: str) -> str:
+    """
+    Load only the records around a time of day, using the log's sidecar index
+    
+    Falls back to the whole file if the log has no timestamps to index.
+    """
+    index = LogTimeIndex(log_path, index_path_for(log_path, Config.CACHE_DIR))
+    try:
+        index.update()
+    except OSError as e:
+        st.error(f"Error indexing log file: {e}")
+        return load_log_file(log_path)
+    
+    window = index.window_at(clock, QUERY_WINDOW_MS)
+    if window is None:
+        return load_log_file(log_path)
+    return '\n'.join(line for record in index.iter_records(*window) for line in record.lines)
+
+
+def load_log_for_query(log_path: str, matching_records: dict, query_time) -> str:
+    """
+    Load the part of a log that is relevant to the question
+    
+    Args:
+        log_path: Log file
+        matching_records: Result of search_logs; if it found anything, only those records are used
+        query_time: 'HH:MM:SS' mentioned in the question, if any
+    """
+    if matching_records:
+        records = matching_records.get(os.path.abspath(log_path), [])
+        return '\n'.join(line for record in records for line in record.lines)
+    if query_time:
+        return load_log_window(log_path, query_time)
+    return load_log_file(log_path)
+
+
+@st.cache_resource
+def get_token_index() -> LogTokenIndex:
+    """The ID/exception/table index of the service logs, loaded once per process"""
+    return LogTokenIndex(Config.LOG_TOKEN_INDEX_FILE)
+
+
+def follow_service_logs():
+    """
+    Analyze only what was appended to the service logs since the last refresh
+    
+    Returns:
+        (log anomalies, EventHistogram of everything ingested so far)
+    """
+    log_paths = [
+        os.path.join(Config.LOGS_DIR, "payment_service.log"),
+        os.path.join(Config.LOGS_DIR, "database.log")
+    ]
+    follower = LogFollower(Config.LOG_FOLLOW_STATE_FILE, aggregate=True)
+    log_anomalies = follower.follow(*log_paths)
+    # Keep the ID/exception/table index in step with what was ingested
+    get_token_index().update(log_paths)
+    return log_anomalies, follower.histogram
+
+
+def anomaly_lines(log_anomalies: dict) -> list:
+    """Raw log lines behind log anomalies (single hits or the exemplars of groups)"""
+    lines = []
+    for anomaly in log_anomalies.get('anomalies', []):
+        lines.extend(anomaly.get('exemplars') or [anomaly.get('line', '')])
+    return [line for line in lines if line]
+
+
+def search_logs(user_query: str) -> dict:
+    """
+    Find the records mentioning every ID, exception, table or file named in a question
+    
+    Generic words ("error", "timeout", built-in exception names) are ignored.
+    
+    Returns:
+        Dict of log path -> matching records (empty if the question names nothing
+        specific, or matches more than MAX_QUERY_MATCHES records, so the caller
+        falls back to the time window)
+    """
+    tokens = query_tokens(user_query)
+    if not tokens:
+        return {}
+    token_index = get_token_index()
+    if token_index.match_count(tokens) > MAX_QUERY_MATCHES:
+        return {}
+    return token_index.search(tokens)
+
+
+def display_error_histogram(histogram, hours: int = 6):
+    """Chart errors per minute over the most recent hours of log time"""
+    if histogram.latest_ms is None:
+        st.info("No log events ingested yet")
+        return
+    
+    start_ms = histogram.latest_ms - hours * 3_600_000
+    errors = dict(histogram.counts('level', 'ERROR', start_ms, histogram.latest_ms))
+    critical = dict(histogram.counts('level', 'CRITICAL', start_ms, histogram.latest_ms))
+    buckets = sorted(set(errors) | set(critical))
+    
+    chart_data = pd.DataFrame({
+        'Errors': [errors.get(bucket, 0) for bucket in buckets],
+        'Critical': [critical.get(bucket, 0) for bucket in buckets]
+    }, index=[format_timestamp_ms(bucket)[11:16] for bucket in buckets])
+    st.bar_chart(chart_data)
+
+
+def display_top_issues(histogram, limit: int = 4, hours: int = 6):
+    """List the most frequent anomaly keywords over the most recent hours of log time"""
+    if histogram.latest_ms is None:
+        st.info("No issues detected yet")
+        return
+    
+    severity_by_keyword = {keyword: severity
+                           for severity, keywords in AnomalyDetector.ERROR_KEYWORDS.items()
+                           for keyword in keywords}
+    start_ms = histogram.latest_ms - hours * 3_600_000
+    top = histogram.totals('keyword', start_ms, histogram.latest_ms)[:limit]
+    
+    if not top:
+        st.success("No anomaly patterns in this window")
+    for i, (keyword, count) in enumerate(top, 1):
+        severity = severity_by_keyword.get(keyword, 'LOW')
+        severity_emoji = "🔴" if severity == "CRITICAL" else "🟠" if severity == "HIGH" else "🟡"
+        st.markdown(f"{i}. {severity_emoji} {keyword.title()} ×{count}")
+
+
 def load_metrics_file(metrics_path: str) -> dict:
     """Load metrics JSON file"""
     try:
@@ -112,24 +319,20 @@ def load_metrics_file(metrics_path: str) -> dict:
         return {}
 
 
-def display_error_log(log_content: str):
+def display_error_log(log_records: list):
     """Display error log with highlighting"""
     st.markdown("### 📋 Error Logs")
     
-    # Extract error section (last 20 lines for brevity)
-    lines = log_content.split('\n')
+    # Show the first error with its traceback and the two flagged records leading up to it
     error_lines = []
-    
-    for i, line in enumerate(lines):
-        if 'ERROR' in line or 'CRITICAL' in line or 'Traceback' in line:
-            # Show context around errors
-            start = max(0, i - 2)
-            end = min(len(lines), i + 10)
-            error_lines.extend(lines[start:end])
+    for i, record in enumerate(log_records):
+        if record.level in ('ERROR', 'CRITICAL') or record.traceback:
+            for context_record in log_records[max(0, i - 2):i + 1]:
+                error_lines.extend(context_record.lines)
             break
     
     if not error_lines:
-        error_lines = lines[-20:]
+        error_lines = [line for record in log_records[-20:] for line in record.lines][-20:]
     
     st.code('\n'.join(error_lines), language='log')
 
@@ -147,8 +350,14 @@ def display_code_context(code_context: dict):
         function_name = ctx.get('function', 'unknown')
         error_line = ctx.get('error_line', 'unknown')
         
-        with st.expander(f"📄 {file_name} - Function: `{function_name}`", expanded=False):
-            st.markdown(f"**Error at line {error_line}**")
+        # Without a stack trace, contexts are functions retrieved by the log text
+        retrieved = f" (matched by log text, score {ctx['score']})" if 'score' in ctx else ""
+        with st.expander(f"📄 {file_name} - Function: `{function_name}`{retrieved}", expanded=False):
+            occurrences = ctx.get('occurrences', 1)
+            if occurrences > 1:
+                st.markdown(f"**Error at line {error_line}** ({occurrences} occurrences)")
+            else:
+                st.markdown(f"**Error at line {error_line}**")
             
             # Display code with highlighting
             snippet = ctx.get('snippet', [])
@@ -165,6 +374,14 @@ def display_code_context(code_context: dict):
                         st.code(f"Line {line_num}: {content}", language='python')
             else:
                 st.warning("No code snippet available")
+    
+    callers = code_context.get('caller_contexts', [])
+    if callers:
+        st.markdown("#### 📞 Other Callers of the Failing Code")
+        for ctx in callers:
+            with st.expander(f"📄 {ctx['file']} - `{ctx['function']}` calls `{ctx['calls']}`", expanded=False):
+                st.code("\n".join(f"{line['line_num']}: {line['content']}" for line in ctx['snippet']),
+                        language='python')
 
 
 def display_ai_analysis(analysis: dict):
@@ -216,10 +433,10 @@ def display_anomalies(anomalies: dict):
     with col1:
         st.metric("Total Anomalies", total)
     with col2:
-        critical = sum(1 for a in anomalies.get('anomalies', []) if a.get('severity') == 'CRITICAL')
+        critical = sum(a.get('count', 1) for a in anomalies.get('anomalies', []) if a.get('severity') == 'CRITICAL')
         st.metric("Critical", critical)
     with col3:
-        high = sum(1 for a in anomalies.get('anomalies', []) if a.get('severity') == 'HIGH')
+        high = sum(a.get('count', 1) for a in anomalies.get('anomalies', []) if a.get('severity') == 'HIGH')
         st.metric("High", high)
     
     st.markdown("---")
@@ -238,6 +455,10 @@ def display_anomalies(anomalies: dict):
         else:
             message = f"{anomaly.get('type', 'Unknown')} anomaly"
         
+        # Repeated problems are grouped; show how often they occurred
+        if anomaly.get('count', 1) > 1:
+            message = f"{message} ×{anomaly['count']}"
+        
         # Get timestamp
         time = anomaly.get('time') or anomaly.get('timestamp', 'unknown')
         
@@ -307,6 +528,8 @@ def main():
         for name, info in integrations.items():
             st.markdown(f"{info['icon']} **{name}**: {info['status']}")
         
+        render_index_status()
+        
         st.markdown("---")
         
         if st.button("⚙️ Configure Integrations", use_container_width=True):
@@ -360,7 +583,7 @@ def main():
                 with st.spinner("🔄 AI is analyzing logs, metrics, and code..."):
                     try:
                         # Initialize components
-                        code_mapper = CodeMapper(Config.CODEBASE_DIR)
+                        code_mapper = get_code_mapper()
                         anomaly_detector = AnomalyDetector()
                         log_analyzer = LogAnalyzerAgent(
                             api_key=api_key,
@@ -370,17 +593,30 @@ def main():
                         )
                         
                         # Load logs
-                        payment_log = load_log_file(os.path.join(Config.LOGS_DIR, "payment_service.log"))
-                        db_log = load_log_file(os.path.join(Config.LOGS_DIR, "database.log"))
+                        payment_log_path = os.path.join(Config.LOGS_DIR, "payment_service.log")
+                        db_log_path = os.path.join(Config.LOGS_DIR, "database.log")
+                        # Detect anomalies (only the bytes appended since the last run are read)
+                        log_anomalies, _ = follow_service_logs()
+                        
+                        # Questions naming IDs, exceptions or tables only get the records that
+                        # mention them; questions naming a time get the slice around it
+                        matching_records = search_logs(user_query)
+                        query_time = extract_query_time(user_query)
+                        payment_log = load_log_for_query(payment_log_path, matching_records, query_time)
+                        db_log = load_log_for_query(db_log_path, matching_records, query_time)
                         
                         # Combine logs for analysis
                         combined_log = f"=== Payment Service Log ===\n{payment_log}\n\n=== Database Log ===\n{db_log}"
                         
+                        # Decode only the warning/error records and tracebacks; code mapping
+                        # and the error view share them
+                        with MappedLogReader(payment_log_path) as payment_reader:
+                            payment_records = list(iter_records(payment_reader.iter_record_lines(
+                                MappedLogReader.ANOMALY_MARKERS + MappedLogReader.TRACEBACK_MARKERS)))
+                        
                         # Map error to code
-                        code_context = code_mapper.map_error_to_code(payment_log)
+                        code_context = code_mapper.map_records_to_code(payment_records)
                         
-                        # Detect anomalies
-                        log_anomalies = anomaly_detector.analyze_logs(combined_log)
                         metrics_data = load_metrics_file(os.path.join(Config.METRICS_DIR, "system_metrics.json"))
                         metric_anomalies = anomaly_detector.analyze_metrics(metrics_data)
                         
@@ -397,7 +633,9 @@ def main():
                         analysis = log_analyzer.analyze_error(
                             log_content=analysis_context,
                             code_context=code_context,
-                            metrics=all_anomalies
+                            metrics=all_anomalies,
+                            question=user_query,
+                            trigger_lines=anomaly_lines(log_anomalies)
                         )
                         
                         # Store in session state
@@ -405,7 +643,7 @@ def main():
                         st.session_state.current_analysis = analysis
                         st.session_state.code_context = code_context
                         st.session_state.anomalies = all_anomalies
-                        st.session_state.log_content = payment_log
+                        st.session_state.log_records = payment_records
                         st.session_state.user_query = user_query
                         
                         st.success("✅ Analysis complete!")
@@ -424,8 +662,8 @@ def main():
             col1, col2 = st.columns([1, 1])
             
             with col1:
-                if st.session_state.log_content:
-                    display_error_log(st.session_state.log_content)
+                if st.session_state.log_records:
+                    display_error_log(st.session_state.log_records)
                 st.markdown("---")
                 if st.session_state.anomalies:
                     display_anomalies(st.session_state.anomalies)
@@ -439,7 +677,7 @@ def main():
             
             # Additional info
             with st.expander("📚 View Full Code Files"):
-                code_mapper = CodeMapper(Config.CODEBASE_DIR)
+                code_mapper = get_code_mapper()
                 files = code_mapper.get_all_files()
                 
                 selected_file = st.selectbox("Select a file to view", files)
@@ -457,13 +695,10 @@ def main():
             st.markdown("#### 🚨 Recent Anomalies (Live)")
             
             # Load and display anomalies automatically
+            histogram = None
             try:
-                payment_log = load_log_file(os.path.join(Config.LOGS_DIR, "payment_service.log"))
-                db_log = load_log_file(os.path.join(Config.LOGS_DIR, "database.log"))
-                combined_log = f"{payment_log}\n{db_log}"
-                
                 anomaly_detector = AnomalyDetector()
-                log_anomalies = anomaly_detector.analyze_logs(combined_log)
+                log_anomalies, histogram = follow_service_logs()
                 metrics_data = load_metrics_file(os.path.join(Config.METRICS_DIR, "system_metrics.json"))
                 metric_anomalies = anomaly_detector.analyze_metrics(metrics_data)
                 
@@ -483,11 +718,17 @@ def main():
                     else:
                         message = f"{anomaly.get('type', 'Unknown')} anomaly"
                     
+                    if anomaly.get('count', 1) > 1:
+                        message = f"{message} ×{anomaly['count']}"
+                    
                     time = anomaly.get('time') or anomaly.get('timestamp', 'unknown')
                     
                     severity_emoji = "🔴" if severity == "CRITICAL" else "🟠" if severity == "HIGH" else "🟡"
                     st.markdown(f"{severity_emoji} **[{severity}]** {message} • *{time}*")
                 
+                st.markdown("#### 📉 Errors per Minute")
+                display_error_histogram(histogram)
+                
             except Exception as e:
                 st.error(f"Error loading dashboard data: {e}")
         
@@ -500,10 +741,8 @@ def main():
             
             st.markdown("---")
             st.markdown("#### 🎯 Top Issues")
-            st.markdown("1. 🔴 Connection Pool")
-            st.markdown("2. 🔴 Lock Timeouts")
-            st.markdown("3. 🟠 Slow Queries")
-            st.markdown("4. 🟡 High Memory")
+            if histogram is not None:
+                display_top_issues(histogram)
         
         st.markdown("---")
         
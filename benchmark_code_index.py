@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold vs warm CodeMapper construction with the persistent code index
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from src.utils.code_mapper import CodeMapper
+
+FILE_TEMPLATE = '''"""
+Generated module {index}
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Service{index}:
+    """Service {index}"""
+
+    def __init__(self, limit: int = {index}):
+        self.limit = limit
+
+    def process(self, items):
+        total = 0
+        for item in items:
+            if item > self.limit:
+                logger.warning("item %s over limit", item)
+                continue
+            total += item
+        return total
+
+    async def refresh(self):
+        def helper(value):
+            return value * 2
+        return helper(self.limit)
+
+
+def build_{index}():
+    return Service{index}()
+'''
+
+
+def generate_tree(root: str, num_files: int, files_per_dir: int = 100):
+    """Write num_files small modules under root/codebase"""
+    codebase = os.path.join(root, 'codebase')
+    for index in range(num_files):
+        directory = os.path.join(codebase, f"pkg{index // files_per_dir:04d}")
+        if index % files_per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module_{index}.py"), 'w') as f:
+            f.write(FILE_TEMPLATE.format(index=index))
+    return codebase
+
+
+def timed(label: str, build):
+    start = time.perf_counter()
+    mapper = build()
+    elapsed = time.perf_counter() - start
+    stats = mapper.code_index.stats if mapper.code_index else {}
+    print(f"   {label:<28} {elapsed * 1000:10.1f} ms   {stats}")
+    return mapper
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=50_000, help='Number of generated .py files')
+    parser.add_argument('--changed', type=int, default=100, help='Files modified before the incremental run')
+    parser.add_argument('--io-workers', type=int, default=8, help='Threads listing and reading files')
+    parser.add_argument('--parse-workers', type=int, default=None, help='Processes parsing files (default: CPU count)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='code_index_bench_')
+    try:
+        print(f"🏗️  Generating {args.files} files...")
+        codebase = generate_tree(root, args.files)
+        index_file = os.path.join(root, 'cache', 'code_index.pkl')
+
+        workers = {'io_workers': args.io_workers, 'parse_workers': args.parse_workers}
+
+        print("\n⏱️  CodeMapper construction")
+        timed("no index (file list only)", lambda: CodeMapper(codebase))
+        timed("cold (build index)", lambda: CodeMapper(codebase, index_file=index_file, **workers))
+        mapper = timed("warm (load index)", lambda: CodeMapper(codebase, index_file=index_file, **workers))
+
+        # Touch some files without changing them and really change others
+        paths = list(mapper.file_paths.values())
+        for path in paths[:args.changed]:
+            os.utime(path, None)
+        for path in paths[args.changed:2 * args.changed]:
+            with open(path, 'a') as f:
+                f.write("\n\ndef added():\n    return None\n")
+        timed(f"{args.changed} touched + {args.changed} edited", lambda: CodeMapper(codebase, index_file=index_file, **workers))
+
+        print(f"\n   index size: {os.path.getsize(index_file) / 1e6:.1f} MB")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
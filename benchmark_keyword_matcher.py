@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark KeywordMatcher against the per-keyword substring loop it replaced
+"""
+import argparse
+import random
+import string
+import time
+
+from src.utils.anomaly_detector import AnomalyDetector
+from src.utils.keyword_matcher import KeywordMatcher
+
+SAMPLE_LINE = ("2024-10-17 09:15:57,301 ERROR [database_manager.py:93] Lock timeout after 12.02s "
+               "for query: UPDATE accounts SET balance = 65000.0 WHERE account_number = 'ACC20678'")
+
+
+def build_table(num_keywords: int, seed: int = 7):
+    """The detector's own keywords, padded with random phrases up to num_keywords"""
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in AnomalyDetector.ERROR_KEYWORDS.values() for keyword in keywords]
+    while len(keywords) < num_keywords:
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+                 for _ in range(rng.randint(1, 3))]
+        keywords.append(' '.join(words))
+    keywords = keywords[:num_keywords]
+    third = max(1, len(keywords) // 3)
+    return {'CRITICAL': keywords[:third], 'HIGH': keywords[third:2 * third], 'MEDIUM': keywords[2 * third:]}
+
+
+def substring_loop(keyword_table, line):
+    """The original matching loop"""
+    found = []
+    for severity, keywords in keyword_table.items():
+        for keyword in keywords:
+            if keyword.lower() in line.lower():
+                found.append((severity, keyword))
+    return found
+
+
+def timed(function, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=20_000, help='Lines matched per run')
+    parser.add_argument('--keywords', type=int, nargs='+', default=[16, 100, 400, 1000],
+                        help='Keyword table sizes to compare')
+    args = parser.parse_args()
+
+    line = SAMPLE_LINE[:160]
+    print(f"⏱️  {args.lines} × one {len(line)}-character ERROR line")
+    print(f"   {'keywords':>8} {'substring loop':>16} {'KeywordMatcher':>16} {'speedup':>8}")
+    for num_keywords in args.keywords:
+        table = build_table(num_keywords)
+        matcher = KeywordMatcher(table)
+        assert matcher.find_all(line) == substring_loop(table, line)
+        loop_time = timed(lambda: substring_loop(table, line), args.lines)
+        matcher_time = timed(lambda: matcher.find_all(line), args.lines)
+        print(f"   {num_keywords:>8} {loop_time:>15.3f}s {matcher_time:>15.3f}s {loop_time / matcher_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
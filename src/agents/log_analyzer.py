@@ -1,15 +1,21 @@
 """
 Log Analyzer Agent - Uses LangChain and Azure OpenAI GPT-4 to analyze logs and provide insights
 """
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 from langchain_openai import AzureChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, SystemMessage
 
+from ..utils.template_miner import collapse_repeats
+from ..utils.token_index import query_tokens
+
 
 class LogAnalyzerAgent:
     """AI-powered log analysis using GPT-4 and LangChain"""
     
+    # Logs longer than this have runs of repeated records collapsed before prompting
+    MAX_LOG_CHARS = 40_000
+    
     SYSTEM_PROMPT = """You are an expert DevOps engineer and system reliability expert specializing in analyzing production issues, particularly in financial services and payment systems.
 
 Your role is to:
@@ -45,7 +51,8 @@ Be specific about:
         )
     
     def analyze_error(self, log_content: str, code_context: Optional[Dict] = None, 
-                     metrics: Optional[Dict] = None) -> Dict:
+                     metrics: Optional[Dict] = None, question: Optional[str] = None,
+                     trigger_lines: Iterable[str] = ()) -> Dict:
         """
         Analyze an error log with optional code context and metrics
         
@@ -53,12 +60,14 @@ Be specific about:
             log_content: The error log content
             code_context: Code context from CodeMapper
             metrics: System metrics from AnomalyDetector
+            question: The user's question; records naming its IDs are never collapsed
+            trigger_lines: Log lines that triggered the analysis, kept verbatim
             
         Returns:
             Dict with AI analysis and recommendations
         """
         # Build the analysis prompt
-        prompt = self._build_analysis_prompt(log_content, code_context, metrics)
+        prompt = self._build_analysis_prompt(log_content, code_context, metrics, question, trigger_lines)
         
         # Get AI analysis
         messages = [
@@ -87,20 +96,39 @@ Be specific about:
             }
     
     def _build_analysis_prompt(self, log_content: str, code_context: Optional[Dict], 
-                               metrics: Optional[Dict]) -> str:
+                               metrics: Optional[Dict], question: Optional[str] = None,
+                               trigger_lines: Iterable[str] = ()) -> str:
         """Build a comprehensive prompt for analysis"""
         prompt_parts = [
             "# Error Log Analysis Request\n",
             "## Error Logs:\n```",
-            log_content,
+            # Over-budget logs have runs of repeated records collapsed, in time order
+            collapse_repeats(log_content, self.MAX_LOG_CHARS,
+                             keep_tokens=query_tokens(question) if question else (),
+                             keep_lines=trigger_lines),
             "```\n"
         ]
         
         # Add code context if available
         if code_context and code_context.get('code_contexts'):
-            prompt_parts.append("\n## Code Context:\n")
+            if code_context.get('stack_trace'):
+                prompt_parts.append("\n## Code Context:\n")
+            else:
+                prompt_parts.append("\n## Code Context (no stack trace; functions matching the log messages):\n")
             for ctx in code_context['code_contexts']:
-                prompt_parts.append(f"\n### File: {ctx['file']}, Function: {ctx.get('function', 'unknown')}\n```python")
+                occurrences = ctx.get('occurrences', 1)
+                repeated = f" (in {occurrences} frames)" if occurrences > 1 else ""
+                prompt_parts.append(f"\n### File: {ctx['file']}, Function: {ctx.get('function', 'unknown')}{repeated}\n```python")
+                for line in ctx['snippet']:
+                    marker = ">>> " if line['is_error'] else "    "
+                    prompt_parts.append(f"{marker}Line {line['line_num']}: {line['content']}")
+                prompt_parts.append("```\n")
+        
+        # Other code paths into the failing functions (blast radius)
+        if code_context and code_context.get('caller_contexts'):
+            prompt_parts.append("\n## Other Callers of the Failing Code:\n")
+            for ctx in code_context['caller_contexts']:
+                prompt_parts.append(f"\n### File: {ctx['file']}, Function: {ctx['function']} (calls {ctx['calls']})\n```python")
                 for line in ctx['snippet']:
                     marker = ">>> " if line['is_error'] else "    "
                     prompt_parts.append(f"{marker}Line {line['line_num']}: {line['content']}")
@@ -27,6 +27,13 @@ class Config:
     LOGS_DIR = os.path.join(DUMMY_DATA_DIR, "logs")
     METRICS_DIR = os.path.join(DUMMY_DATA_DIR, "metrics")
     CODEBASE_DIR = os.path.join(DUMMY_DATA_DIR, "codebase")
+    CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, ".cache"))
+    LOG_FOLLOW_STATE_FILE = os.path.join(CACHE_DIR, "log_follow_state.json")
+    LOG_TOKEN_INDEX_FILE = os.path.join(CACHE_DIR, "log_token_index.pkl")
+    CODE_INDEX_FILE = os.path.join(CACHE_DIR, "code_index.pkl")
+    # Threads reading and processes parsing the codebase while indexing (0 = CPU count)
+    INDEX_IO_WORKERS = int(os.getenv("INDEX_IO_WORKERS", "8"))
+    INDEX_PARSE_WORKERS = int(os.getenv("INDEX_PARSE_WORKERS", "0")) or None
     
     # LangChain Settings
     MAX_TOKENS = 4096
@@ -0,0 +1,136 @@
+"""
+Anomaly Aggregator - Groups repeated log anomalies by a normalized fingerprint
+"""
+import hashlib
+import re
+from typing import Dict, List, Tuple
+
+from .log_timestamps import TIMESTAMP_PATTERN
+
+# [database_manager.py:93] style source location
+SOURCE_LOCATION_PATTERN = re.compile(r'\[([\w./-]+\.py):(\d+)\]')
+# [DB-POOL] style component tag
+SOURCE_TAG_PATTERN = re.compile(r'\[([A-Z][A-Z0-9_-]*)\]')
+
+# Masks applied to messages, in order: identifiers before plain numbers
+MASKS = [
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<HEX>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b[A-Za-z]+[-_]?\d+[A-Za-z0-9]*\b'), '<ID>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<N>'),
+]
+
+LEVEL_PATTERN = re.compile(r'^\s*(?:DEBUG|INFO|WARNING|ERROR|CRITICAL):?\s*')
+
+_SEVERITY_ORDER = {'CRITICAL': 4, 'HIGH': 3, 'MEDIUM': 2, 'LOW': 1}
+
+
+class AnomalyAggregator:
+    """Collapses log anomalies with the same fingerprint into one counted group"""
+
+    def __init__(self, max_exemplars: int = 3):
+        """
+        Args:
+            max_exemplars: Raw log lines kept per group
+        """
+        self.max_exemplars = max_exemplars
+        self._groups = {}
+
+    @staticmethod
+    def fingerprint(line: str) -> Tuple[str, str]:
+        """
+        Normalize a log line for grouping
+
+        Returns:
+            (source, masked message): source is 'file.py:NN' or a component tag
+        """
+        message = TIMESTAMP_PATTERN.sub('', line, count=1)
+
+        source = ''
+        location = SOURCE_LOCATION_PATTERN.search(message)
+        if location:
+            source = f"{location.group(1)}:{location.group(2)}"
+            message = message[:location.start()] + message[location.end():]
+        else:
+            tag = SOURCE_TAG_PATTERN.search(message)
+            if tag:
+                source = tag.group(1)
+                message = message[:tag.start()] + message[tag.end():]
+
+        message = LEVEL_PATTERN.sub('', message.strip())
+        for pattern, placeholder in MASKS:
+            message = pattern.sub(placeholder, message)
+
+        return source, message.strip()
+
+    def add(self, anomaly: Dict):
+        """Add a log_pattern anomaly (as built by AnomalyDetector) to its group"""
+        source, message = self.fingerprint(anomaly['line'])
+        key = (anomaly['severity'], anomaly['keyword'], source, message)
+
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = {
+                'type': 'log_pattern_group',
+                'severity': anomaly['severity'],
+                'keyword': anomaly['keyword'],
+                'source': source,
+                'message': message,
+                'fingerprint': _fingerprint_id(key),
+                'count': 1,
+                'first_seen': anomaly['timestamp'],
+                'first_seen_ms': anomaly.get('timestamp_ms'),
+                'last_seen': anomaly['timestamp'],
+                'last_seen_ms': anomaly.get('timestamp_ms'),
+                'exemplars': [anomaly['line']] if self.max_exemplars else []
+            }
+            return
+
+        group['count'] += 1
+        group['last_seen'] = anomaly['timestamp']
+        group['last_seen_ms'] = anomaly.get('timestamp_ms')
+        if len(group['exemplars']) < self.max_exemplars:
+            group['exemplars'].append(anomaly['line'])
+
+    def merge_groups(self, groups: List[Dict]):
+        """Merge groups produced by another aggregator that saw later lines"""
+        for other in groups:
+            key = (other['severity'], other['keyword'], other['source'], other['message'])
+            group = self._groups.get(key)
+            if group is None:
+                group = dict(other)
+                group['exemplars'] = list(other['exemplars'][:self.max_exemplars])
+                self._groups[key] = group
+                continue
+
+            group['count'] += other['count']
+            group['last_seen'] = other['last_seen']
+            group['last_seen_ms'] = other['last_seen_ms']
+            room = self.max_exemplars - len(group['exemplars'])
+            if room > 0:
+                group['exemplars'].extend(other['exemplars'][:room])
+
+    def groups(self, sort: bool = True) -> List[Dict]:
+        """
+        Get the groups
+
+        Args:
+            sort: Most severe and most frequent first; otherwise in first-seen order
+        """
+        groups = [dict(group, exemplars=list(group['exemplars']),
+                       timestamp=group['first_seen'], timestamp_ms=group['first_seen_ms'])
+                  for group in self._groups.values()]
+        return sort_groups(groups) if sort else groups
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+
+def sort_groups(groups: List[Dict]) -> List[Dict]:
+    """Order groups most severe and most frequent first (stable for ties)"""
+    return sorted(groups, key=lambda g: (_SEVERITY_ORDER.get(g['severity'], 0), g['count']), reverse=True)
+
+
+def _fingerprint_id(key: Tuple) -> str:
+    """Short stable identifier for a fingerprint"""
+    return hashlib.sha1('\x1f'.join(key).encode('utf-8')).hexdigest()[:12]
@@ -1,10 +1,27 @@
 """
 Anomaly Detector - Detects unusual patterns in logs and metrics
 """
-import re
-from typing import Dict, List
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
 from datetime import datetime
 
+import numpy as np
+
+from .anomaly_aggregator import AnomalyAggregator
+from .event_histogram import EventHistogram
+from .keyword_matcher import KeywordMatcher
+from .log_reader import (DEFAULT_CHUNK_SIZE, LogSource, MappedLogReader, find_shard_boundaries,
+                         iter_byte_range_lines, iter_log_lines)
+from .log_parser import LogRecord, iter_records
+from .log_timestamps import clock_to_ms, day_start_ms, format_timestamp_ms, parse_log_timestamp
+from .metric_baseline import MetricBaseline, floor_std
+from .template_miner import TemplateMiner
+
+# Files smaller than this per worker are not worth the process start-up cost
+MIN_SHARD_BYTES = 8 * 1024 * 1024
+
 
 class AnomalyDetector:
     """Detects anomalies in logs and system metrics"""
@@ -25,16 +42,259 @@ class AnomalyDetector:
         'queue_size': 3
     }
     
-    def analyze_logs(self, log_content: str) -> Dict:
+    # Values at or above these are HIGH severity instead of MEDIUM
+    HIGH_SEVERITY_BANDS = {
+        'connection_pool_usage': 0.9,
+        'error_rate': 0.25,
+        'avg_response_time_ms': 1000,
+        'queue_size': 5
+    }
+    
+    # Metric columns used by the threshold checks
+    METRIC_COLUMNS = ('active_connections', 'error_rate', 'avg_response_time_ms', 'queue_size')
+    
+    # Pool size used when a sample has no 'max_connections' field
+    MAX_CONNECTIONS = 10  # From our DatabaseManager
+    
+    # Raw lines kept per anomaly group in aggregate mode
+    MAX_EXEMPLARS = 3
+    
+    def __init__(self):
+        self._matcher = None
+    
+    def analyze_logs(self, log_content: str, aggregate: bool = False) -> Dict:
         """
         Analyze log content for anomalies
         
+        Args:
+            log_content: The log text
+            aggregate: Group repeated hits by fingerprint instead of returning one
+                record per hit (see AnomalyAggregator)
+        
         Returns:
             Dict with detected anomalies and statistics
         """
-        lines = log_content.split('\n')
+        return self._analyze_lines(log_content.split('\n'), aggregate)
+    
+    def analyze_log_stream(self, source: LogSource, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           aggregate: bool = False, histogram: Optional[EventHistogram] = None) -> Dict:
+        """
+        Analyze a log without loading it into memory
+        
+        Args:
+            source: Log file path, open file object, iterable of lines, or a
+                MappedLogReader (only lines with an ERROR/CRITICAL/WARNING marker
+                are decoded; a histogram then only sees those lines)
+            chunk_size: Read size used when streaming from a file
+            aggregate: Group repeated hits by fingerprint
+            histogram: If given, every record and keyword hit is also counted in it
+            
+        Returns:
+            Dict with detected anomalies and statistics (same shape as analyze_logs)
+        """
+        if isinstance(source, MappedLogReader):
+            lines = source.iter_matching_lines(MappedLogReader.ANOMALY_MARKERS)
+        else:
+            lines = iter_log_lines(source, chunk_size)
+        if histogram is None:
+            return self._analyze_lines(lines, aggregate)
+        return self._analyze_records(iter_records(lines), aggregate, histogram=histogram)
+    
+    def analyze_log_file_parallel(self, log_path: str, workers: Optional[int] = None,
+                                  min_shard_bytes: int = MIN_SHARD_BYTES,
+                                  aggregate: bool = False) -> Dict:
+        """
+        Analyze a large log file using several processes
+        
+        The file is split into byte ranges aligned to record starts, each range
+        is analyzed in a separate process, and the partial results are merged
+        in file order, so the output is identical to analyze_log_stream.
+        
+        Args:
+            log_path: Path to the log file
+            workers: Number of worker processes (defaults to the CPU count)
+            min_shard_bytes: Minimum shard size; small files are analyzed in-process
+            aggregate: Group repeated hits by fingerprint
+            
+        Returns:
+            Dict with detected anomalies and statistics (same shape as analyze_logs)
+        """
+        workers = workers or os.cpu_count() or 1
+        num_shards = min(workers, os.path.getsize(log_path) // max(1, min_shard_bytes))
+        if num_shards <= 1:
+            return self.analyze_log_stream(log_path, aggregate=aggregate)
+        
+        shards = find_shard_boundaries(log_path, num_shards)
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            results = list(executor.map(
+                _analyze_shard,
+                [self] * len(shards),
+                [log_path] * len(shards),
+                [start for start, _ in shards],
+                [end for _, end in shards],
+                [aggregate] * len(shards)
+            ))
+        
+        return self._merge_results(results, aggregate)
+    
+    def _merge_results(self, results: List[Dict], aggregate: bool = False) -> Dict:
+        """Merge per-shard results, keeping anomalies in shard (file) order"""
+        merged = {
+            'total_anomalies': 0,
+            'error_count': 0,
+            'warning_count': 0,
+            'critical_count': 0,
+            'anomalies': []
+        }
+        for result in results:
+            for key in ('total_anomalies', 'error_count', 'warning_count', 'critical_count'):
+                merged[key] += result[key]
+            merged['anomalies'].extend(result['anomalies'])
+        
+        if aggregate:
+            aggregator = AnomalyAggregator(self.MAX_EXEMPLARS)
+            for result in results:
+                aggregator.merge_groups(result['anomalies'])
+            merged['anomalies'] = aggregator.groups()
+            merged['distinct_anomalies'] = len(aggregator)
+        return merged
+    
+    def analyze_records(self, records: Iterable[LogRecord], aggregate: bool = False,
+                        histogram: Optional[EventHistogram] = None) -> Dict:
+        """
+        Analyze log records already produced by the log parser
+        
+        Args:
+            records: LogRecord objects (see log_parser.iter_records)
+            aggregate: Group repeated hits by fingerprint
+            histogram: If given, every record and keyword hit is also counted in it
+            
+        Returns:
+            Dict with detected anomalies and statistics (same shape as analyze_logs)
+        """
+        return self._analyze_records(records, aggregate, histogram=histogram)
+    
+    def analyze_log_templates(self, records: Iterable[LogRecord], miner: TemplateMiner,
+                              baseline: Optional[MetricBaseline] = None, min_history: int = 1000,
+                              z_threshold: float = 3.0, high_z_threshold: float = 5.0,
+                              min_rate: int = 10) -> Dict:
+        """
+        Detect new log templates and sudden jumps in a template's rate
+        
+        Records are clustered with the miner. A template first seen after the
+        miner has learned from min_history lines is reported as new. Each
+        template's per-minute count is scored against its EWMA baseline before
+        being folded into it; a minute fires when it is z_threshold standard
+        deviations above the baseline and at least min_rate lines. Minutes
+        without the template after its first line count as zero; only the
+        minutes it was logged in are visited.
+        
+        Args:
+            records: LogRecord objects (see log_parser.iter_records)
+            miner: Template miner, updated in place (persist it with miner.to_dict)
+            baseline: Per-template rate baselines, updated in place
+            min_history: Lines the miner must have seen before new templates count
+            z_threshold: Deviations above the baseline that count as a rate jump
+            high_z_threshold: Deviations above the baseline that count as HIGH severity
+            min_rate: Fewest lines per minute that can count as a rate jump
+            
+        Returns:
+            Dict with template anomalies
+        """
+        baseline = baseline if baseline is not None else MetricBaseline()
+        anomalies = []
+        new_templates = 0
+        # template ID -> minute bucket -> lines
+        minute_counts = {}
+        
+        for record in records:
+            learned = miner.total_lines
+            template_id, _, is_new = miner.add_record(record)
+            
+            if is_new and learned >= min_history:
+                new_templates += 1
+                anomalies.append({
+                    'type': 'new_template',
+                    'severity': 'HIGH' if record.level in ('ERROR', 'CRITICAL') else 'MEDIUM',
+                    'template_id': template_id,
+                    'timestamp': record.timestamp or 'unknown',
+                    'timestamp_ms': record.timestamp_ms,
+                    'line': record.raw.strip(),
+                    'message': f"New log pattern: {record.message[:100]}"
+                })
+            
+            if record.timestamp_ms is not None:
+                buckets = minute_counts.setdefault(template_id, {})
+                minute = record.timestamp_ms - record.timestamp_ms % 60_000
+                buckets[minute] = buckets.get(minute, 0) + 1
+        
+        last_minute = max((max(buckets) for buckets in minute_counts.values()), default=None)
+        
+        for template_id, buckets in minute_counts.items():
+            template = miner.template(template_id)
+            previous = None
+            for minute in sorted(buckets):
+                # Quiet minutes since the template's previous line count as zero so the baseline
+                # sees the real rate; they can never fire, so they are folded in all at once
+                if previous is not None:
+                    baseline.update_repeated(template_id, 'lines_per_minute', 0,
+                                             (minute - previous) // 60_000 - 1)
+                previous = minute
+                count = buckets[minute]
+                limit = high_limit = None
+                
+                if baseline.is_warm(template_id, 'lines_per_minute'):
+                    mean, std, _ = baseline.get(template_id, 'lines_per_minute')
+                    # Counts vary by about sqrt(mean) even when the rate is steady
+                    std = floor_std(mean, std, max(1.0, math.sqrt(mean)))
+                    limit = max(min_rate, mean + z_threshold * std)
+                    high_limit = max(min_rate, mean + high_z_threshold * std)
+                    zscore = (count - mean) / std
+                
+                baseline.update(template_id, 'lines_per_minute', count)
+                
+                if limit is None or count <= limit:
+                    continue
+                
+                anomalies.append({
+                    'type': 'template_rate_anomaly',
+                    'severity': 'HIGH' if count >= high_limit else 'MEDIUM',
+                    'template_id': template_id,
+                    'timestamp': format_timestamp_ms(minute),
+                    'timestamp_ms': minute,
+                    'value': count,
+                    'zscore': round(zscore, 2),
+                    'message': f"'{template['template'][:80]}' logged {count}×/min ({zscore:.1f}σ above baseline)"
+                })
+            
+            baseline.update_repeated(template_id, 'lines_per_minute', 0, (last_minute - previous) // 60_000)
+        
+        return {
+            'total_anomalies': len(anomalies),
+            'new_templates': new_templates,
+            'anomalies': sorted(anomalies, key=lambda x: self._severity_to_int(x['severity']), reverse=True)
+        }
+    
+    def _analyze_lines(self, lines: Iterable[str], aggregate: bool = False,
+                       sort_groups: bool = True, keywords: Optional[List[str]] = None) -> Dict:
+        """
+        Scan raw log lines and collect anomalies and counters
+        
+        Lines are not grouped into records: a line's timestamp is only parsed
+        when it has a keyword hit, which is the timestamp its record header
+        would have given.
+        
+        Args:
+            lines: Log lines
+            aggregate: Group repeated hits by fingerprint
+            sort_groups: Sort groups by severity (False keeps first-seen order)
+            keywords: If given, the keyword of every hit is appended to it
+        """
+        matcher = self._get_matcher()
+        aggregator = AnomalyAggregator(self.MAX_EXEMPLARS) if aggregate else None
         
         anomalies = []
+        anomaly_count = 0
         error_count = 0
         warning_count = 0
         critical_count = 0
@@ -45,30 +305,68 @@ class AnomalyDetector:
                 error_count += 1
                 
                 # Check for specific critical patterns
-                for severity, keywords in self.ERROR_KEYWORDS.items():
-                    for keyword in keywords:
-                        if keyword.lower() in line.lower():
-                            anomalies.append({
-                                'type': 'log_pattern',
-                                'severity': severity,
-                                'keyword': keyword,
-                                'line': line.strip(),
-                                'timestamp': self._extract_timestamp(line)
-                            })
-                            
-                            if severity == 'CRITICAL':
-                                critical_count += 1
+                hits = matcher.find_all(line)
+                if hits:
+                    timestamp, timestamp_ms = parse_log_timestamp(line)
+                for severity, keyword in hits:
+                    anomaly = {
+                        'type': 'log_pattern',
+                        'severity': severity,
+                        'keyword': keyword,
+                        'line': line.strip(),
+                        'timestamp': timestamp or 'unknown',
+                        'timestamp_ms': timestamp_ms
+                    }
+                    anomaly_count += 1
+                    if aggregator is not None:
+                        aggregator.add(anomaly)
+                    else:
+                        anomalies.append(anomaly)
+                    if keywords is not None:
+                        keywords.append(keyword)
+                    
+                    if severity == 'CRITICAL':
+                        critical_count += 1
             
             if 'WARNING' in line:
                 warning_count += 1
         
-        return {
-            'total_anomalies': len(anomalies),
+        result = {
+            'total_anomalies': anomaly_count,
             'error_count': error_count,
             'warning_count': warning_count,
             'critical_count': critical_count,
             'anomalies': anomalies
         }
+        if aggregator is not None:
+            result['anomalies'] = aggregator.groups(sort=sort_groups)
+            result['distinct_anomalies'] = len(aggregator)
+        return result
+    
+    def _analyze_records(self, records: Iterable[LogRecord], aggregate: bool = False,
+                         sort_groups: bool = True, histogram: Optional[EventHistogram] = None) -> Dict:
+        """Scan every line of every record (see _analyze_lines), counting each record in the histogram"""
+        if histogram is None:
+            return self._analyze_lines((line for record in records for line in record.lines),
+                                       aggregate, sort_groups)
+        
+        keywords = []
+        
+        def record_lines():
+            for record in records:
+                yield from record.lines
+                # Resumed only once the scan has handled the record's last line
+                histogram.add_record(record, keywords[:])
+                keywords.clear()
+        
+        return self._analyze_lines(record_lines(), aggregate, sort_groups, keywords=keywords)
+    
+    def _get_matcher(self) -> KeywordMatcher:
+        """Return the compiled keyword matcher, rebuilding it only if ERROR_KEYWORDS changed"""
+        signature = KeywordMatcher.table_signature(self.ERROR_KEYWORDS)
+        if self._matcher is None or self._matcher.signature != signature:
+            self._matcher = KeywordMatcher(self.ERROR_KEYWORDS)
+        return self._matcher
     
     def analyze_metrics(self, metrics_data: Dict) -> Dict:
         """
@@ -80,55 +378,8 @@ class AnomalyDetector:
         anomalies = []
         
         if 'metrics' in metrics_data:
-            for metric in metrics_data['metrics']:
-                time = metric.get('time', 'unknown')
-                
-                # Check connection pool usage
-                active_conns = metric.get('active_connections', 0)
-                max_conns = 10  # From our DatabaseManager
-                pool_usage = active_conns / max_conns
-                
-                if pool_usage >= self.THRESHOLDS['connection_pool_usage']:
-                    anomalies.append({
-                        'type': 'connection_pool_high',
-                        'severity': 'HIGH' if pool_usage >= 0.9 else 'MEDIUM',
-                        'time': time,
-                        'value': f"{active_conns}/{max_conns} ({pool_usage*100:.0f}%)",
-                        'message': f"Connection pool usage at {pool_usage*100:.0f}%"
-                    })
-                
-                # Check error rate
-                error_rate = metric.get('error_rate', 0)
-                if error_rate >= self.THRESHOLDS['error_rate']:
-                    anomalies.append({
-                        'type': 'error_rate_high',
-                        'severity': 'HIGH' if error_rate >= 0.25 else 'MEDIUM',
-                        'time': time,
-                        'value': f"{error_rate*100:.1f}%",
-                        'message': f"Error rate at {error_rate*100:.1f}%"
-                    })
-                
-                # Check response time
-                response_time = metric.get('avg_response_time_ms', 0)
-                if response_time >= self.THRESHOLDS['avg_response_time_ms']:
-                    anomalies.append({
-                        'type': 'response_time_high',
-                        'severity': 'HIGH' if response_time >= 1000 else 'MEDIUM',
-                        'time': time,
-                        'value': f"{response_time}ms",
-                        'message': f"Average response time at {response_time}ms"
-                    })
-                
-                # Check queue size
-                queue_size = metric.get('queue_size', 0)
-                if queue_size >= self.THRESHOLDS['queue_size']:
-                    anomalies.append({
-                        'type': 'queue_size_high',
-                        'severity': 'HIGH' if queue_size >= 5 else 'MEDIUM',
-                        'time': time,
-                        'value': queue_size,
-                        'message': f"Connection queue size at {queue_size}"
-                    })
+            columns, times = self._metrics_to_columns(metrics_data['metrics'])
+            anomalies.extend(self._evaluate_metric_columns(columns, times))
         
         # Add predefined anomalies from the metrics data
         if 'anomalies' in metrics_data:
@@ -140,17 +391,221 @@ class AnomalyDetector:
                     'message': anomaly.get('description', 'Unknown anomaly')
                 })
         
+        self._attach_metric_timestamps(anomalies, metrics_data)
+        
+        return {
+            'total_anomalies': len(anomalies),
+            'anomalies': sorted(anomalies, key=lambda x: self._severity_to_int(x['severity']), reverse=True)
+        }
+    
+    def analyze_metric_columns(self, columns: Dict[str, Sequence], times: Sequence[str]) -> Dict:
+        """
+        Analyze metrics stored column-wise (one array per metric)
+        
+        Args:
+            columns: Metric name -> sequence or NumPy array of values, one per sample
+            times: Sample times, aligned with the columns
+            
+        Returns:
+            Dict with metric anomalies
+        """
+        anomalies = self._evaluate_metric_columns(columns, times)
+        return {
+            'total_anomalies': len(anomalies),
+            'anomalies': sorted(anomalies, key=lambda x: self._severity_to_int(x['severity']), reverse=True)
+        }
+    
+    def analyze_metrics_adaptive(self, metrics_data: Dict, baseline: MetricBaseline,
+                                 z_threshold: float = 3.0, high_z_threshold: float = 5.0) -> Dict:
+        """
+        Analyze metrics against each service's own rolling baseline
+        
+        Every sample is scored against the EWMA baseline of its series
+        ('service' or 'host' field) before being folded into it. A sample fires
+        when it is more than z_threshold standard deviations above its baseline
+        (a steady series is credited with a deviation of at least
+        MIN_RELATIVE_STD of its mean); the static THRESHOLDS act as a floor, so
+        a metric never fires below them. Until a baseline has warmed up, only
+        the static thresholds apply.
+        
+        Args:
+            metrics_data: Metrics in the same format as analyze_metrics
+            baseline: Rolling state, updated in place (persist it with baseline.save)
+            z_threshold: Deviations above the baseline that count as an anomaly
+            high_z_threshold: Deviations above the baseline that count as HIGH severity
+            
+        Returns:
+            Dict with metric anomalies
+        """
+        anomalies = []
+        
+        for metric in metrics_data.get('metrics', []):
+            series = str(metric.get('service') or metric.get('host') or 'default')
+            time = metric.get('time', 'unknown')
+            max_conns = metric.get('max_connections', self.MAX_CONNECTIONS)
+            
+            samples = {
+                'connection_pool_usage': metric.get('active_connections', 0) / max_conns if max_conns else None,
+                'error_rate': metric.get('error_rate', 0),
+                'avg_response_time_ms': metric.get('avg_response_time_ms', 0),
+                'queue_size': metric.get('queue_size', 0)
+            }
+            
+            for key, value in samples.items():
+                if value is None:
+                    # A pool reported with no size has no usage to score
+                    continue
+                limit = self.THRESHOLDS[key]
+                high_limit = self.HIGH_SEVERITY_BANDS[key]
+                zscore = None
+                
+                warm = baseline.is_warm(series, key)
+                if warm:
+                    mean, std, _ = baseline.get(series, key)
+                    std = floor_std(mean, std)
+                    limit = max(limit, mean + z_threshold * std)
+                    high_limit = max(high_limit, mean + high_z_threshold * std)
+                    zscore = (value - mean) / std if std > 0 else None
+                
+                baseline.update(series, key, value)
+                
+                # Against a baseline only values strictly above it fire, so a series
+                # holding steady at (or above) its static threshold is not an anomaly
+                if value < limit or (warm and value == limit):
+                    continue
+                
+                anomalies.append({
+                    'type': f"{key}_anomaly",
+                    'severity': 'HIGH' if value >= high_limit else 'MEDIUM',
+                    'time': time,
+                    'series': series,
+                    'value': value,
+                    'zscore': round(zscore, 2) if zscore is not None else None,
+                    'message': f"{key} at {value:g} for {series}" + (
+                        f" ({zscore:.1f}σ above baseline)" if zscore is not None else "")
+                })
+        
+        self._attach_metric_timestamps(anomalies, metrics_data)
+        
         return {
             'total_anomalies': len(anomalies),
             'anomalies': sorted(anomalies, key=lambda x: self._severity_to_int(x['severity']), reverse=True)
         }
     
+    def _attach_metric_timestamps(self, anomalies: List[Dict], metrics_data: Dict):
+        """Add epoch milliseconds to metric anomalies, using the date of the metrics snapshot"""
+        day_ms = day_start_ms(str(metrics_data.get('timestamp', '')))
+        for anomaly in anomalies:
+            anomaly['timestamp_ms'] = clock_to_ms(day_ms, str(anomaly['time'])) if day_ms is not None else None
+    
+    def _metrics_to_columns(self, metrics: List[Dict]):
+        """Convert a list of metric samples into per-metric columns"""
+        columns = {name: [metric.get(name, 0) for metric in metrics] for name in self.METRIC_COLUMNS}
+        if any('max_connections' in metric for metric in metrics):
+            columns['max_connections'] = [metric.get('max_connections', self.MAX_CONNECTIONS) for metric in metrics]
+        times = [metric.get('time', 'unknown') for metric in metrics]
+        return columns, times
+    
+    def _evaluate_metric_columns(self, columns: Dict[str, Sequence], times: Sequence[str]) -> List[Dict]:
+        """
+        Apply all thresholds as vector masks and build records only for rows that fire
+        
+        Records are returned in sample order, and within a sample in the order
+        pool usage, error rate, response time, queue size.
+        """
+        num_samples = len(times)
+        if num_samples == 0:
+            return []
+        
+        def column(name, default=0):
+            values = columns.get(name)
+            if values is None:
+                return np.full(num_samples, default, dtype=np.float64)
+            return np.asarray(values, dtype=np.float64)
+        
+        # A pool reported with no size gets NaN usage, which never crosses a threshold
+        pool_sizes = column('max_connections', self.MAX_CONNECTIONS)
+        pool_usage = np.divide(column('active_connections'), pool_sizes,
+                               out=np.full(num_samples, np.nan), where=pool_sizes > 0)
+        
+        values = np.stack([
+            pool_usage,
+            column('error_rate'),
+            column('avg_response_time_ms'),
+            column('queue_size')
+        ], axis=1)
+        
+        threshold_keys = ('connection_pool_usage', 'error_rate', 'avg_response_time_ms', 'queue_size')
+        thresholds = np.array([self.THRESHOLDS[key] for key in threshold_keys])
+        high_bands = np.array([self.HIGH_SEVERITY_BANDS[key] for key in threshold_keys])
+        
+        fired = values >= thresholds
+        high = values >= high_bands
+        
+        # Build records per check for the rows that fired, then interleave
+        # them back into sample order
+        records = []
+        for check, key in enumerate(threshold_keys):
+            rows = np.flatnonzero(fired[:, check])
+            is_high = high[rows, check].tolist()
+            records.append(iter(self._build_metric_anomalies(key, columns, times, rows, is_high)))
+        
+        _, checks = np.nonzero(fired)
+        return [next(records[check]) for check in checks.tolist()]
+    
+    def _build_metric_anomalies(self, key: str, columns: Dict[str, Sequence], times: Sequence[str],
+                                rows: np.ndarray, is_high: List[bool]) -> List[Dict]:
+        """Build the anomaly records for one threshold check"""
+        severities = ['HIGH' if h else 'MEDIUM' for h in is_high]
+        sample_times = _take(times, rows)
+        
+        if key == 'connection_pool_usage':
+            if 'max_connections' in columns:
+                pool_sizes = _take(columns['max_connections'], rows)
+            else:
+                pool_sizes = [self.MAX_CONNECTIONS] * len(severities)
+            return [{
+                'type': 'connection_pool_high',
+                'severity': severity,
+                'time': time,
+                'value': f"{active_conns}/{max_conns} ({active_conns/max_conns*100:.0f}%)",
+                'message': f"Connection pool usage at {active_conns/max_conns*100:.0f}%"
+            } for active_conns, max_conns, severity, time in zip(
+                _take(columns['active_connections'], rows), pool_sizes, severities, sample_times)]
+        
+        if key == 'error_rate':
+            return [{
+                'type': 'error_rate_high',
+                'severity': severity,
+                'time': time,
+                'value': f"{error_rate*100:.1f}%",
+                'message': f"Error rate at {error_rate*100:.1f}%"
+            } for error_rate, severity, time in zip(
+                _take(columns['error_rate'], rows), severities, sample_times)]
+        
+        if key == 'avg_response_time_ms':
+            return [{
+                'type': 'response_time_high',
+                'severity': severity,
+                'time': time,
+                'value': f"{response_time}ms",
+                'message': f"Average response time at {response_time}ms"
+            } for response_time, severity, time in zip(
+                _take(columns['avg_response_time_ms'], rows), severities, sample_times)]
+        
+        return [{
+            'type': 'queue_size_high',
+            'severity': severity,
+            'time': time,
+            'value': queue_size,
+            'message': f"Connection queue size at {queue_size}"
+        } for queue_size, severity, time in zip(
+            _take(columns['queue_size'], rows), severities, sample_times)]
+    
     def _extract_timestamp(self, log_line: str) -> str:
         """Extract timestamp from log line"""
-        # Pattern: 2024-10-17 09:15:45,145
-        pattern = r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}'
-        match = re.search(pattern, log_line)
-        return match.group(0) if match else 'unknown'
+        timestamp, _ = parse_log_timestamp(log_line)
+        return timestamp or 'unknown'
     
     def _severity_to_int(self, severity: str) -> int:
         """Convert severity to int for sorting"""
@@ -166,3 +621,18 @@ class AnomalyDetector:
             'LOW': '#FFD700'
         }
         return colors.get(severity.upper(), '#808080')
+
+
+def _take(values: Sequence, rows: np.ndarray) -> List:
+    """Select rows from a list or array as plain Python values"""
+    if isinstance(values, np.ndarray):
+        return values[rows].tolist()
+    return [values[row] for row in rows.tolist()]
+
+
+def _analyze_shard(detector: AnomalyDetector, log_path: str, start: int, end: int,
+                   aggregate: bool) -> Dict:
+    """Process pool entry point: analyze one byte range of a log file"""
+    # Groups stay in first-seen order so shards merge as if scanned sequentially
+    return detector._analyze_lines(iter_byte_range_lines(log_path, start, end),
+                                   aggregate, sort_groups=False)
@@ -0,0 +1,214 @@
+"""
+Call Graph - Static who-calls-whom index of a codebase's functions, in compact adjacency arrays
+"""
+import os
+import pickle
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .symbol_table import CLASS, FUNCTION, SymbolTable
+
+# A called name defined more often than this ('get', 'run', ...) is too ambiguous to link
+MAX_NAME_TARGETS = 8
+
+_GRAPH_VERSION = 1
+
+
+class CallGraph:
+    """
+    Function-level call graph built from the call sites of SymbolTables
+
+    Nodes are the functions and methods of the codebase. Calls are resolved
+    by name: self.method() / cls.method() to the method of the caller's own
+    class when it has one, ClassName() to that class's __init__, and any
+    other call to every function with that name (skipped when the name is
+    defined more than MAX_NAME_TARGETS times). Callers of each function are
+    stored in CSR form (an offsets array into a flat array of caller nodes
+    and call lines), so walking callers k levels up costs only the edges
+    visited.
+    """
+
+    def __init__(self, files: Iterable[Tuple[str, SymbolTable]] = ()):
+        """
+        Args:
+            files: (file path, symbol table) for every file of the codebase
+        """
+        self.files: List[str] = []
+        self.qualnames: List[str] = []
+        self.node_files = array('l')
+        self.node_lines = array('l')
+        # (file path, qualname) -> node
+        self._nodes: Dict[Tuple[str, str], int] = {}
+        # callee node -> [caller_offsets[node], caller_offsets[node + 1]) into the arrays below
+        self.caller_offsets = array('l')
+        self.caller_nodes = array('l')
+        self.call_lines = array('l')
+        self._build(files)
+
+    def __len__(self) -> int:
+        return len(self.qualnames)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.caller_nodes)
+
+    def node(self, file_path: str, qualname: str) -> Optional[int]:
+        return self._nodes.get((file_path, qualname))
+
+    def callers(self, file_path: str, qualname: str, depth: int = 2) -> List[Dict]:
+        """
+        Every function that reaches a function within depth calls, breadth first
+
+        Args:
+            file_path: File of the function (as given to the constructor)
+            qualname: Qualified name ('DatabaseManager.execute_transaction')
+            depth: Most call levels to walk up
+
+        Returns:
+            Dicts with the caller's file, qualname and start line, the line
+            of the call, the qualname it calls and its depth (1 = direct caller)
+        """
+        start = self._nodes.get((file_path, qualname))
+        if start is None:
+            return []
+        results = []
+        seen = {start}
+        queue = deque([(start, 0)])
+        offsets, caller_nodes, call_lines = self.caller_offsets, self.caller_nodes, self.call_lines
+        while queue:
+            node, level = queue.popleft()
+            if level >= depth:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                caller = caller_nodes[edge]
+                if caller in seen:
+                    continue
+                seen.add(caller)
+                results.append({
+                    'file': self.files[self.node_files[caller]],
+                    'qualname': self.qualnames[caller],
+                    'start_line': self.node_lines[caller],
+                    'call_line': call_lines[edge],
+                    'calls': self.qualnames[node],
+                    'depth': level + 1
+                })
+                queue.append((caller, level + 1))
+        return results
+
+    def save(self, path: str, fingerprint: str):
+        """
+        Write the graph atomically
+
+        Args:
+            path: Cache file
+            fingerprint: Identifies the code the graph was built from (see load)
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            'version': _GRAPH_VERSION,
+            'fingerprint': fingerprint,
+            'files': self.files,
+            'qualnames': self.qualnames,
+            'node_files': self.node_files,
+            'node_lines': self.node_lines,
+            'caller_offsets': self.caller_offsets,
+            'caller_nodes': self.caller_nodes,
+            'call_lines': self.call_lines
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> Optional['CallGraph']:
+        """A saved graph, or None if it is missing, unreadable or was built from other code"""
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != _GRAPH_VERSION or data.get('fingerprint') != fingerprint:
+                return None
+            graph = cls()
+            for name in ('files', 'qualnames', 'node_files', 'node_lines',
+                         'caller_offsets', 'caller_nodes', 'call_lines'):
+                setattr(graph, name, data[name])
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError, ValueError):
+            return None
+        graph._nodes = {(graph.files[file_index], qualname): node for node, (file_index, qualname)
+                        in enumerate(zip(graph.node_files, graph.qualnames))}
+        return graph
+
+    def _build(self, files: Iterable[Tuple[str, SymbolTable]]):
+        tables = []
+        by_name: Dict[str, List[int]] = {}
+        class_inits: Dict[str, List[int]] = {}
+        for file_index, (file_path, symbols) in enumerate(files):
+            self.files.append(file_path)
+            # symbol index -> node (-1 for classes)
+            symbol_nodes = []
+            for i in range(len(symbols)):
+                if symbols.kinds[i] != FUNCTION:
+                    symbol_nodes.append(-1)
+                    continue
+                node = len(self.qualnames)
+                symbol_nodes.append(node)
+                self.qualnames.append(symbols.qualnames[i])
+                self.node_files.append(file_index)
+                self.node_lines.append(symbols.starts[i])
+                self._nodes[(file_path, symbols.qualnames[i])] = node
+                by_name.setdefault(symbols.names[i], []).append(node)
+                parent = symbols.parents[i]
+                if symbols.names[i] == '__init__' and parent >= 0 and symbols.kinds[parent] == CLASS:
+                    class_inits.setdefault(symbols.names[parent], []).append(node)
+            tables.append((symbols, symbol_nodes))
+
+        edges = set()
+        for symbols, symbol_nodes in tables:
+            for scope, line, name, on_self in symbols.calls():
+                caller = self._enclosing_function(symbols, symbol_nodes, scope)
+                if caller < 0:
+                    continue
+                for callee in self._resolve(symbols, symbol_nodes, scope, name, on_self, by_name, class_inits):
+                    if callee != caller:
+                        edges.add((callee, caller, line))
+
+        # CSR by callee; (callee, caller, line) sorting keeps one edge per caller (first call line)
+        counts = [0] * (len(self.qualnames) + 1)
+        previous = None
+        for callee, caller, line in sorted(edges):
+            if (callee, caller) == previous:
+                continue
+            previous = (callee, caller)
+            counts[callee + 1] += 1
+            self.caller_nodes.append(caller)
+            self.call_lines.append(line)
+        for node in range(len(self.qualnames)):
+            counts[node + 1] += counts[node]
+        self.caller_offsets = array('l', counts)
+
+    @staticmethod
+    def _enclosing_function(symbols: SymbolTable, symbol_nodes: List[int], scope: int) -> int:
+        """Node of the innermost function around a call site (-1 at module or class level)"""
+        while scope >= 0 and symbol_nodes[scope] < 0:
+            scope = symbols.parents[scope]
+        return symbol_nodes[scope] if scope >= 0 else -1
+
+    @staticmethod
+    def _resolve(symbols: SymbolTable, symbol_nodes: List[int], scope: int, name: str, on_self: bool,
+                 by_name: Dict[str, List[int]], class_inits: Dict[str, List[int]]) -> List[int]:
+        """Nodes a called name may refer to"""
+        if on_self:
+            # Method of the caller's own class, if it defines one with that name
+            owner = scope
+            while owner >= 0 and symbols.kinds[owner] != CLASS:
+                owner = symbols.parents[owner]
+            if owner >= 0:
+                methods = symbols.indexes(f"{symbols.qualnames[owner]}.{name}", kind=FUNCTION)
+                if methods:
+                    return [symbol_nodes[methods[0]]]
+        targets = class_inits.get(name) or by_name.get(name, [])
+        return targets if len(targets) <= MAX_NAME_TARGETS else []
+
@@ -0,0 +1,321 @@
+"""
+Code Index - Persistent per-file line offsets and symbol tables for a codebase
+"""
+import hashlib
+import os
+import pickle
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .source_file import SourceFile
+from .symbol_table import SymbolTable
+
+_INDEX_VERSION = 2
+
+# Fewer files than this are parsed in-process (starting worker processes costs more)
+MIN_PARALLEL_PARSE_FILES = 200
+
+# progress(stage, done, total) with stage 'scan', 'read' or 'parse'
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class IndexedFile:
+    """
+    What the index keeps for one file, and the stat/hash it was built from
+
+    Line offsets and the symbol table are stored as bytes and only decoded
+    when the file is actually used, so loading the index stays cheap.
+    """
+
+    __slots__ = ('path', 'mtime_ns', 'size', 'sha1', 'offsets_blob', 'symbols_blob',
+                 '_line_offsets', '_symbols')
+
+    def __init__(self, path: str, mtime_ns: int, size: int, sha1: bytes,
+                 offsets_blob: bytes, symbols_blob: bytes):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha1 = sha1
+        self.offsets_blob = offsets_blob
+        self.symbols_blob = symbols_blob
+        self._line_offsets = None
+        self._symbols = None
+
+    @classmethod
+    def build(cls, path: str, mtime_ns: int, size: int, data: bytes) -> 'IndexedFile':
+        """Index a file from its raw bytes"""
+        return cls(path, mtime_ns, size, hashlib.sha1(data).digest(), *_index_blobs(data))
+
+    @property
+    def line_offsets(self) -> array:
+        if self._line_offsets is None:
+            offsets = array('q')
+            offsets.frombytes(self.offsets_blob)
+            self._line_offsets = offsets
+        return self._line_offsets
+
+    @property
+    def symbols(self) -> SymbolTable:
+        if self._symbols is None:
+            self._symbols = pickle.loads(self.symbols_blob)
+        return self._symbols
+
+
+class CodeIndex:
+    """
+    File list, line offsets and symbol tables of every .py file under a directory
+
+    refresh() stats every file and only reads the ones whose mtime or size
+    changed; of those, only files whose content hash changed are parsed
+    again. refresh(quick=True) only stats directories and rescans the ones
+    whose mtime changed, which catches added, deleted and renamed-into-place
+    files. The index is pickled to a cache file between runs.
+    """
+
+    def __init__(self, root_dir: str, index_file: Optional[str] = None,
+                 io_workers: int = 8, parse_workers: Optional[int] = None):
+        """
+        Args:
+            root_dir: Directory to index
+            index_file: Cache file to load from and save to (None keeps it in memory)
+            io_workers: Threads listing directories and reading files
+            parse_workers: Processes parsing changed files (defaults to the CPU count; 1 parses in-process)
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.index_file = index_file
+        self.io_workers = max(1, io_workers)
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        # absolute path -> IndexedFile
+        self.files: Dict[str, IndexedFile] = self._load()
+        # directory -> mtime when it was last listed (filled by the first refresh)
+        self._dir_mtimes: Dict[str, int] = {}
+        # Counts and changed paths from the last refresh
+        self.stats = {}
+        self.changes = {'added': [], 'modified': [], 'removed': []}
+
+    def refresh(self, quick: bool = False, progress: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Bring the index up to date with the files on disk and save it if anything changed
+
+        Directories are listed and files read by a thread pool (the work is
+        I/O-latency bound, e.g. on network volumes); changed files are parsed
+        by a process pool.
+
+        Args:
+            quick: Only rescan directories whose mtime changed (misses files
+                rewritten in place; run a full refresh now and then)
+            progress: Called as progress(stage, done, total) while indexing
+
+        Returns:
+            Counts of unchanged, rehashed (touched but identical), parsed and removed files
+        """
+        stats = {'unchanged': 0, 'rehashed': 0, 'parsed': 0, 'removed': 0}
+        changes = {'added': [], 'modified': [], 'removed': []}
+        previous = self.files
+
+        if quick and self._dir_mtimes:
+            current = dict(previous)
+            rescanned = self._changed_directories()
+            # Files directly in a rescanned directory are re-listed below
+            for path in previous:
+                if os.path.dirname(path) in rescanned:
+                    del current[path]
+            listing = self._walk(rescanned, progress)
+        else:
+            current = {}
+            self._dir_mtimes = {}
+            listing = self._walk([self.root_dir], progress)
+
+        stale = []
+        for path, stat in listing:
+            entry = previous.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                current[path] = entry
+                stats['unchanged'] += 1
+            else:
+                stale.append((path, stat, entry))
+
+        to_parse = []
+        for (path, stat, entry), data in zip(stale, self._read_files([path for path, _, _ in stale], progress)):
+            if data is None:
+                continue
+            sha1 = hashlib.sha1(data).digest()
+            if entry is not None and entry.size == len(data) and entry.sha1 == sha1:
+                entry.mtime_ns = stat.st_mtime_ns
+                current[path] = entry
+                stats['rehashed'] += 1
+            else:
+                to_parse.append((path, stat.st_mtime_ns, len(data), sha1, data, entry))
+
+        for (path, mtime_ns, size, sha1, _, entry), blobs in zip(
+                to_parse, self._parse_files([item[4] for item in to_parse], progress)):
+            current[path] = IndexedFile(path, mtime_ns, size, sha1, *blobs)
+            stats['parsed'] += 1
+            changes['modified' if entry is not None else 'added'].append(path)
+
+        changes['removed'] = [path for path in previous if path not in current]
+        stats['removed'] = len(changes['removed'])
+        self.files = current
+        self.stats = stats
+        self.changes = changes
+        if stats['rehashed'] or stats['parsed'] or stats['removed']:
+            self._save()
+        return stats
+
+    def get(self, path: str) -> Optional[IndexedFile]:
+        return self.files.get(os.path.abspath(path))
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def _changed_directories(self) -> Set[str]:
+        """Known directories whose mtime changed or that disappeared (forgotten here)"""
+        changed = set()
+        for directory, mtime_ns in list(self._dir_mtimes.items()):
+            try:
+                if os.stat(directory).st_mtime_ns == mtime_ns:
+                    continue
+            except OSError:
+                # Gone: forget it and everything below it
+                prefix = os.path.join(directory, '')
+                for known in list(self._dir_mtimes):
+                    if known == directory or known.startswith(prefix):
+                        del self._dir_mtimes[known]
+                        changed.add(known)
+                continue
+            changed.add(directory)
+        return changed
+
+    def _walk(self, directories: Iterable[str],
+              progress: Optional[ProgressCallback] = None) -> List[Tuple[str, os.stat_result]]:
+        """
+        (path, stat) for the .py files in the given directories, listed concurrently
+
+        Subdirectories are walked too unless they were already listed (a
+        quick refresh only descends into new directories).
+        """
+        files = []
+        listed = 0
+        with ThreadPoolExecutor(max_workers=self.io_workers) as pool:
+            pending = {pool.submit(self._list_directory, directory) for directory in directories}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory_files, subdirectories = future.result()
+                    files.extend(directory_files)
+                    for subdirectory in subdirectories:
+                        if subdirectory not in self._dir_mtimes:
+                            # Claimed here (in the calling thread) so no directory is listed twice
+                            self._dir_mtimes[subdirectory] = 0
+                            pending.add(pool.submit(self._list_directory, subdirectory))
+                    listed += 1
+                if progress:
+                    progress('scan', listed, listed + len(pending))
+        return files
+
+    def _list_directory(self, directory: str) -> Tuple[List[Tuple[str, os.stat_result]], List[str]]:
+        """The .py files (with their stats) and subdirectories of one directory"""
+        files, subdirectories = [], []
+        try:
+            # Taken before listing, so a change during the listing is seen next time
+            self._dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory))
+        except OSError:
+            self._dir_mtimes.pop(directory, None)
+            return files, subdirectories
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.endswith('.py') and entry.is_file():
+                    files.append((entry.path, entry.stat()))
+            except OSError:
+                continue
+        return files, subdirectories
+
+    def _read_files(self, paths: List[str], progress: Optional[ProgressCallback] = None) -> List[Optional[bytes]]:
+        """Read files concurrently (None for files that could not be read)"""
+        if not paths:
+            return []
+        results = []
+        with ThreadPoolExecutor(max_workers=self.io_workers) as pool:
+            for data in pool.map(_read_file, paths):
+                results.append(data)
+                if progress and (len(results) % 100 == 0 or len(results) == len(paths)):
+                    progress('read', len(results), len(paths))
+        return results
+
+    def _parse_files(self, datas: List[bytes], progress: Optional[ProgressCallback] = None) -> List[Tuple[bytes, bytes]]:
+        """Build line offsets and symbol tables, in worker processes for large batches"""
+        if not datas:
+            return []
+        results = []
+        if self.parse_workers > 1 and len(datas) >= MIN_PARALLEL_PARSE_FILES:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+                blobs = pool.map(_index_blobs, datas, chunksize=64)
+                for item in blobs:
+                    results.append(item)
+                    if progress and (len(results) % 100 == 0 or len(results) == len(datas)):
+                        progress('parse', len(results), len(datas))
+            return results
+
+        for data in datas:
+            results.append(_index_blobs(data))
+            if progress and (len(results) % 100 == 0 or len(results) == len(datas)):
+                progress('parse', len(results), len(datas))
+        return results
+
+    def _load(self) -> Dict[str, IndexedFile]:
+        """Load the cached index, starting fresh if it is missing, unreadable or for another root"""
+        if not self.index_file:
+            return {}
+        try:
+            with open(self.index_file, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != _INDEX_VERSION or data.get('root_dir') != self.root_dir:
+                return {}
+            sha1s = data['sha1s']
+            return {path: IndexedFile(path, mtime_ns, size, sha1s[i * 20:(i + 1) * 20], offsets, symbols)
+                    for i, (path, mtime_ns, size, offsets, symbols) in enumerate(zip(
+                        data['paths'], data['mtimes'], data['sizes'], data['offsets'], data['symbols']))}
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError, ValueError):
+            return {}
+
+    def _save(self):
+        """Write the index atomically so a crash never leaves a torn file"""
+        if not self.index_file:
+            return
+        directory = os.path.dirname(self.index_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Stored by column: a few large objects pickle and load much faster than many small ones
+        entries = list(self.files.values())
+        data = {
+            'version': _INDEX_VERSION,
+            'root_dir': self.root_dir,
+            'paths': [entry.path for entry in entries],
+            'mtimes': array('q', [entry.mtime_ns for entry in entries]),
+            'sizes': array('q', [entry.size for entry in entries]),
+            'sha1s': b''.join(entry.sha1 for entry in entries),
+            'offsets': [entry.offsets_blob for entry in entries],
+            'symbols': [entry.symbols_blob for entry in entries]
+        }
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_file)
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _index_blobs(data: bytes) -> Tuple[bytes, bytes]:
+    """Line offsets and pickled symbol table of a file's bytes (runs in worker processes)"""
+    source = SourceFile('', SourceFile.decode(data))
+    return source.line_offsets.tobytes(), pickle.dumps(source.symbols, protocol=pickle.HIGHEST_PROTOCOL)
@@ -1,73 +1,432 @@
 """
 Code Mapper - Maps error logs and stack traces to actual code
 """
+import hashlib
 import os
 import re
-from typing import Dict, List, Optional
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Union
 from pathlib import Path
 
+from .log_parser import LogRecord, iter_records, parse_log
+from .call_graph import CallGraph
+from .code_index import CodeIndex
+from .code_search import CodeSearchIndex, record_query
+from .log_reader import MappedLogReader
+from .path_resolver import PathResolver, is_library_path
+from .source_file import SourceFile
+from .symbol_table import CLASS, FUNCTION
+
+# Example: File "/app/dummy_data/codebase/database_manager.py", line 91, in execute_transaction
+FRAME_PATTERN = re.compile(r'File "([^"]+)", line (\d+)(?:, in (.+))?')
+ERROR_MESSAGE_PATTERN = re.compile(r'(Exception|Error): (.+?)(?:\n|$)')
+TRACEBACK_HEADER = 'Traceback (most recent call last)'
+
+# Most distinct frames given code context (and so sent to the LLM) per mapping
+MAX_CONTEXT_FRAMES = 20
+
+# Caller snippets attached by map_error_to_code (other functions reaching the failing code), and how far up to look
+MAX_CALLER_SNIPPETS = 3
+CALLER_DEPTH = 2
+CALLER_CONTEXT_LINES = 3
+
+# Functions retrieved by code search when a log has no stack trace
+MAX_RETRIEVED_FUNCTIONS = 5
+
+# Frame origins: a file of this codebase, or anything else (stdlib, site-packages)
+PROJECT = 'project'
+LIBRARY = 'library'
+
 
 class CodeMapper:
     """Maps errors from logs to specific code locations"""
     
-    def __init__(self, codebase_dir: str):
+    def __init__(self, codebase_dir: str, lazy: bool = True, max_cached_files: int = 256,
+                 max_cached_snippets: int = 1024, index_file: Optional[str] = None, io_workers: int = 8,
+                 parse_workers: Optional[int] = None,
+                 progress: Optional[Callable[[str, int, int], None]] = None):
+        """
+        Args:
+            codebase_dir: Directory holding the source files
+            lazy: Only list the files up front and read each one on first use;
+                otherwise read every file now and never evict
+            max_cached_files: Most files kept in memory in lazy mode (least
+                recently used files are dropped first)
+            max_cached_snippets: Most code contexts kept by get_code_context
+            index_file: Persistent code index cache; with it, line offsets and
+                symbol tables are only rebuilt for files that changed since the
+                previous run
+            io_workers: Threads listing and reading files while indexing
+            parse_workers: Processes parsing files while indexing (defaults to the CPU count)
+            progress: Called as progress(stage, done, total) while the index is built
+        """
         self.codebase_dir = codebase_dir
-        self.file_cache = {}
-        self._load_codebase()
+        self.lazy = lazy
+        self.max_cached_files = max_cached_files if lazy else None
+        self.code_index = None
+        # relative path -> absolute path, for every file in the codebase
+        self.file_paths = {}
+        # relative path -> SourceFile, most recently used last
+        self.file_cache = OrderedDict()
+        # (file, line, context_lines, file version) -> code context, most recently used last
+        self.snippet_cache = OrderedDict()
+        self.max_cached_snippets = max_cached_snippets
+        self.snippet_stats = {'hits': 0, 'misses': 0}
+        # Built on first use, rebuilt when version moves on
+        self._call_graph = None
+        self._call_graph_version = -1
+        # Kept current file by file on first use after each version change
+        self._code_search = CodeSearchIndex()
+        self._code_search_version = -1
+        self._search_lock = threading.Lock()
+        # Bumped whenever a file is reindexed (per file and overall)
+        self.file_versions = {}
+        self.version = 0
+        # Guards the caches, file_paths and the version counters during refreshes
+        self._lock = threading.RLock()
+        self._index_workers = {'io_workers': io_workers, 'parse_workers': parse_workers}
+        self._load_codebase(index_file, progress)
+        # Maps traceback paths from any deploy layout onto file_paths keys
+        self.path_resolver = PathResolver(self.file_paths, root=self._codebase_root())
     
-    def _load_codebase(self):
-        """Load all Python files from the codebase into memory"""
+    def _load_codebase(self, index_file: Optional[str] = None,
+                       progress: Optional[Callable[[str, int, int], None]] = None):
+        """List the Python files in the codebase (and read them all if not lazy)"""
         codebase_path = Path(self.codebase_dir)
         
         if not codebase_path.exists():
             return
         
-        for file_path in codebase_path.glob("**/*.py"):
-            with open(file_path, 'r') as f:
+        if index_file:
+            self.code_index = CodeIndex(self.codebase_dir, index_file, **self._index_workers)
+            self.code_index.refresh(progress=progress)
+            for absolute_path in sorted(self.code_index.files):
+                self.file_paths[self._relative_path(absolute_path)] = absolute_path
+        else:
+            for file_path in codebase_path.glob("**/*.py"):
                 # Store with path relative to project root (includes dummy_data/codebase/)
                 relative_path = str(file_path.relative_to(codebase_path.parent.parent))
-                self.file_cache[relative_path] = {
-                    'content': f.read(),
-                    'lines': open(file_path, 'r').readlines()
-                }
+                self.file_paths[relative_path] = str(file_path)
+        
+        if not self.lazy:
+            for relative_path in self.file_paths:
+                self._get_source(relative_path)
+    
+    def _relative_path(self, absolute_path: str) -> str:
+        """Codebase file key: path relative to the project root (includes dummy_data/codebase/)"""
+        root_prefix = os.path.join(os.path.abspath(Path(self.codebase_dir).parent.parent), '')
+        if absolute_path.startswith(root_prefix):
+            return absolute_path[len(root_prefix):]
+        return os.path.relpath(absolute_path, root_prefix)
+    
+    def _codebase_root(self) -> str:
+        """Prefix the codebase directory adds to file keys (dummy_data/codebase)"""
+        return self._relative_path(os.path.abspath(self.codebase_dir))
+    
+    def _get_source(self, file_path: str) -> Optional[SourceFile]:
+        """Get a codebase file, reading it on first use"""
+        with self._lock:
+            source = self.file_cache.get(file_path)
+            if source is not None:
+                self.file_cache.move_to_end(file_path)
+                return source
+            absolute_path = self.file_paths.get(file_path)
+            version = self.file_versions.get(file_path, 0)
+        
+        if absolute_path is None:
+            return None
+        try:
+            source = self._read_source(absolute_path)
+        except OSError:
+            return None
+        
+        with self._lock:
+            if self.file_versions.get(file_path, 0) != version:
+                # Reindexed while we were reading: don't cache what may be the old content
+                return source
+            self.file_cache[file_path] = source
+            if self.max_cached_files is not None:
+                while len(self.file_cache) > self.max_cached_files:
+                    self.file_cache.popitem(last=False)
+        return source
+    
+    def _read_source(self, absolute_path: str) -> SourceFile:
+        """Read a file, reusing its indexed line offsets and symbols if it is unchanged"""
+        indexed = self.code_index.get(absolute_path) if self.code_index else None
+        if indexed is None:
+            return SourceFile.load(absolute_path)
+        
+        with open(absolute_path, 'rb') as f:
+            data = f.read()
+        if len(data) != indexed.size or hashlib.sha1(data).digest() != indexed.sha1:
+            # Changed since the index was refreshed
+            return SourceFile(absolute_path, SourceFile.decode(data))
+        return SourceFile(absolute_path, SourceFile.decode(data), indexed.line_offsets, indexed.symbols)
+    
+    def refresh_codebase(self, quick: bool = False) -> Dict:
+        """
+        Reindex added, changed and deleted files and swap them in
+        
+        Only the changed files are parsed. Each SourceFile is immutable, so a
+        caller that already holds one keeps a consistent (old) view; the next
+        lookup gets the new content. Without an index file, the first call
+        builds an in-memory index of the whole codebase.
+        
+        Args:
+            quick: Only rescan directories whose mtime changed (see CodeIndex.refresh)
+            
+        Returns:
+            Dict with added, modified and removed relative paths
+        """
+        if self.code_index is None:
+            self.code_index = CodeIndex(self.codebase_dir, **self._index_workers)
+            self.code_index.refresh()
+            with self._lock:
+                self.file_paths = {self._relative_path(path): path for path in sorted(self.code_index.files)}
+                self.path_resolver = PathResolver(self.file_paths, root=self._codebase_root())
+                self.file_cache.clear()
+                self.snippet_cache.clear()
+                self.version += 1
+            return {'added': [], 'modified': [], 'removed': []}
+        
+        self.code_index.refresh(quick=quick)
+        changes = {kind: [self._relative_path(path) for path in paths]
+                   for kind, paths in self.code_index.changes.items()}
+        if not any(changes.values()):
+            return changes
+        
+        with self._lock:
+            file_paths = dict(self.file_paths)
+            for relative_path in changes['removed']:
+                file_paths.pop(relative_path, None)
+            for relative_path, absolute_path in zip(changes['added'], self.code_index.changes['added']):
+                file_paths[relative_path] = absolute_path
+            # Swap the whole mapping at once so lookups never see it half-updated
+            self.file_paths = file_paths
+            for relative_path in changes['removed']:
+                self.path_resolver.remove(relative_path)
+            for relative_path in changes['added']:
+                self.path_resolver.add(relative_path)
+            
+            changed = set(changes['added'] + changes['modified'] + changes['removed'])
+            for relative_path in changed:
+                self.file_cache.pop(relative_path, None)
+                self.file_versions[relative_path] = self.file_versions.get(relative_path, 0) + 1
+            # Snippets of older versions can no longer be hit; free their slots
+            for key in [key for key in self.snippet_cache if key[0] in changed]:
+                del self.snippet_cache[key]
+            self.version += 1
+        return changes
+    
+    def _get_symbols(self, file_path: str):
+        """Symbol table of a codebase file, from the index when possible (no file read)"""
+        absolute_path = self.file_paths.get(file_path)
+        if absolute_path is None:
+            return None
+        indexed = self.code_index.get(absolute_path) if self.code_index else None
+        if indexed is not None:
+            return indexed.symbols
+        source = self._get_source(file_path)
+        return source.symbols if source is not None else None
     
-    def extract_stack_trace(self, log_content: str) -> List[Dict]:
+    def extract_stack_trace(self, log_content: Union[str, MappedLogReader, Iterable[str]]) -> List[Dict]:
         """
         Extract stack trace information from log content
         
+        Args:
+            log_content: Log text, a MappedLogReader (only records that
+                contain a traceback are decoded), or an iterable of lines
+                such as a RotatedLogSet
+        
         Returns:
             List of dicts with file, line, and function information
         """
-        stack_trace = []
+        return self.extract_stack_trace_from_records(self._parse_log_source(log_content))
+    
+    def extract_stack_trace_from_records(self, records: Iterable[LogRecord]) -> List[Dict]:
+        """
+        Extract stack frames from parsed log records
         
-        # Pattern to match Python stack trace lines
-        # Example: File "/app/dummy_data/codebase/database_manager.py", line 91, in execute_transaction
-        pattern = r'File "([^"]+)", line (\d+)(?:, in (.+))?'
+        Each frame also records which log entry ('file.py:NN' or component)
+        and timestamp the traceback was attached to, and is labelled as in
+        extract_tracebacks_from_records.
         
-        matches = re.finditer(pattern, log_content)
+        Returns:
+            List of dicts with file, line, and function information
+        """
+        return [frame for traceback in self.extract_tracebacks_from_records(records)
+                for frame in traceback['frames']]
+    
+    def extract_tracebacks(self, log_content: Union[str, MappedLogReader, Iterable[str]]) -> List[Dict]:
+        """
+        Split log content into separate tracebacks
         
-        for match in matches:
-            file_path = match.group(1)
-            line_num = int(match.group(2))
-            function_name = match.group(3) if match.group(3) else None
-            
-            # Normalize path
-            normalized_path = self._normalize_path(file_path)
-            
-            stack_trace.append({
-                'file': normalized_path,
-                'line': line_num,
-                'function': function_name,
-                'original_path': file_path
-            })
+        Args:
+            log_content: Same as for extract_stack_trace
         
-        return stack_trace
+        Returns:
+            List of tracebacks, see extract_tracebacks_from_records
+        """
+        return self.extract_tracebacks_from_records(self._parse_log_source(log_content))
+    
+    def extract_tracebacks_from_records(self, records: Iterable[LogRecord]) -> List[Dict]:
+        """
+        Split parsed log records into separate tracebacks
+        
+        A traceback starts at each 'Traceback (most recent call last)' line
+        (chained exceptions give one traceback each) and ends at its
+        exception line. Frames are labelled with their origin (PROJECT for
+        files of this codebase, LIBRARY for anything else) and their depth
+        (0 for the frame that raised, counting outwards).
+        
+        Returns:
+            List of dicts with the traceback's frames, exception line, and
+            the log entry and timestamp it was attached to
+        """
+        tracebacks = []
+        # Repeated tracebacks share frames: look each distinct one up once
+        frame_info = {}
+        
+        for record in records:
+            current = None
+            for line in record.lines:
+                if line.startswith(TRACEBACK_HEADER):
+                    current = None
+                    continue
+                match = FRAME_PATTERN.search(line)
+                if not match:
+                    if current is not None and line[:1] not in ('', ' ', '\t'):
+                        # Unindented line after the frames: the exception
+                        current['exception'] = line.strip()
+                        current = None
+                    continue
+                
+                if current is None:
+                    current = {'frames': [], 'exception': None,
+                               'log_source': record.source, 'log_timestamp': record.timestamp}
+                    tracebacks.append(current)
+                
+                file_path = match.group(1)
+                line_num = int(match.group(2))
+                function_name = match.group(3) if match.group(3) else None
+                
+                frame_key = (file_path, line_num, function_name)
+                if frame_key not in frame_info:
+                    frame_info[frame_key] = self._describe_frame(file_path, line_num, function_name)
+                normalized_path, origin, symbol = frame_info[frame_key]
+                
+                current['frames'].append({
+                    'file': normalized_path,
+                    'line': line_num,
+                    # Label the frame from the code itself, even if the traceback has no ", in func"
+                    'function': function_name or (symbol['name'] if symbol else None),
+                    'qualname': symbol['qualname'] if symbol else None,
+                    'original_path': file_path,
+                    'origin': origin,
+                    'log_source': record.source,
+                    'log_timestamp': record.timestamp
+                })
+        
+        for index, traceback in enumerate(tracebacks):
+            frames = traceback['frames']
+            for depth, frame in enumerate(reversed(frames)):
+                frame['depth'] = depth
+                frame['traceback'] = index
+        return tracebacks
+    
+    def _describe_frame(self, file_path: str, line_num: int, function_name: Optional[str]):
+        """
+        Codebase path, origin and symbol of a traceback frame
+        
+        Frames under site-packages, dist-packages or lib/pythonX.Y are library
+        frames whatever their file name; others are project frames if they
+        resolve to a codebase file.
+        """
+        resolved = None if is_library_path(file_path) else self._resolve_path(file_path)
+        if resolved is None:
+            return self._normalize_path(file_path), LIBRARY, None
+        return resolved, PROJECT, self._frame_symbol(resolved, line_num, function_name)
+    
+    @staticmethod
+    def rank_frames(stack_trace: List[Dict]) -> List[Dict]:
+        """
+        Distinct frames, most likely root cause first
+        
+        Project frames come first, ordered by how many project frames lie
+        between them and the exception (the innermost project frame is where
+        our code failed, even if the exception was raised inside a library),
+        then by most recent traceback, then by how often they occur. Library
+        frames follow.
+        
+        Args:
+            stack_trace: Frames from extract_stack_trace
+        
+        Returns:
+            One dict per distinct (file, line, function) with 'rank' (from 0)
+            and 'occurrences' added
+        """
+        distinct = {}
+        # key -> (origin order, depth, -traceback) of the frame's closest occurrence to an exception
+        closest = {}
+        for traceback_frames in _group_by_traceback(stack_trace):
+            project_depth = 0
+            for depth, frame in enumerate(reversed(traceback_frames)):
+                key = (frame['file'], frame['line'], frame['function'])
+                if key not in distinct:
+                    distinct[key] = dict(frame, occurrences=0)
+                distinct[key]['occurrences'] += 1
+                if frame.get('origin', PROJECT) == PROJECT:
+                    position = (0, project_depth, -frame.get('traceback', 0))
+                    project_depth += 1
+                else:
+                    position = (1, depth, -frame.get('traceback', 0))
+                closest[key] = min(closest.get(key, position), position)
+        
+        def sort_key(item):
+            key, frame = item
+            return closest[key] + (-frame['occurrences'],)
+        
+        ranked = [frame for _, frame in sorted(distinct.items(), key=sort_key)]
+        for rank, frame in enumerate(ranked):
+            frame['rank'] = rank
+        return ranked
+    
+    def _frame_symbol(self, file_path: str, line_num: int, function_name: Optional[str]) -> Optional[Dict]:
+        """
+        Symbol a traceback frame points into
+        
+        The definition enclosing the line wins if it agrees with the frame's
+        function name; if the names disagree (the code changed since the log
+        was written), the definition with that name nearest the line is used.
+        """
+        enclosing = self.find_enclosing_symbol(file_path, line_num)
+        if not function_name or (enclosing and enclosing['name'] == function_name):
+            return enclosing
+        
+        symbols = self._get_symbols(file_path)
+        candidates = symbols.find(function_name, kind=FUNCTION) if symbols is not None else []
+        if not candidates:
+            return enclosing
+        return min(candidates, key=lambda symbol: 0 if symbol['start_line'] <= line_num <= symbol['end_line']
+                   else min(abs(symbol['start_line'] - line_num), abs(symbol['end_line'] - line_num)))
+    
+    def _resolve_path(self, path: str) -> Optional[str]:
+        """
+        Codebase file a traceback path refers to, or None if it is not ours
+        
+        Matched by longest common path suffix, so frames from any container
+        layout, virtualenv or build directory find their file.
+        """
+        with self._lock:
+            return self.path_resolver.resolve(path)
     
     def _normalize_path(self, path: str) -> str:
-        """Normalize file path to match our codebase structure"""
-        # Remove /app/ prefix if present
-        path = path.replace('/app/', '')
-        return path
+        """Normalize file path to match our codebase structure (library paths only lose a leading /app/)"""
+        resolved = self._resolve_path(path)
+        if resolved is not None:
+            return resolved
+        return path[len('/app/'):] if path.startswith('/app/') else path
     
     def get_code_context(self, file_path: str, line_num: int, 
                         context_lines: int = 5) -> Optional[Dict]:
@@ -80,13 +439,23 @@ class CodeMapper:
             context_lines: Number of lines before and after to include
             
         Returns:
-            Dict with code snippet and metadata
+            Dict with code snippet and metadata (cached per file version, so
+            treat the snippet as read-only)
         """
-        if file_path not in self.file_cache:
+        with self._lock:
+            key = (file_path, line_num, context_lines, self.file_versions.get(file_path, 0))
+            cached = self.snippet_cache.get(key)
+            if cached is not None:
+                self.snippet_cache.move_to_end(key)
+                self.snippet_stats['hits'] += 1
+                return dict(cached)
+            self.snippet_stats['misses'] += 1
+        
+        source = self._get_source(file_path)
+        if source is None:
             return None
         
-        lines = self.file_cache[file_path]['lines']
-        total_lines = len(lines)
+        total_lines = source.line_count
         
         # Calculate range (convert to 0-indexed)
         start = max(0, line_num - context_lines - 1)
@@ -94,8 +463,8 @@ class CodeMapper:
         
         # Get the code snippet
         snippet_lines = []
-        for i in range(start, end):
-            line_text = lines[i].rstrip()
+        for i, line in enumerate(source.lines(start, end), start):
+            line_text = line.rstrip()
             is_error_line = (i == line_num - 1)
             snippet_lines.append({
                 'line_num': i + 1,
@@ -103,80 +472,346 @@ class CodeMapper:
                 'is_error': is_error_line
             })
         
-        return {
+        context = {
             'file': file_path,
             'error_line': line_num,
             'snippet': snippet_lines,
             'start_line': start + 1,
             'end_line': end
         }
+        
+        with self._lock:
+            self.snippet_cache[key] = context
+            while len(self.snippet_cache) > self.max_cached_snippets:
+                self.snippet_cache.popitem(last=False)
+        return dict(context)
     
     def find_function_definition(self, file_path: str, function_name: str) -> Optional[Dict]:
-        """Find the definition of a function in a file"""
-        if file_path not in self.file_cache:
+        """
+        Find the definition of a function in a file
+        
+        Args:
+            file_path: Codebase-relative path
+            function_name: Plain name ('execute_transaction', first match in the
+                file) or qualified name ('DatabaseManager.execute_transaction')
+        """
+        source = self._get_source(file_path)
+        if source is None:
             return None
         
-        lines = self.file_cache[file_path]['lines']
+        matches = source.symbols.find(function_name, kind=FUNCTION)
+        if not matches:
+            return None
+        
+        symbol = matches[0]
+        return {
+            'file': file_path,
+            'function': symbol['name'],
+            'qualname': symbol['qualname'],
+            'line': symbol['start_line'],
+            'end_line': symbol['end_line'],
+            'definition': source.line(symbol['start_line']).strip()
+        }
+    
+    def find_enclosing_symbol(self, file_path: str, line_num: int) -> Optional[Dict]:
+        """
+        Find the innermost function (or, outside functions, class) containing a line
+        
+        Returns:
+            Symbol dict with name, qualname, kind, start_line and end_line
+        """
+        symbols = self._get_symbols(file_path)
+        if symbols is None:
+            return None
+        return symbols.enclosing(line_num, kind=FUNCTION) or symbols.enclosing(line_num, kind=CLASS)
+    
+    def get_call_graph(self) -> CallGraph:
+        """
+        Call graph of the codebase, built from the (indexed) symbol tables on
+        first use and rebuilt after refresh_codebase() swaps in changes
+        
+        With an index file, the graph is saved beside it and reused while the
+        codebase's content hashes match.
+        """
+        with self._lock:
+            if self._call_graph is not None and self._call_graph_version == self.version:
+                return self._call_graph
+            version = self.version
+            file_paths = sorted(self.file_paths)
+        
+        graph_file = fingerprint = None
+        if self.code_index is not None and self.code_index.index_file:
+            graph_file = f"{os.path.splitext(self.code_index.index_file)[0]}.callgraph.pkl"
+            fingerprint = self._codebase_fingerprint(file_paths)
+            call_graph = CallGraph.load(graph_file, fingerprint)
+        else:
+            call_graph = None
+        
+        if call_graph is None:
+            files = []
+            for file_path in file_paths:
+                symbols = self._get_symbols(file_path)
+                if symbols is not None:
+                    files.append((file_path, symbols))
+            call_graph = CallGraph(files)
+            if graph_file:
+                try:
+                    call_graph.save(graph_file, fingerprint)
+                except OSError:
+                    pass
+        
+        with self._lock:
+            if self.version == version:
+                self._call_graph = call_graph
+                self._call_graph_version = version
+        return call_graph
+    
+    def _codebase_fingerprint(self, file_paths: List[str]) -> str:
+        """Hash of every file's path and indexed content hash"""
+        digest = hashlib.sha1()
+        for file_path in file_paths:
+            indexed = self.code_index.get(self.file_paths.get(file_path, ''))
+            digest.update(file_path.encode('utf-8', errors='replace'))
+            digest.update(indexed.sha1 if indexed is not None else b'\0' * 20)
+        return digest.hexdigest()
+    
+    def find_callers(self, file_path: str, qualname: str, depth: int = CALLER_DEPTH) -> List[Dict]:
+        """
+        Functions that can reach a function within depth calls (its blast radius)
+        
+        Args:
+            file_path: Codebase file of the function
+            qualname: Qualified name ('DatabaseManager.execute_transaction')
+            depth: Most call levels to walk up
+            
+        Returns:
+            Caller dicts nearest first (see CallGraph.callers)
+        """
+        return self.get_call_graph().callers(file_path, qualname, depth)
+    
+    def search_code(self, records: Iterable[LogRecord], top_k: int = MAX_RETRIEVED_FUNCTIONS) -> List[Dict]:
+        """
+        Functions a log window most likely came from, by BM25 over function chunks
+        
+        The query is the window's warning and error messages; functions at
+        the [file.py:NN] locations of those lines rank first. The index is
+        built on first use and afterwards only re-chunks files that changed.
+        
+        Args:
+            records: Parsed log records
+            top_k: Most functions to return
+            
+        Returns:
+            Dicts with file, qualname, start_line, end_line, score and the
+            line to show ('line': the logged location inside the function, or its start)
+        """
+        terms, log_locations = record_query(records)
+        locations = []
+        for source_file, line in log_locations:
+            resolved = self._resolve_path(source_file)
+            if resolved is not None:
+                locations.append((resolved, line))
         
-        # Pattern to match function definitions
-        pattern = rf'^\s*def {re.escape(function_name)}\s*\('
+        with self._search_lock:
+            self._update_code_search()
+            results = self._code_search.search(terms, top_k, self._code_search.location_boosts(locations))
         
-        for i, line in enumerate(lines):
-            if re.match(pattern, line):
-                return {
-                    'file': file_path,
-                    'function': function_name,
-                    'line': i + 1,
-                    'definition': line.strip()
-                }
+        for result in results:
+            logged = [line for file_path, line in locations
+                      if file_path == result['file'] and result['start_line'] <= line <= result['end_line']]
+            result['line'] = logged[0] if logged else result['start_line']
+        return results
+    
+    def _update_code_search(self):
+        """Re-chunk added and changed files and drop removed ones (call with _search_lock held)"""
+        with self._lock:
+            if self._code_search_version == self.version:
+                return
+            version = self.version
+            file_paths = dict(self.file_paths)
+            file_versions = {file_path: self.file_versions.get(file_path, 0) for file_path in file_paths}
         
-        return None
+        search = self._code_search
+        for file_path in [file_path for file_path in search.files if file_path not in file_paths]:
+            search.remove_file(file_path)
+        for file_path, absolute_path in file_paths.items():
+            if search.version(file_path) == file_versions[file_path]:
+                continue
+            try:
+                # Not through _get_source: a full build would churn the file cache
+                source = self._read_source(absolute_path)
+            except OSError:
+                search.remove_file(file_path)
+                continue
+            search.add_file(file_path, source, file_versions[file_path])
+        self._code_search_version = version
     
-    def map_error_to_code(self, log_content: str) -> Dict:
+    def map_error_to_code(self, log_content: Union[str, MappedLogReader, Iterable[str]],
+                          max_frames: int = MAX_CONTEXT_FRAMES,
+                          max_caller_snippets: int = MAX_CALLER_SNIPPETS) -> Dict:
         """
         Map error log to code locations with context
         
+        Args:
+            log_content: Log text, a MappedLogReader (only records that
+                contain a traceback are decoded), or an iterable of lines
+                such as a RotatedLogSet
+            max_frames: Most distinct frames to get code context for
+            max_caller_snippets: Most snippets of callers of the root cause to attach
+        
         Returns:
             Dict with error analysis and code mappings
         """
+        return self.map_records_to_code(self._parse_log_source(log_content), max_frames, max_caller_snippets)
+    
+    @staticmethod
+    def _parse_log_source(log_content: Union[str, MappedLogReader, Iterable[str]]) -> List[LogRecord]:
+        """Parse log text, the traceback records of a mapped log, or streamed lines"""
+        if isinstance(log_content, str):
+            return parse_log(log_content)
+        if isinstance(log_content, MappedLogReader):
+            return list(iter_records(log_content.iter_record_lines(MappedLogReader.TRACEBACK_MARKERS)))
+        return list(iter_records(log_content))
+    
+    def map_records_to_code(self, records: Iterable[LogRecord], max_frames: int = MAX_CONTEXT_FRAMES,
+                            max_caller_snippets: int = MAX_CALLER_SNIPPETS) -> Dict:
+        """
+        Map parsed log records to code locations with context
+        
+        Code context is fetched once per distinct frame, for the max_frames
+        best-ranked ones (see rank_frames), so noisy logs cost no more than
+        a bounded prompt. The root cause is the top-ranked frame: the
+        innermost project frame of the latest traceback, not a library frame.
+        Up to max_caller_snippets call sites of other functions that reach
+        the failing code (see _caller_contexts) are attached as caller_contexts.
+        
+        Returns:
+            Dict with error analysis and code mappings (same shape as map_error_to_code)
+        """
+        records = list(records)
+        
         # Extract stack trace
-        stack_trace = self.extract_stack_trace(log_content)
+        tracebacks = self.extract_tracebacks_from_records(records)
+        stack_trace = [frame for traceback in tracebacks for frame in traceback['frames']]
         
         if not stack_trace:
+            # Lock timeouts, pool exhaustion...: find the code by what the log says instead
+            retrieved = self.search_code(records) if records else []
+            code_contexts = []
+            for result in retrieved:
+                context = self.get_code_context(result['file'], result['line'])
+                if context:
+                    context['function'] = result['qualname']
+                    context['score'] = result['score']
+                    code_contexts.append(context)
             return {
                 'error': 'No stack trace found in log',
                 'stack_trace': [],
-                'code_contexts': []
+                'code_contexts': code_contexts,
+                'retrieved_functions': retrieved
             }
         
-        # Get code context for each frame
+        ranked = self.rank_frames(stack_trace)
+        selected = ranked[:max_frames]
+        
         code_contexts = []
-        for frame in stack_trace:
+        for frame in selected:
+            if frame['origin'] != PROJECT:
+                continue
             context = self.get_code_context(frame['file'], frame['line'])
             if context:
                 context['function'] = frame['function']
+                context['occurrences'] = frame['occurrences']
+                context['rank'] = frame['rank']
                 code_contexts.append(context)
         
         # Extract error message
-        error_pattern = r'(Exception|Error): (.+?)(?:\n|$)'
-        error_match = re.search(error_pattern, log_content)
-        error_message = error_match.group(0) if error_match else "Unknown error"
+        error_message = "Unknown error"
+        for line in (line for record in records for line in record.lines):
+            error_match = ERROR_MESSAGE_PATTERN.search(line)
+            if error_match:
+                error_message = error_match.group(0)
+                break
         
+        root_cause = ranked[0]
+        caller_contexts = self._caller_contexts(selected, stack_trace, max_caller_snippets)
         return {
             'error_message': error_message,
             'stack_trace': stack_trace,
+            'tracebacks': [{
+                'exception': traceback['exception'],
+                'log_source': traceback['log_source'],
+                'log_timestamp': traceback['log_timestamp'],
+                'frames': len(traceback['frames']),
+                'project_frames': sum(1 for frame in traceback['frames'] if frame['origin'] == PROJECT)
+            } for traceback in tracebacks],
             'code_contexts': code_contexts,
-            'root_cause_file': stack_trace[-1]['file'] if stack_trace else None,
-            'root_cause_line': stack_trace[-1]['line'] if stack_trace else None,
-            'root_cause_function': stack_trace[-1]['function'] if stack_trace else None
+            'caller_contexts': caller_contexts,
+            'root_cause_file': root_cause['file'],
+            'root_cause_line': root_cause['line'],
+            'root_cause_function': root_cause['function'],
+            'frame_stats': {
+                'frames': len(stack_trace),
+                'distinct_frames': len(ranked),
+                'selected_frames': len(selected),
+                'snippet_cache_hits': self.snippet_stats['hits'],
+                'snippet_cache_misses': self.snippet_stats['misses']
+            }
         }
     
+    def _caller_contexts(self, ranked: List[Dict], stack_trace: List[Dict], max_snippets: int) -> List[Dict]:
+        """
+        Snippets around other calls into the failing code
+        
+        Callers of the ranked project frames that are not in any traceback
+        (other entry points reaching the same code), nearest first and, at
+        equal distance, callers of higher-ranked frames first.
+        """
+        if max_snippets <= 0:
+            return []
+        
+        # Callers already in a traceback have their own code context
+        seen = {(frame['file'], frame['qualname']) for frame in stack_trace}
+        candidates = []
+        for frame in ranked:
+            if frame['origin'] != PROJECT or not frame['qualname']:
+                continue
+            for caller in self.find_callers(frame['file'], frame['qualname']):
+                candidates.append((caller['depth'], frame['rank'], caller))
+        candidates.sort(key=lambda candidate: candidate[:2])
+        
+        contexts = []
+        for _, _, caller in candidates:
+            key = (caller['file'], caller['qualname'])
+            if key in seen:
+                continue
+            seen.add(key)
+            context = self.get_code_context(caller['file'], caller['call_line'], CALLER_CONTEXT_LINES)
+            if context:
+                context['function'] = caller['qualname']
+                context['calls'] = caller['calls']
+                context['depth'] = caller['depth']
+                contexts.append(context)
+                if len(contexts) >= max_snippets:
+                    break
+        return contexts
+    
     def get_all_files(self) -> List[str]:
         """Get list of all files in the codebase"""
-        return list(self.file_cache.keys())
+        return list(self.file_paths.keys())
     
     def get_file_content(self, file_path: str) -> Optional[str]:
         """Get full content of a file"""
-        if file_path in self.file_cache:
-            return self.file_cache[file_path]['content']
-        return None
+        source = self._get_source(file_path)
+        return source.text if source is not None else None
+
+
+def _group_by_traceback(stack_trace: List[Dict]) -> List[List[Dict]]:
+    """Consecutive frames of the same traceback (all frames as one group if unlabelled)"""
+    groups = []
+    for frame in stack_trace:
+        if groups and groups[-1][-1].get('traceback') == frame.get('traceback'):
+            groups[-1].append(frame)
+        else:
+            groups.append([frame])
+    return groups
@@ -0,0 +1,220 @@
+"""
+Code Search - BM25 retrieval of the functions a log window most likely came from
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .log_parser import LogRecord
+from .source_file import SourceFile
+from .symbol_table import FUNCTION
+
+# Identifiers and words; snake_case and CamelCase are also split into their parts
+WORD_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+MIN_TERM_LENGTH = 3
+
+# Python keywords and glue words that say nothing about where a message came from
+STOP_WORDS = frozenset('''
+    and are as assert async await break class continue def del elif else except false finally for from
+    global has have if import in into is lambda none nonlocal not now only or pass raise return self cls
+    the this true try was while with yield after before all any but can its new than that then too use
+    value values item items data result args kwargs str int float bool dict list len print
+'''.split())
+
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in more than this fraction of functions barely change the ranking but cost the most to score
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+# Score added to the function containing a log line's own [file.py:NN] location, and to its file's others
+LOCATION_BOOST = 10.0
+FILE_BOOST = 1.0
+
+
+def code_terms(text: str) -> List[str]:
+    """Search terms of code or of a log message: identifiers, their parts, and words (lowercased)"""
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        lower = word.lower()
+        parts = [part.lower() for piece in word.split('_') for part in CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1 and lower not in STOP_WORDS:
+            terms.append(lower)
+        terms.extend(part for part in parts if len(part) >= MIN_TERM_LENGTH and part not in STOP_WORDS
+                     and not part.isdigit())
+    return terms
+
+
+class CodeSearchIndex:
+    """
+    BM25 index over function-level chunks of a codebase
+
+    Every function (and method) is one document made of its identifiers,
+    string literals (log message templates, SQL) and comments. Files are
+    added, replaced and removed one at a time with their version, so
+    keeping the index current after a deploy only re-chunks changed files.
+    Postings are term -> {chunk: term frequency}; a query only touches the
+    postings of its own terms.
+    """
+
+    def __init__(self):
+        # chunk id -> (file, qualname, start line, end line, length in terms)
+        self.chunks: Dict[int, Tuple[str, str, int, int, int]] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        # chunk id -> its distinct terms (to unlink it from postings on removal) and length
+        self.chunk_terms: Dict[int, Tuple[str, ...]] = {}
+        self.chunk_lengths: Dict[int, int] = {}
+        # file -> (version, chunk ids)
+        self.files: Dict[str, Tuple[object, List[int]]] = {}
+        self._next_chunk = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def version(self, file_path: str):
+        """Version a file was indexed at (None if it is not indexed)"""
+        entry = self.files.get(file_path)
+        return entry[0] if entry else None
+
+    def add_file(self, file_path: str, source: SourceFile, version=None):
+        """
+        Index (or reindex) the functions of a file
+
+        Args:
+            file_path: Key the results will name the file by
+            source: The file's text and symbols
+            version: Anything identifying this content (compared by update callers)
+        """
+        self.remove_file(file_path)
+        symbols = source.symbols
+        chunk_ids = []
+        for index in range(len(symbols)):
+            if symbols.kinds[index] != FUNCTION:
+                continue
+            start, end = symbols.starts[index], symbols.ends[index]
+            counts = Counter(code_terms(''.join(source.lines(start - 1, end))))
+            length = sum(counts.values())
+            chunk_id = self._next_chunk
+            self._next_chunk += 1
+            self.chunks[chunk_id] = (file_path, symbols.qualnames[index], start, end, length)
+            self._total_length += length
+            self.chunk_terms[chunk_id] = tuple(counts)
+            self.chunk_lengths[chunk_id] = length
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+            chunk_ids.append(chunk_id)
+        self.files[file_path] = (version, chunk_ids)
+
+    def remove_file(self, file_path: str):
+        """Drop a file's chunks (no-op if it is not indexed)"""
+        entry = self.files.pop(file_path, None)
+        if entry is None:
+            return
+        for chunk_id in entry[1]:
+            self._total_length -= self.chunks.pop(chunk_id)[4]
+            del self.chunk_lengths[chunk_id]
+            for term in self.chunk_terms.pop(chunk_id):
+                chunk_tfs = self.postings[term]
+                del chunk_tfs[chunk_id]
+                if not chunk_tfs:
+                    del self.postings[term]
+
+    def search(self, terms: Iterable[str], top_k: int = 5,
+               boosts: Optional[Dict[int, float]] = None) -> List[Dict]:
+        """
+        Best-matching functions for a bag of query terms
+
+        Args:
+            terms: Query terms (see code_terms); repeats are counted once, and
+                terms found in most functions are ignored unless nothing else matches
+            top_k: Most results
+            boosts: Extra score per chunk id (see location_boosts)
+
+        Returns:
+            Dicts with file, qualname, start_line, end_line and score, best first
+        """
+        count = len(self.chunks)
+        if not count:
+            return []
+        average_length = self._total_length / count or 1.0
+        # BM25 term weight is idf * tf * (k1 + 1) / (tf + constant + per_length * length)
+        constant = BM25_K1 * (1 - BM25_B)
+        per_length = BM25_K1 * BM25_B / average_length
+        lengths = self.chunk_lengths
+
+        postings = [self.postings[term] for term in set(terms) if term in self.postings]
+        selective = [chunk_tfs for chunk_tfs in postings if len(chunk_tfs) <= count * MAX_DOCUMENT_FREQUENCY]
+        scores: Dict[int, float] = dict(boosts or {})
+        for chunk_tfs in selective or postings:
+            idf = math.log(1 + (count - len(chunk_tfs) + 0.5) / (len(chunk_tfs) + 0.5))
+            weight = idf * (BM25_K1 + 1)
+            for chunk_id, tf in chunk_tfs.items():
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * tf / (tf + constant + per_length * lengths[chunk_id])
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        results = []
+        for chunk_id, score in best:
+            if chunk_id not in self.chunks or score <= 0:
+                continue
+            file_path, qualname, start, end, _ = self.chunks[chunk_id]
+            results.append({'file': file_path, 'qualname': qualname, 'start_line': start,
+                            'end_line': end, 'score': round(score, 3)})
+        return results
+
+    def location_boosts(self, locations: Iterable[Tuple[str, int]]) -> Dict[int, float]:
+        """
+        Search boosts for code locations logs point at
+
+        Args:
+            locations: (indexed file, line) pairs, e.g. from [database_manager.py:93] prefixes
+
+        Returns:
+            chunk id -> boost: LOCATION_BOOST for the innermost function
+            containing the line, FILE_BOOST for the file's other functions
+        """
+        boosts: Dict[int, float] = {}
+        for file_path, line in locations:
+            entry = self.files.get(file_path)
+            if entry is None:
+                continue
+            innermost = None
+            for chunk_id in entry[1]:
+                start, end = self.chunks[chunk_id][2:4]
+                if start <= line <= end and (innermost is None or start > self.chunks[innermost][2]):
+                    innermost = chunk_id
+                boosts[chunk_id] = max(boosts.get(chunk_id, 0.0), FILE_BOOST)
+            if innermost is not None:
+                boosts[innermost] = LOCATION_BOOST
+        return boosts
+
+
+def record_query(records: Iterable[LogRecord]) -> Tuple[List[str], List[Tuple[str, int]]]:
+    """
+    Query terms and [file.py:NN] locations of a log window
+
+    Warning and error records are used if there are any, otherwise every
+    record; repeated messages only count once.
+
+    Returns:
+        (terms, [(source file, line)])
+    """
+    records = list(records)
+    problems = [record for record in records if record.level in ('WARNING', 'ERROR', 'CRITICAL')]
+    terms = []
+    # (source file, line) -> None: a dict dedupes in O(1) and keeps first-seen order
+    locations: Dict[Tuple[str, int], None] = {}
+    seen_messages = set()
+    for record in problems or records:
+        if record.source_file:
+            locations.setdefault((record.source_file, record.source_line))
+        # Numbers vary between repeats of the same message
+        message = re.sub(r'\d+', '0', record.message)
+        if message in seen_messages:
+            continue
+        seen_messages.add(message)
+        terms.extend(code_terms(record.message))
+    return terms, list(locations)
@@ -0,0 +1,76 @@
+"""
+Code Watcher - Polls a CodeMapper's codebase and swaps in changed files as they are deployed
+"""
+import threading
+from typing import Callable, Dict, Optional
+
+from .code_mapper import CodeMapper
+
+
+class CodeWatcher:
+    """
+    Keeps a CodeMapper in step with its codebase from a background thread
+
+    Most polls only stat directories (catching files added, deleted or
+    renamed into place, which is how deploys usually write code); every
+    full_scan_every polls, every file is stat'ed to also catch in-place edits.
+    """
+
+    def __init__(self, mapper: CodeMapper, interval: float = 2.0, full_scan_every: int = 15,
+                 on_change: Optional[Callable[[Dict], None]] = None):
+        """
+        Args:
+            mapper: Mapper to refresh
+            interval: Seconds between polls
+            full_scan_every: Polls between full (per-file) scans
+            on_change: Called with the changed paths after a poll that found changes
+        """
+        self.mapper = mapper
+        self.interval = interval
+        self.full_scan_every = max(1, full_scan_every)
+        self.on_change = on_change
+        self.polls = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self) -> Dict:
+        """
+        Check for changes once
+
+        Returns:
+            Dict with added, modified and removed relative paths
+        """
+        quick = self.polls % self.full_scan_every != 0
+        self.polls += 1
+        changes = self.mapper.refresh_codebase(quick=quick)
+        if self.on_change and any(changes.values()):
+            self.on_change(changes)
+        return changes
+
+    def start(self) -> 'CodeWatcher':
+        """Start polling in a daemon thread (no-op if already running)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='code-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop polling and wait for the thread to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except OSError:
+                # The codebase may be mid-deploy; try again next poll
+                pass
+            self._stop.wait(self.interval)
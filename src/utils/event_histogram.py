@@ -0,0 +1,269 @@
+"""
+Event Histogram - Per-second and per-minute event counts by level, source and keyword
+"""
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .log_parser import LogRecord
+
+RESOLUTIONS = {'second': 1000, 'minute': 60_000}
+
+# Dimensions a count can be broken down by; every count is also split by log level
+DIMENSIONS = ('level', 'source', 'keyword')
+
+DEFAULT_SECOND_RETENTION_MS = 3_600_000
+DEFAULT_MINUTE_RETENTION_MS = 7 * 86_400_000
+
+_MAGIC = b'EVHG'
+_VERSION = 1
+# magic, version, second retention, minute retention (-1 keeps everything), latest ms (-1 if none), series count
+_HEADER = struct.Struct('<4sIqqqQ')
+# resolution, dimension, value and level byte lengths, bucket count; the names and arrays follow
+_SERIES_HEADER = struct.Struct('<HHHHQ')
+
+
+class _Series:
+    """Sorted bucket starts and their counts, stored as compact arrays"""
+
+    __slots__ = ('buckets', 'counts')
+
+    def __init__(self, buckets: Iterable[int] = (), counts: Iterable[int] = ()):
+        self.buckets = array('q', buckets)
+        self.counts = array('q', counts)
+
+    def add(self, bucket: int, count: int = 1):
+        """Count an event; appending in time order is O(1)"""
+        if self.buckets and self.buckets[-1] == bucket:
+            self.counts[-1] += count
+        elif not self.buckets or bucket > self.buckets[-1]:
+            self.buckets.append(bucket)
+            self.counts.append(count)
+        else:
+            i = bisect_left(self.buckets, bucket)
+            if self.buckets[i] == bucket:
+                self.counts[i] += count
+            else:
+                self.buckets.insert(i, bucket)
+                self.counts.insert(i, count)
+
+    def range(self, start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+        """Index range of the buckets within [start_ms, end_ms]"""
+        lo = 0 if start_ms is None else bisect_left(self.buckets, start_ms)
+        hi = len(self.buckets) if end_ms is None else bisect_right(self.buckets, end_ms)
+        return lo, hi
+
+    def drop_before(self, start_ms: int):
+        """Discard buckets older than start_ms"""
+        cut = bisect_left(self.buckets, start_ms)
+        if cut:
+            del self.buckets[:cut]
+            del self.counts[:cut]
+
+
+class EventHistogram:
+    """
+    Incrementally maintained time-bucketed event counts
+
+    Range queries bisect into per-series arrays, so their cost is
+    proportional to the number of buckets returned, not to the log size.
+    """
+
+    def __init__(self, second_retention_ms: int = DEFAULT_SECOND_RETENTION_MS,
+                 minute_retention_ms: Optional[int] = DEFAULT_MINUTE_RETENTION_MS):
+        """
+        Args:
+            second_retention_ms: How much per-second history to keep
+            minute_retention_ms: How much per-minute history to keep (None keeps it all)
+        """
+        self.second_retention_ms = second_retention_ms
+        self.minute_retention_ms = minute_retention_ms
+        # resolution -> dimension -> value -> level -> _Series
+        self._series = {resolution: {dimension: {} for dimension in DIMENSIONS}
+                        for resolution in RESOLUTIONS}
+        self.latest_ms = None
+
+    def add_record(self, record: LogRecord, keywords: Iterable[str] = ()):
+        """Count a parsed log record and the anomaly keywords found in it"""
+        if record.timestamp_ms is None:
+            return
+
+        level = record.level or 'UNKNOWN'
+        self.add(record.timestamp_ms, 'level', level, level)
+
+        source = record.source_file or record.component
+        if source:
+            self.add(record.timestamp_ms, 'source', source, level)
+
+        for keyword in keywords:
+            self.add(record.timestamp_ms, 'keyword', keyword, level)
+
+    def add(self, timestamp_ms: int, dimension: str, value: str, level: str, count: int = 1):
+        """Count an event at a time for one dimension value"""
+        for resolution, width in RESOLUTIONS.items():
+            by_level = self._series[resolution][dimension].setdefault(value, {})
+            series = by_level.get(level)
+            if series is None:
+                series = by_level[level] = _Series()
+            series.add(timestamp_ms - timestamp_ms % width, count)
+
+        if self.latest_ms is None or timestamp_ms > self.latest_ms:
+            self.latest_ms = timestamp_ms
+
+    def counts(self, dimension: str, value: str, start_ms: Optional[int] = None,
+               end_ms: Optional[int] = None, resolution: str = 'minute',
+               levels: Optional[Iterable[str]] = None) -> List[Tuple[int, int]]:
+        """
+        Event counts per bucket for one dimension value
+
+        Example: counts('source', 'database_manager.py', start, end, levels=['ERROR'])
+        gives errors per minute for that file.
+
+        Returns:
+            List of (bucket start in epoch ms, count), in time order
+        """
+        by_level = self._series[resolution][dimension].get(value, {})
+        matching = [series for level, series in by_level.items() if levels is None or level in levels]
+
+        if len(matching) == 1:
+            series = matching[0]
+            lo, hi = series.range(start_ms, end_ms)
+            return list(zip(series.buckets[lo:hi], series.counts[lo:hi]))
+
+        merged = {}
+        for series in matching:
+            lo, hi = series.range(start_ms, end_ms)
+            for bucket, count in zip(series.buckets[lo:hi], series.counts[lo:hi]):
+                merged[bucket] = merged.get(bucket, 0) + count
+        return sorted(merged.items())
+
+    def totals(self, dimension: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+               resolution: str = 'minute', levels: Optional[Iterable[str]] = None) -> List[Tuple[str, int]]:
+        """
+        Total events per value of a dimension within a time range
+
+        Returns:
+            List of (value, count), highest count first
+        """
+        totals = {}
+        for value, by_level in self._series[resolution][dimension].items():
+            total = 0
+            for level, series in by_level.items():
+                if levels is None or level in levels:
+                    lo, hi = series.range(start_ms, end_ms)
+                    total += sum(series.counts[lo:hi])
+            if total:
+                totals[value] = total
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    def prune(self):
+        """Drop buckets that fall outside their resolution's retention window"""
+        if self.latest_ms is None:
+            return
+        retentions = {'second': self.second_retention_ms, 'minute': self.minute_retention_ms}
+        for resolution, retention_ms in retentions.items():
+            if retention_ms is None:
+                continue
+            cutoff = self.latest_ms - retention_ms
+            for by_value in self._series[resolution].values():
+                for value in list(by_value):
+                    by_level = by_value[value]
+                    for level in list(by_level):
+                        by_level[level].drop_before(cutoff)
+                        if not by_level[level].buckets:
+                            del by_level[level]
+                    if not by_level:
+                        del by_value[value]
+
+    def _iter_series(self) -> Iterable[Tuple[str, str, str, str, _Series]]:
+        """(resolution, dimension, value, level, series) for every series"""
+        for resolution, by_dimension in self._series.items():
+            for dimension, by_value in by_dimension.items():
+                for value, by_level in by_value.items():
+                    for level, series in by_level.items():
+                        yield resolution, dimension, value, level, series
+
+    def to_dict(self) -> Dict:
+        """Serialize the histogram (JSON-compatible)"""
+        series = {resolution: [] for resolution in RESOLUTIONS}
+        for resolution, dimension, value, level, entry in self._iter_series():
+            series[resolution].append([dimension, value, level, entry.buckets.tolist(), entry.counts.tolist()])
+        return {
+            'second_retention_ms': self.second_retention_ms,
+            'minute_retention_ms': self.minute_retention_ms,
+            'latest_ms': self.latest_ms,
+            'series': series
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'EventHistogram':
+        """Restore a histogram serialized with to_dict (None gives an empty one)"""
+        if not data:
+            return cls()
+        histogram = cls(second_retention_ms=data.get('second_retention_ms', DEFAULT_SECOND_RETENTION_MS),
+                        minute_retention_ms=data.get('minute_retention_ms', DEFAULT_MINUTE_RETENTION_MS))
+        histogram.latest_ms = data.get('latest_ms')
+        for resolution, entries in data.get('series', {}).items():
+            if resolution not in RESOLUTIONS:
+                continue
+            for dimension, value, level, buckets, counts in entries:
+                histogram._restore(resolution, dimension, value, level, _Series(buckets, counts))
+        return histogram
+
+    def save(self, path: str):
+        """
+        Write the histogram atomically in a compact binary form
+
+        Each series is a short header, its names and its raw bucket and
+        count arrays, so saving and loading never go through JSON.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        entries = [entry for entry in self._iter_series() if entry[4].buckets]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.second_retention_ms,
+                                 -1 if self.minute_retention_ms is None else self.minute_retention_ms,
+                                 -1 if self.latest_ms is None else self.latest_ms, len(entries)))
+            for resolution, dimension, value, level, series in entries:
+                names = [name.encode('utf-8') for name in (resolution, dimension, value, level)]
+                f.write(_SERIES_HEADER.pack(*(len(name) for name in names), len(series.buckets)))
+                f.write(b''.join(names))
+                series.buckets.tofile(f)
+                series.counts.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['EventHistogram']:
+        """A histogram written by save, or None if it is missing or unreadable"""
+        try:
+            with open(path, 'rb') as f:
+                magic, version, second_retention_ms, minute_retention_ms, latest_ms, count = \
+                    _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or version != _VERSION:
+                    return None
+                histogram = cls(second_retention_ms=second_retention_ms,
+                                minute_retention_ms=None if minute_retention_ms < 0 else minute_retention_ms)
+                histogram.latest_ms = None if latest_ms < 0 else latest_ms
+                for _ in range(count):
+                    *lengths, bucket_count = _SERIES_HEADER.unpack(f.read(_SERIES_HEADER.size))
+                    names = []
+                    for length in lengths:
+                        names.append(f.read(length).decode('utf-8'))
+                    resolution, dimension, value, level = names
+                    series = _Series()
+                    series.buckets.fromfile(f, bucket_count)
+                    series.counts.fromfile(f, bucket_count)
+                    if resolution in RESOLUTIONS:
+                        histogram._restore(resolution, dimension, value, level, series)
+        except (OSError, EOFError, struct.error, UnicodeDecodeError):
+            return None
+        return histogram
+
+    def _restore(self, resolution: str, dimension: str, value: str, level: str, series: _Series):
+        by_value = self._series[resolution].setdefault(dimension, {})
+        by_value.setdefault(value, {})[level] = series
+
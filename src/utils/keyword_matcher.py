@@ -0,0 +1,102 @@
+"""
+Keyword Matcher - Finds every severity keyword in a log line with a single scan
+"""
+import re
+from typing import Dict, List, Tuple
+
+
+class KeywordMatcher:
+    """Compiles a severity -> keywords table into one prefix-factored regex"""
+
+    def __init__(self, keyword_table: Dict[str, List[str]]):
+        self.signature = self.table_signature(keyword_table)
+
+        # (severity, keyword) pairs in table order; results are reported in this order
+        self.entries = []
+        order_by_keyword = {}
+        for severity, keywords in self.signature:
+            for keyword in keywords:
+                lowered = keyword.lower()
+                order_by_keyword.setdefault(lowered, []).append(len(self.entries))
+                self.entries.append((severity, keyword))
+
+        # A keyword that is a prefix of a longer one starts at the same position,
+        # so the longest alternative wins and the prefixes are added from this map
+        self._hits_for = {}
+        for lowered in order_by_keyword:
+            hits = []
+            for other, indexes in order_by_keyword.items():
+                if lowered.startswith(other):
+                    hits.extend(indexes)
+            self._hits_for[lowered] = hits
+
+        self._pattern = None
+        if order_by_keyword:
+            # A prefix-factored alternation ("lock(?: timeout)?|timeout...") tries one branch per
+            # character, and without lookarounds the engine can skip ahead to possible first characters
+            self._pattern = re.compile(_trie_pattern(_build_trie(order_by_keyword)))
+
+    @staticmethod
+    def table_signature(keyword_table: Dict[str, List[str]]) -> Tuple:
+        """Hashable snapshot of a keyword table, used to detect changes"""
+        return tuple((severity, tuple(keywords)) for severity, keywords in keyword_table.items())
+
+    def find_all(self, line: str) -> List[Tuple[str, str]]:
+        """
+        Find all keywords contained in a line (case-insensitive)
+
+        Returns:
+            List of (severity, keyword) tuples, each at most once, in table order
+        """
+        if self._pattern is None:
+            return []
+
+        lowered = line.lower()
+        search = self._pattern.search
+        match = search(lowered)
+        if match is None:
+            return []
+
+        found = set()
+        while match is not None:
+            found.update(self._hits_for[match.group()])
+            # Restart one character later so keywords overlapping this one are found too
+            # ("lock timeout" and "timeout exceeded" in "lock timeout exceeded")
+            match = search(lowered, match.start() + 1)
+
+        return [self.entries[i] for i in sorted(found)]
+
+
+def _build_trie(keywords) -> Dict:
+    """Character trie of keywords; the '' key marks the end of a keyword"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+
+def _trie_pattern(node: Dict) -> str:
+    """
+    Regex for a trie that matches the longest keyword at a position
+
+    Chains of single children collapse into literals, and an optional
+    (greedy) group is used where a keyword ends inside a longer one.
+    """
+    ends_here = '' in node
+    branches = []
+    for char in sorted(key for key in node if key):
+        literal = char
+        child = node[char]
+        while len(child) == 1 and '' not in child:
+            (next_char, child), = child.items()
+            literal += next_char
+        branches.append(re.escape(literal) + _trie_pattern(child))
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if ends_here:
+        return '(?:' + body + ')?'
+    return body
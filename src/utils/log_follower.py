@@ -0,0 +1,215 @@
+"""
+Log Follower - Incrementally analyzes growing log files using persisted read offsets
+"""
+import json
+import os
+from typing import Dict, Iterator, List, Optional
+
+from .anomaly_aggregator import AnomalyAggregator, sort_groups
+from .anomaly_detector import AnomalyDetector
+from .event_histogram import EventHistogram
+from .log_reader import DEFAULT_CHUNK_SIZE, offset_fingerprint
+
+COUNTER_KEYS = ('total_anomalies', 'error_count', 'warning_count', 'critical_count')
+
+
+class LogFollower:
+    """Analyzes only the bytes appended to each log since the previous run"""
+
+    def __init__(self, state_file: str, detector: Optional[AnomalyDetector] = None,
+                 max_open_anomalies: int = 500, aggregate: bool = False,
+                 histogram_file: Optional[str] = None):
+        """
+        Args:
+            state_file: JSON file holding offsets, inodes and running counters
+            detector: Detector used for the appended lines
+            max_open_anomalies: Most recent anomalies (or groups) kept per file
+            aggregate: Keep fingerprint groups instead of one record per hit
+            histogram_file: Binary file for the event histogram (defaults to
+                the state file's name with a .histogram extension)
+        """
+        self.state_file = state_file
+        self.histogram_file = histogram_file or f"{os.path.splitext(state_file)[0]}.histogram"
+        self.detector = detector or AnomalyDetector()
+        self.max_open_anomalies = max_open_anomalies
+        self.aggregate = aggregate
+        self.state = self._load_state()
+        if self.state.get('aggregate', aggregate) != aggregate:
+            # Open anomalies were recorded in the other mode; counters stay valid
+            for file_state in self.state['files'].values():
+                file_state['anomalies'] = []
+        self.state['aggregate'] = aggregate
+        # Event counts over everything ingested so far, for dashboard queries; older
+        # states kept the histogram inline and are migrated on the next save
+        self.histogram = (EventHistogram.load(self.histogram_file)
+                          or EventHistogram.from_dict(self.state.pop('histogram', None)))
+
+    def follow(self, *log_paths: str) -> Dict:
+        """
+        Analyze whatever was appended to the given logs since the last call
+
+        Returns:
+            Dict with running counters and open anomalies across all files
+            (same shape as AnomalyDetector.analyze_logs)
+        """
+        changed = False
+        for log_path in log_paths:
+            changed = self._follow_file(os.path.abspath(log_path)) or changed
+        if changed:
+            self.histogram.prune()
+            self.histogram.save(self.histogram_file)
+            self._save_state()
+
+        combined = {key: 0 for key in COUNTER_KEYS}
+        combined['anomalies'] = []
+        for log_path in log_paths:
+            file_state = self.state['files'].get(os.path.abspath(log_path))
+            if not file_state:
+                continue
+            for key in COUNTER_KEYS:
+                combined[key] += file_state[key]
+            combined['anomalies'].extend(file_state['anomalies'])
+
+        if self.aggregate:
+            combined['anomalies'] = sort_groups(combined['anomalies'])
+            combined['distinct_anomalies'] = len(combined['anomalies'])
+        return combined
+
+    def reset(self):
+        """Forget all offsets and counters"""
+        self.state = {'files': {}, 'aggregate': self.aggregate}
+        self.histogram = EventHistogram()
+        self.histogram.save(self.histogram_file)
+        self._save_state()
+
+    def _follow_file(self, log_path: str) -> bool:
+        """
+        Bring the state of a single file up to date
+
+        Returns:
+            Whether the state changed (and needs saving)
+        """
+        try:
+            stat = os.stat(log_path)
+        except OSError:
+            return False
+
+        changed = False
+        file_state = self.state['files'].get(log_path)
+        if file_state is None:
+            file_state = self._new_file_state(stat.st_ino)
+            self.state['files'][log_path] = file_state
+            changed = True
+
+        if file_state['inode'] != stat.st_ino:
+            # Rotated: finish the old file if it was moved next to the new one
+            rotated_path = self._find_rotated_file(log_path, file_state['inode'])
+            if rotated_path:
+                self._analyze_from(rotated_path, file_state)
+            file_state['inode'] = stat.st_ino
+            file_state['offset'] = 0
+            changed = True
+        elif stat.st_size < file_state['offset'] or not self._same_content(log_path, file_state):
+            # Truncated in place (and maybe rewritten past the offset since): start over from the beginning
+            file_state['offset'] = 0
+            changed = True
+
+        if stat.st_size > file_state['offset']:
+            self._analyze_from(log_path, file_state)
+            changed = True
+        return changed
+
+    def _analyze_from(self, log_path: str, file_state: Dict):
+        """Analyze complete lines after the stored offset and merge them into the state"""
+        with open(log_path, 'rb') as f:
+            f.seek(file_state['offset'])
+            position = [file_state['offset']]
+            result = self.detector.analyze_log_stream(self._iter_complete_lines(f, position),
+                                                      aggregate=self.aggregate,
+                                                      histogram=self.histogram)
+            file_state['fingerprint'] = offset_fingerprint(f, position[0])
+
+        file_state['offset'] = position[0]
+        for key in COUNTER_KEYS:
+            file_state[key] += result[key]
+
+        if self.aggregate:
+            aggregator = AnomalyAggregator(self.detector.MAX_EXEMPLARS)
+            aggregator.merge_groups(file_state['anomalies'])
+            aggregator.merge_groups(result['anomalies'])
+            anomalies = aggregator.groups(sort=False)
+        else:
+            anomalies = file_state['anomalies'] + result['anomalies']
+        file_state['anomalies'] = anomalies[-self.max_open_anomalies:] if self.max_open_anomalies else []
+
+    @staticmethod
+    def _same_content(log_path: str, file_state: Dict) -> bool:
+        """Whether the bytes before the stored offset are still the ones analyzed last time"""
+        fingerprint = file_state.get('fingerprint')
+        if fingerprint is None:
+            return True
+        try:
+            with open(log_path, 'rb') as f:
+                return offset_fingerprint(f, file_state['offset']) == fingerprint
+        except OSError:
+            return True
+
+    @staticmethod
+    def _iter_complete_lines(f, position: List[int]) -> Iterator[str]:
+        """
+        Yield newline-terminated lines, advancing position[0] past each one
+
+        A trailing partial line is left for the next run, when the writer
+        has finished it.
+        """
+        remainder = b''
+        while True:
+            chunk = f.read(DEFAULT_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+                position[0] += len(line) + 1
+                yield line.decode('utf-8', errors='replace')
+
+    @staticmethod
+    def _find_rotated_file(log_path: str, inode: int) -> Optional[str]:
+        """Find the file a log was rotated to, by its old inode"""
+        directory, name = os.path.split(log_path)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return None
+        for entry in entries:
+            if entry.name != name and entry.name.startswith(name) and entry.is_file():
+                if entry.inode() == inode:
+                    return entry.path
+        return None
+
+    @staticmethod
+    def _new_file_state(inode: int) -> Dict:
+        file_state = {'inode': inode, 'offset': 0, 'fingerprint': None, 'anomalies': []}
+        file_state.update({key: 0 for key in COUNTER_KEYS})
+        return file_state
+
+    def _load_state(self) -> Dict:
+        """Load the persisted state, starting fresh if it is missing or unreadable"""
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            if isinstance(state.get('files'), dict):
+                return state
+        except (OSError, ValueError):
+            pass
+        return {'files': {}}
+
+    def _save_state(self):
+        """Write the state atomically so a crash never leaves a torn file"""
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_file)
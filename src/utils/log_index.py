@@ -0,0 +1,213 @@
+"""
+Log Index - Sparse on-disk timestamp to byte offset index for time-range log queries
+"""
+import hashlib
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+from .log_parser import LogRecord, iter_records
+from .log_reader import iter_byte_range_lines, next_record_start, offset_fingerprint
+from .log_timestamps import TIMESTAMP_LENGTH, clock_to_ms, timestamp_to_ms
+
+# One index entry per this many bytes of log
+DEFAULT_INTERVAL_BYTES = 64 * 1024
+
+_MAGIC = b'LTIX'
+_VERSION = 2
+# magic, version, inode, indexed bytes, fingerprint of the bytes before them, interval, entry count
+_HEADER = struct.Struct('<4sIQQIQQ')
+
+_MS_PER_DAY = 86_400_000
+
+
+def index_path_for(log_path: str, cache_dir: str) -> str:
+    """Sidecar index location for a log file inside the cache directory"""
+    digest = hashlib.sha1(os.path.abspath(log_path).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(cache_dir, 'log_index', f"{os.path.basename(log_path)}-{digest}.idx")
+
+
+class LogTimeIndex:
+    """
+    Maps record timestamps to byte offsets, one entry every interval_bytes
+
+    Entries are found by seeking to each interval and reading forward to the
+    next record start, so building the index reads a few lines per entry
+    rather than the whole file. The index is extended as the log grows and
+    rebuilt when the log is rotated or truncated.
+    """
+
+    def __init__(self, log_path: str, index_path: str, interval_bytes: int = DEFAULT_INTERVAL_BYTES):
+        """
+        Args:
+            log_path: Log file to index
+            index_path: Sidecar file the index is persisted to
+            interval_bytes: Log bytes between index entries
+        """
+        self.log_path = log_path
+        self.index_path = index_path
+        self.interval_bytes = interval_bytes
+        self._clear(inode=None)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def first_ms(self) -> Optional[int]:
+        return self.timestamps[0] if self.timestamps else None
+
+    @property
+    def last_ms(self) -> Optional[int]:
+        return self.timestamps[-1] if self.timestamps else None
+
+    def update(self) -> int:
+        """
+        Index whatever was appended to the log since the last update
+
+        Returns:
+            Number of entries added (0 if the log is missing or unchanged)
+        """
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return 0
+
+        added = 0
+        with open(self.log_path, 'rb') as f:
+            if (stat.st_ino != self.inode or stat.st_size < self.indexed_bytes
+                    or offset_fingerprint(f, self.indexed_bytes) != self.fingerprint):
+                # Rotated or truncated (maybe rewritten past the indexed bytes since)
+                self._clear(inode=stat.st_ino)
+            if stat.st_size == self.indexed_bytes:
+                return 0
+
+            # Only complete lines are indexed; a partial last line waits for its writer
+            end = self._complete_end(f, stat.st_size)
+            position = self.offsets[-1] + self.interval_bytes if self.offsets else 0
+
+            while position < end:
+                start = next_record_start(f, position, end)
+                if start >= end:
+                    break
+                f.seek(start)
+                timestamp_ms = timestamp_to_ms(f.read(TIMESTAMP_LENGTH).decode('ascii', errors='replace'))
+                if timestamp_ms is not None and (not self.offsets or start > self.offsets[-1]):
+                    # Keep timestamps sorted for bisection, even if a few lines are out of order
+                    if self.timestamps and timestamp_ms < self.timestamps[-1]:
+                        timestamp_ms = self.timestamps[-1]
+                    self.timestamps.append(timestamp_ms)
+                    self.offsets.append(start)
+                    added += 1
+                position = start + self.interval_bytes
+
+            self.indexed_bytes = max(self.indexed_bytes, end)
+            self.fingerprint = offset_fingerprint(f, self.indexed_bytes)
+        self._save()
+        return added
+
+    def byte_range(self, start_ms: Optional[int], end_ms: Optional[int]) -> Tuple[int, int]:
+        """
+        Byte range of the log that holds every record within [start_ms, end_ms]
+
+        The range is a superset of the matching records by at most one
+        interval on each side.
+        """
+        lo = 0
+        if start_ms is not None:
+            i = bisect_left(self.timestamps, start_ms) - 1
+            lo = self.offsets[i] if i >= 0 else 0
+
+        hi = self.indexed_bytes
+        if end_ms is not None:
+            j = bisect_right(self.timestamps, end_ms)
+            hi = self.offsets[j] if j < len(self.offsets) else self.indexed_bytes
+        return lo, max(lo, hi)
+
+    def iter_records(self, start_ms: Optional[int], end_ms: Optional[int]) -> Iterator[LogRecord]:
+        """Yield the records whose timestamp falls within [start_ms, end_ms]"""
+        lo, hi = self.byte_range(start_ms, end_ms)
+        for record in iter_records(iter_byte_range_lines(self.log_path, lo, hi)):
+            if record.timestamp_ms is None:
+                continue
+            if start_ms is not None and record.timestamp_ms < start_ms:
+                continue
+            if end_ms is not None and record.timestamp_ms > end_ms:
+                continue
+            yield record
+
+    def records(self, start_ms: Optional[int], end_ms: Optional[int]) -> List[LogRecord]:
+        """Records within [start_ms, end_ms], in log order"""
+        return list(self.iter_records(start_ms, end_ms))
+
+    def window_at(self, clock: str, window_ms: int) -> Optional[Tuple[int, int]]:
+        """
+        Time range of window_ms centered on an 'HH:MM:SS' time of day
+
+        The time of day is taken on the most recent day in the log.
+
+        Returns:
+            (start_ms, end_ms), or None if the log is empty or the clock invalid
+        """
+        if self.last_ms is None:
+            return None
+        center = clock_to_ms(self.last_ms - self.last_ms % _MS_PER_DAY, clock)
+        if center is None:
+            return None
+        return center - window_ms // 2, center + window_ms // 2
+
+    @staticmethod
+    def _complete_end(f, size: int) -> int:
+        """Offset just past the last newline in the file (0 if there is none)"""
+        position = size
+        while position > 0:
+            read_from = max(0, position - DEFAULT_INTERVAL_BYTES)
+            f.seek(read_from)
+            newline = f.read(position - read_from).rfind(b'\n')
+            if newline >= 0:
+                return read_from + newline + 1
+            position = read_from
+        return 0
+
+    def _clear(self, inode: Optional[int]):
+        self.inode = inode
+        self.indexed_bytes = 0
+        self.fingerprint = 0
+        self.timestamps = array('q')
+        self.offsets = array('q')
+
+    def _load(self):
+        """Load the persisted index, ignoring it if it is missing, stale or unreadable"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = _HEADER.unpack(f.read(_HEADER.size))
+                magic, version, inode, indexed_bytes, fingerprint, interval, count = header
+                if magic != _MAGIC or version != _VERSION or interval != self.interval_bytes:
+                    return
+                timestamps = array('q')
+                offsets = array('q')
+                timestamps.fromfile(f, count)
+                offsets.fromfile(f, count)
+        except (OSError, EOFError, struct.error):
+            return
+
+        self.inode = inode
+        self.indexed_bytes = indexed_bytes
+        self.fingerprint = fingerprint
+        self.timestamps = timestamps
+        self.offsets = offsets
+
+    def _save(self):
+        """Write the index atomically so a crash never leaves a torn file"""
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.inode, self.indexed_bytes,
+                                 self.fingerprint, self.interval_bytes, len(self.offsets)))
+            self.timestamps.tofile(f)
+            self.offsets.tofile(f)
+        os.replace(tmp_path, self.index_path)
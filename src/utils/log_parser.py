@@ -0,0 +1,120 @@
+"""
+Log Parser - Turns raw log lines into structured records with their tracebacks attached
+"""
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .log_timestamps import TIMESTAMP_LENGTH, parse_log_timestamp, starts_with_timestamp
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# 2024-10-17 09:15:57,301 ERROR [database_manager.py:93] Lock timeout after 12.02s ...
+APP_HEADER_PATTERN = re.compile(r'(DEBUG|INFO|WARNING|ERROR|CRITICAL) \[([^\]:]+):(\d+)\] ?(.*)')
+# 2024-10-17 09:15:57,302 [DB-ERROR] CRITICAL: InnoDB: Deadlock detected ...
+COMPONENT_HEADER_PATTERN = re.compile(r'\[([^\]]+)\] (DEBUG|INFO|WARNING|ERROR|CRITICAL):? ?(.*)')
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class LogRecord(NamedTuple):
+    """One log entry: its header line plus any continuation lines (tracebacks, details)"""
+    timestamp: Optional[str]
+    timestamp_ms: Optional[int]
+    level: Optional[str]
+    source_file: Optional[str]
+    source_line: Optional[int]
+    component: Optional[str]
+    message: str
+    raw: str
+    continuation: Tuple[str, ...] = ()
+
+    @property
+    def lines(self) -> Tuple[str, ...]:
+        """All raw lines of the record, header first"""
+        return (self.raw,) + self.continuation
+
+    @property
+    def source(self) -> Optional[str]:
+        """'file.py:NN' for application logs, the component tag otherwise"""
+        if self.source_file:
+            return f"{self.source_file}:{self.source_line}"
+        return self.component
+
+    @property
+    def traceback(self) -> Optional[str]:
+        """The traceback block attached to this record, if any"""
+        lines = self.lines
+        for i, line in enumerate(lines):
+            if line.startswith('Traceback'):
+                return '\n'.join(lines[i:]).rstrip()
+        return None
+
+
+def parse_header(line: str) -> LogRecord:
+    """Parse a line that starts a record (or an orphan line with no header)"""
+    if not starts_with_timestamp(line):
+        return LogRecord(None, None, None, None, None, None, line, line)
+
+    timestamp, timestamp_ms = parse_log_timestamp(line)
+    rest = line[TIMESTAMP_LENGTH:].lstrip()
+
+    match = APP_HEADER_PATTERN.match(rest)
+    if match:
+        level, source_file, source_line, message = match.groups()
+        return LogRecord(timestamp, timestamp_ms, level, source_file, int(source_line), None, message, line)
+
+    match = COMPONENT_HEADER_PATTERN.match(rest)
+    if match:
+        component, level, message = match.groups()
+        return LogRecord(timestamp, timestamp_ms, level, None, None, component, message, line)
+
+    level = None
+    first_word = rest.split(' ', 1)[0].rstrip(':')
+    if first_word in LEVELS:
+        level = first_word
+        rest = rest[len(first_word):].lstrip(': ')
+    return LogRecord(timestamp, timestamp_ms, level, None, None, None, rest, line)
+
+
+def iter_records(lines: Iterable[str]) -> Iterator[LogRecord]:
+    """
+    Group log lines into records
+
+    A line starting with a timestamp opens a new record; every other line
+    (traceback frames, exception lines, details, blank lines) is attached
+    to the record before it. Lines before the first header form a record
+    without a timestamp.
+    """
+    header = None
+    continuation = []
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if header is not None and not starts_with_timestamp(line):
+            continuation.append(line)
+            continue
+
+        if header is not None:
+            yield header._replace(continuation=tuple(continuation)) if continuation else header
+        header = parse_header(line)
+        continuation = []
+
+    if header is not None:
+        yield header._replace(continuation=tuple(continuation)) if continuation else header
+
+
+def iter_record_batches(lines: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[LogRecord]]:
+    """Group log lines into records and yield them in lists of up to batch_size"""
+    batch = []
+    for record in iter_records(lines):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_log(log_content: str) -> List[LogRecord]:
+    """Parse a whole log held in memory"""
+    return list(iter_records(log_content.split('\n')))
@@ -0,0 +1,287 @@
+"""
+Log Reader - Streams log lines from paths, file objects, line iterators, byte ranges and memory maps
+"""
+import codecs
+import mmap
+import os
+import re
+import zlib
+from typing import Iterable, Iterator, List, Tuple, Union
+
+# Default read size for streaming log sources
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+LogSource = Union[str, os.PathLike, Iterable]
+
+
+def iter_log_lines(source: LogSource, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield log lines from a path, a file object or an iterable of lines
+
+    Files are read in fixed-size chunks so memory use is bounded by the
+    chunk size and the longest line, not by the size of the log.
+
+    Args:
+        source: File path, open file object (text or binary) or iterable of lines
+        chunk_size: Number of characters/bytes to read at a time
+
+    Returns:
+        Iterator of lines without trailing newlines
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r', encoding='utf-8', errors='replace') as f:
+            yield from _iter_chunked(f, chunk_size)
+    elif hasattr(source, 'read'):
+        yield from _iter_chunked(source, chunk_size)
+    else:
+        for line in source:
+            yield line.rstrip('\n')
+
+
+def _iter_chunked(f, chunk_size: int) -> Iterator[str]:
+    """Split a file object into lines, reading chunk_size at a time"""
+    decoder = None
+    remainder = ''
+
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            chunk = decoder.decode(chunk)
+
+        lines = (remainder + chunk).split('\n')
+        remainder = lines.pop()
+        yield from lines
+
+    if decoder is not None:
+        remainder += decoder.decode(b'', final=True)
+    if remainder:
+        yield remainder
+
+
+# A log record starts with a timestamp; continuation lines (tracebacks, details) do not
+RECORD_START_PATTERN = re.compile(rb'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+
+# How far past a shard boundary to look for the start of the next record
+MAX_RECORD_SEARCH_BYTES = 1024 * 1024
+
+# Bytes before a read offset that are checksummed to recognise the same file content later
+FINGERPRINT_BYTES = 64
+
+
+def find_shard_boundaries(log_path: str, num_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split a log file into byte ranges that start at the beginning of a record
+
+    Boundaries are moved forward to the next line that starts with a timestamp,
+    so a multi-line record (e.g. an error and its traceback) is never split
+    between two shards. If no record start is found nearby, the boundary
+    falls back to the next newline.
+
+    Returns:
+        List of (start, end) byte offsets covering the whole file
+    """
+    size = os.path.getsize(log_path)
+    if num_shards <= 1 or size == 0:
+        return [(0, size)]
+
+    boundaries = [0]
+    with open(log_path, 'rb') as f:
+        for i in range(1, num_shards):
+            position = max(size * i // num_shards, boundaries[-1])
+            position = next_record_start(f, position, size)
+            if position > boundaries[-1] and position < size:
+                boundaries.append(position)
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def next_record_start(f, position: int, size: int) -> int:
+    """
+    Offset of the first record start at or after the line following position
+
+    Args:
+        f: Log file opened in binary mode
+        position: Byte offset to search from (0 or exactly at a line start counts that line)
+        size: Offset returned when no record starts before the end of the file
+
+    Returns:
+        Offset of the record's header line, or of the first line after position
+        if no header is found within MAX_RECORD_SEARCH_BYTES
+    """
+    f.seek(max(0, position - 1))
+    if position > 0:
+        # Finish the line the position falls in (unless it is exactly at a line start)
+        if f.read(1) != b'\n':
+            f.readline()
+    first_line_start = f.tell()
+
+    scanned = 0
+    while scanned < MAX_RECORD_SEARCH_BYTES:
+        line_start = f.tell()
+        line = f.readline()
+        if not line:
+            return size
+        if RECORD_START_PATTERN.match(line):
+            return line_start
+        scanned += len(line)
+
+    return first_line_start
+
+
+def offset_fingerprint(f, offset: int) -> int:
+    """
+    Checksum of the bytes just before an offset of a binary file
+
+    A log that was only appended to still has the same bytes there. One that
+    was truncated in place (copytruncate rotation) and has since grown past
+    the offset almost never does, since its old lines carried timestamps.
+    """
+    start = max(0, offset - FINGERPRINT_BYTES)
+    f.seek(start)
+    return zlib.crc32(f.read(offset - start))
+
+
+def iter_byte_range_lines(log_path: str, start: int, end: int,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """Yield the decoded lines of a newline-aligned byte range of a file"""
+    with open(log_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        remainder = b''
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+                yield line.decode('utf-8', errors='replace').rstrip('\r')
+        if remainder:
+            yield remainder.decode('utf-8', errors='replace').rstrip('\r')
+
+
+class MappedLogReader:
+    """
+    Memory-mapped log file that only decodes the lines that matter
+
+    Marker searches run over the raw bytes (bytes.find), so DEBUG/INFO
+    lines that do not contain a marker are never decoded or copied.
+    """
+
+    # Markers that can affect AnomalyDetector results
+    ANOMALY_MARKERS = (b'ERROR', b'CRITICAL', b'WARNING')
+    TRACEBACK_MARKERS = (b'Traceback',)
+
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self._file = open(log_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the mapping and the file handle"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self._map) if self._map is not None else 0
+
+    def iter_matching_lines(self, markers: Iterable[bytes] = ANOMALY_MARKERS) -> Iterator[str]:
+        """
+        Yield, in file order, each line that contains at least one marker
+
+        Args:
+            markers: Byte strings to look for (case-sensitive)
+        """
+        for start, end in self._iter_line_spans(markers):
+            yield _decode_line(self._map[start:end])
+
+    def iter_record_lines(self, markers: Iterable[bytes] = TRACEBACK_MARKERS) -> Iterator[str]:
+        """
+        Yield the lines of every record that contains a marker
+
+        A record is a timestamped header line plus the continuation lines
+        after it, so a hit on a traceback line yields the log entry that owns
+        the traceback together with the whole block.
+        """
+        mm = self._map
+        emitted_end = 0
+        for start, end in self._iter_line_spans(markers):
+            if start < emitted_end:
+                continue
+            record_start = self._record_start(start)
+            record_end = self._record_end(end)
+            emitted_end = record_end
+            for line in mm[max(record_start, 0):record_end].split(b'\n'):
+                yield _decode_line(line)
+
+    def _iter_line_spans(self, markers: Iterable[bytes]) -> Iterator[Tuple[int, int]]:
+        """(start, end) byte spans of lines containing a marker, without the newline"""
+        mm = self._map
+        if mm is None:
+            return
+
+        next_hits = {marker: mm.find(marker) for marker in markers}
+        while True:
+            live = [hit for hit in next_hits.values() if hit >= 0]
+            if not live:
+                return
+            hit = min(live)
+
+            start = mm.rfind(b'\n', 0, hit) + 1
+            end = mm.find(b'\n', hit)
+            if end < 0:
+                end = len(mm)
+            yield start, end
+
+            for marker, marker_hit in next_hits.items():
+                if 0 <= marker_hit < end:
+                    next_hits[marker] = mm.find(marker, end)
+
+    def _record_start(self, line_start: int) -> int:
+        """Walk back from a line to the header line of its record"""
+        mm = self._map
+        position = line_start
+        limit = max(0, line_start - MAX_RECORD_SEARCH_BYTES)
+        while position > limit:
+            if RECORD_START_PATTERN.match(mm, position):
+                return position
+            position = mm.rfind(b'\n', 0, position - 1) + 1
+        return position if RECORD_START_PATTERN.match(mm, position) else line_start
+
+    def _record_end(self, line_end: int) -> int:
+        """Walk forward from the end of a line to the end of its record"""
+        mm = self._map
+        size = len(mm)
+        position = line_end
+        limit = min(size, line_end + MAX_RECORD_SEARCH_BYTES)
+        while position < limit:
+            next_line = position + 1
+            if next_line >= size or RECORD_START_PATTERN.match(mm, next_line):
+                return position
+            position = mm.find(b'\n', next_line)
+            if position < 0:
+                return size
+        return position
+
+
+def _decode_line(line: bytes) -> str:
+    return line.decode('utf-8', errors='replace').rstrip('\r')
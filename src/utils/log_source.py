@@ -0,0 +1,190 @@
+"""
+Log Source - Streams rotated log segment sets, including gzip and zstd archives
+"""
+import gzip
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from .log_reader import DEFAULT_CHUNK_SIZE, iter_log_lines
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst segments
+    zstandard = None
+
+# Decompressed chunks buffered per segment ahead of the reader
+MAX_PREFETCH_CHUNKS = 16
+
+# Numbered or dated rotations, optionally compressed; editor and backup files (.swp, .bak, .tmp) are not segments
+ROTATION_SUFFIX_PATTERN = re.compile(
+    r'[.-](\d+'                                          # .log.1, .log.2.gz, .log-20241017.zst
+    r'|\d{4}-\d{2}-\d{2}(?:[_T]\d{2}(?:-\d{2}){0,2})?'  # .log.2024-10-17, .log.2024-10-17_09-30
+    r'|\d{8}-\d+)'                                      # .log-20241017-1729150000
+    r'(\.gz|\.zst)?$')
+
+# A bare number this long is a date (20241017) or an epoch time, not a rotation count
+MIN_DATED_SUFFIX_DIGITS = 8
+
+_END_OF_SEGMENT = object()
+
+
+def open_segment(path: str) -> BinaryIO:
+    """
+    Open a log segment for streaming binary reads, decompressing on the fly
+
+    Raises:
+        RuntimeError: For a .zst segment when the zstandard package is not installed
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def rotation_order(suffix: str) -> Tuple:
+    """
+    Sort key of a rotation suffix, oldest first
+
+    A higher rotation number is older (.log.3 before .log.2); an earlier date
+    or time is older (.log-20241016 before .log-20241017, .log.2024-10-17_09
+    before .log.2024-10-17_10). Numbered segments sort before dated ones.
+    """
+    if suffix.isdigit() and len(suffix) < MIN_DATED_SUFFIX_DIGITS:
+        return 0, -int(suffix)
+    return 1, re.sub(r'\D', '', suffix)
+
+
+class RotatedLogSet:
+    """
+    A live log and its rotated segments, read oldest first as one line stream
+
+    Segments are decompressed by a small thread pool (zlib and zstd release
+    the GIL), each into a bounded queue, so later segments are decompressed
+    while earlier ones are being analyzed without holding whole files in
+    memory. Nothing is written to disk.
+
+    Iterating the set yields lines, so it can be passed anywhere an iterable
+    of log lines is accepted (AnomalyDetector.analyze_log_stream,
+    CodeMapper.map_error_to_code).
+    """
+
+    def __init__(self, log_path: str, workers: int = 2, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Args:
+            log_path: Path of the live log (e.g. logs/payment_service.log)
+            workers: Segments decompressed concurrently
+            chunk_size: Decompressed bytes per read
+        """
+        self.log_path = log_path
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+
+    def segments(self) -> List[str]:
+        """
+        Paths of the segments in time order, oldest first
+
+        Segments are ordered by modification time (when they were rotated out),
+        with the suffix breaking ties (see rotation_order). The live log, if
+        present, is always last.
+        """
+        directory, name = os.path.split(self.log_path)
+        try:
+            entries = list(os.scandir(directory or '.'))
+        except OSError:
+            return []
+
+        rotated = []
+        for entry in entries:
+            if entry.name == name or not entry.name.startswith(name) or not entry.is_file():
+                continue
+            match = ROTATION_SUFFIX_PATTERN.fullmatch(entry.name[len(name):])
+            if not match:
+                continue
+            rotated.append((entry.stat().st_mtime, rotation_order(match.group(1)), entry.path))
+
+        paths = [path for _, _, path in sorted(rotated)]
+        if os.path.isfile(self.log_path):
+            paths.append(self.log_path)
+        return paths
+
+    def __iter__(self) -> Iterator[str]:
+        return self.iter_lines()
+
+    def iter_lines(self, segments: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Yield the lines of all segments, oldest first
+
+        Args:
+            segments: Segment paths to read (defaults to segments())
+
+        Returns:
+            Iterator of lines without trailing newlines
+        """
+        segments = self.segments() if segments is None else segments
+        if not segments:
+            return
+
+        stop = threading.Event()
+        queues = [queue.Queue(MAX_PREFETCH_CHUNKS) for _ in segments]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(segments))) as pool:
+            # The pool runs segments in submission order and the reader drains them
+            # in the same order, so the segment being read always has a worker
+            futures = [pool.submit(self._decompress, path, chunks, stop)
+                       for path, chunks in zip(segments, queues)]
+            try:
+                for chunks, future in zip(queues, futures):
+                    yield from iter_log_lines(_QueueReader(chunks), self.chunk_size)
+                    future.result()
+            finally:
+                stop.set()
+
+    def _decompress(self, path: str, chunks: queue.Queue, stop: threading.Event):
+        """Read one segment into its queue; the end marker is always queued last"""
+        try:
+            last = b'\n'
+            with open_segment(path) as f:
+                while not stop.is_set():
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    self._put(chunks, chunk, stop)
+                    last = chunk[-1:]
+            if last != b'\n':
+                # Keep the last line of a segment from running into the next one
+                self._put(chunks, b'\n', stop)
+        finally:
+            self._put(chunks, _END_OF_SEGMENT, stop)
+
+    @staticmethod
+    def _put(chunks: queue.Queue, item, stop: threading.Event):
+        """Block until there is room in the queue, unless the reader went away"""
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+class _QueueReader:
+    """File-like view of a segment queue, for the shared line splitter"""
+
+    def __init__(self, chunks: queue.Queue):
+        self.chunks = chunks
+        self.done = False
+
+    def read(self, size: int = -1) -> bytes:
+        if self.done:
+            return b''
+        chunk = self.chunks.get()
+        if chunk is _END_OF_SEGMENT:
+            self.done = True
+            return b''
+        return chunk
@@ -0,0 +1,110 @@
+"""
+Log Timestamps - Fast parsing of log timestamps into integer epoch milliseconds
+"""
+import re
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# Pattern: 2024-10-17 09:15:45,145
+TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}')
+
+TIMESTAMP_LENGTH = 23
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_MS_PER_DAY = 86_400_000
+
+
+def parse_log_timestamp(line: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Find the timestamp of a log line
+
+    Lines that start with the fixed-layout prefix are parsed by slicing;
+    anything else falls back to a regex search. Timestamps are treated as UTC.
+
+    Returns:
+        (timestamp text, epoch milliseconds), or (None, None) if there is none
+    """
+    if starts_with_timestamp(line):
+        text = line[:TIMESTAMP_LENGTH]
+        try:
+            return text, _prefix_to_ms(text)
+        except ValueError:
+            pass
+
+    match = TIMESTAMP_PATTERN.search(line)
+    if match:
+        text = match.group(0)
+        try:
+            return text, _prefix_to_ms(text)
+        except ValueError:
+            return text, None
+
+    return None, None
+
+
+def timestamp_to_ms(text: str) -> Optional[int]:
+    """Convert a '2024-10-17 09:15:45,145' timestamp to epoch milliseconds"""
+    if not starts_with_timestamp(text):
+        return None
+    try:
+        return _prefix_to_ms(text)
+    except ValueError:
+        return None
+
+
+def format_timestamp_ms(timestamp_ms: int) -> str:
+    """Format epoch milliseconds back into the log timestamp layout"""
+    moment = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+    return f"{moment:%Y-%m-%d %H:%M:%S},{timestamp_ms % 1000:03d}"
+
+
+def clock_to_ms(day_ms: int, clock: str) -> Optional[int]:
+    """Combine the start of a day (epoch ms) with an 'HH:MM:SS' time of day"""
+    if len(clock) < 8 or clock[2] != ':' or clock[5] != ':':
+        return None
+    digits = clock[0:2] + clock[3:5] + clock[6:8]
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    return day_ms + int(clock[0:2]) * 3_600_000 + int(clock[3:5]) * 60_000 + int(clock[6:8]) * 1000
+
+
+def day_start_ms(day: str) -> Optional[int]:
+    """Epoch milliseconds at the start of a 'YYYY-MM-DD' day, or None if invalid"""
+    try:
+        return _day_to_ms(day[:10])
+    except (ValueError, IndexError):
+        return None
+
+
+def starts_with_timestamp(line: str) -> bool:
+    """Check whether a line starts with the fixed-layout timestamp prefix (separators only)"""
+    return (len(line) >= TIMESTAMP_LENGTH and line[4] == '-' and line[7] == '-'
+            and line[10] == ' ' and line[13] == ':' and line[16] == ':' and line[19] == ',')
+
+
+def _prefix_to_ms(text: str) -> int:
+    """Convert a timestamp prefix to epoch milliseconds, raising ValueError if malformed"""
+    seconds = text[17:19] + text[20:23]
+    if not (seconds.isascii() and seconds.isdigit()):
+        raise ValueError(f"Invalid timestamp: {text[:TIMESTAMP_LENGTH]}")
+    return _minute_to_ms(text[:16]) + int(seconds)
+
+
+@lru_cache(maxsize=4096)
+def _minute_to_ms(minute: str) -> int:
+    """Epoch milliseconds of a 'YYYY-MM-DD HH:MM' minute (cached, minutes repeat)"""
+    digits = minute[11:13] + minute[14:16]
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"Invalid timestamp: {minute}")
+    return _day_to_ms(minute[:10]) + int(minute[11:13]) * 3_600_000 + int(minute[14:16]) * 60_000
+
+
+@lru_cache(maxsize=1024)
+def _day_to_ms(day: str) -> int:
+    """Epoch milliseconds at the start of a 'YYYY-MM-DD' day (cached, days repeat)"""
+    digits = day[0:4] + day[5:7] + day[8:10]
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"Invalid date: {day}")
+    ordinal = date(int(day[0:4]), int(day[5:7]), int(day[8:10])).toordinal()
+    return (ordinal - _EPOCH_ORDINAL) * _MS_PER_DAY
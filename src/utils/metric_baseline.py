@@ -0,0 +1,126 @@
+"""
+Metric Baseline - Online EWMA mean/variance per series and metric
+"""
+import json
+import math
+import os
+from typing import Dict, Optional, Tuple
+
+# Smallest deviation a baseline is credited with, relative to its mean: a perfectly
+# steady series (std 0) would otherwise make any sample at or above its mean an outlier
+MIN_RELATIVE_STD = 0.02
+
+
+def floor_std(mean: float, std: float, minimum: float = 0.0) -> float:
+    """
+    Standard deviation to score against, never below MIN_RELATIVE_STD of the mean
+
+    Args:
+        mean: Baseline mean
+        std: Baseline standard deviation
+        minimum: Absolute floor (e.g. Poisson noise for counts)
+    """
+    return max(std, MIN_RELATIVE_STD * abs(mean), minimum)
+
+
+class MetricBaseline:
+    """Keeps an exponentially weighted mean and variance for every (series, metric) pair"""
+
+    def __init__(self, alpha: float = 0.1, warmup: int = 10):
+        """
+        Args:
+            alpha: EWMA smoothing factor (higher adapts faster)
+            warmup: Samples needed before a baseline is trusted
+        """
+        self.alpha = alpha
+        self.warmup = warmup
+        # "series|metric" -> [mean, variance, sample count]
+        self.state = {}
+
+    def get(self, series: str, metric: str) -> Optional[Tuple[float, float, int]]:
+        """
+        Get the current baseline for a metric
+
+        Returns:
+            (mean, standard deviation, sample count), or None if never seen
+        """
+        entry = self.state.get(f"{series}|{metric}")
+        if entry is None:
+            return None
+        mean, variance, count = entry
+        return mean, math.sqrt(variance), count
+
+    def is_warm(self, series: str, metric: str) -> bool:
+        """Whether enough samples were seen to trust the baseline"""
+        entry = self.state.get(f"{series}|{metric}")
+        return entry is not None and entry[2] >= self.warmup
+
+    def update(self, series: str, metric: str, value: float):
+        """Fold one sample into the baseline in O(1)"""
+        key = f"{series}|{metric}"
+        entry = self.state.get(key)
+        if entry is None:
+            self.state[key] = [float(value), 0.0, 1]
+            return
+
+        mean, variance, count = entry
+        diff = value - mean
+        increment = self.alpha * diff
+        entry[0] = mean + increment
+        entry[1] = (1 - self.alpha) * (variance + diff * increment)
+        entry[2] = count + 1
+
+    def update_repeated(self, series: str, metric: str, value: float, times: int):
+        """
+        Fold the same sample in several times at once, in O(1)
+
+        Equivalent to calling update times times: the gap between the mean
+        and the value shrinks by (1 - alpha) per sample, and the variance
+        follows in closed form.
+        """
+        if times <= 0:
+            return
+        key = f"{series}|{metric}"
+        if key not in self.state:
+            self.update(series, metric, value)
+            times -= 1
+            if not times:
+                return
+
+        entry = self.state[key]
+        mean, variance, count = entry
+        decay = (1 - self.alpha) ** times
+        diff = mean - value
+        entry[0] = value + diff * decay
+        entry[1] = decay * (variance + diff * diff * (1 - decay))
+        entry[2] = count + times
+
+    def to_dict(self) -> Dict:
+        """Serialize the baseline state"""
+        return {'alpha': self.alpha, 'warmup': self.warmup, 'state': self.state}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MetricBaseline':
+        """Restore a baseline serialized with to_dict"""
+        baseline = cls(alpha=data.get('alpha', 0.1), warmup=data.get('warmup', 10))
+        baseline.state = {key: list(entry) for key, entry in data.get('state', {}).items()}
+        return baseline
+
+    def save(self, path: str):
+        """Write the baseline to a JSON file atomically"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **defaults) -> 'MetricBaseline':
+        """Load a baseline from a JSON file, or start a new one if it is missing or unreadable"""
+        try:
+            with open(path, 'r') as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError):
+            return cls(**defaults)
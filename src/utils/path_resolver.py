@@ -0,0 +1,167 @@
+"""
+Path Resolver - Maps file paths from stack traces onto codebase files by longest common suffix
+"""
+import re
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+# Separators of POSIX and Windows paths ("C:\\app\\service.py")
+PATH_SEPARATOR_PATTERN = re.compile(r'[\\/]+')
+
+# Directories only installed packages and the standard library live under ("lib/python3.9")
+LIBRARY_DIRECTORIES = frozenset(('site-packages', 'dist-packages'))
+PYTHON_LIB_PATTERN = re.compile(r'python\d+(?:\.\d+)*$')
+
+
+def path_components(path: str) -> List[str]:
+    """Components of a path, ignoring the separator style, drive letters and '.' parts"""
+    parts = [part for part in PATH_SEPARATOR_PATTERN.split(path) if part and part != '.']
+    if parts and len(parts[0]) == 2 and parts[0][1] == ':':
+        parts = parts[1:]
+    return parts
+
+
+def is_library_path(path: str) -> bool:
+    """Whether a traceback path is inside site-packages, dist-packages or a lib/pythonX.Y directory"""
+    components = path_components(path)
+    for i, component in enumerate(components[:-1]):
+        if component in LIBRARY_DIRECTORIES:
+            return True
+        if component.lower() == 'lib' and PYTHON_LIB_PATTERN.match(components[i + 1]):
+            return True
+    return False
+
+
+class _Node:
+    __slots__ = ('children', 'key', 'best')
+
+    def __init__(self):
+        # next component (towards the root) -> _Node
+        self.children: Dict[str, '_Node'] = {}
+        # Codebase file whose path ends exactly here
+        self.key: Optional[str] = None
+        # Shortest codebase file path below this node
+        self.best: Optional[str] = None
+
+
+class PathResolver:
+    """
+    Trie of codebase file paths keyed by their reversed components
+
+    A traceback path ("/srv/app/db.py", a virtualenv or build directory, a
+    Windows path) is matched by walking its components from the file name
+    backwards, so a lookup costs O(path depth) whatever the codebase size.
+    Keys are indexed relative to the codebase root, so a deploy that puts
+    the codebase anywhere still matches. The deepest node reached is the
+    longest common suffix; if several files share it, the shortest path wins.
+    The file name and its directory must match (unless a file's whole path
+    below the root does), and paths under site-packages, dist-packages or
+    lib/pythonX.Y never match, so library frames with common file names are
+    not mistaken for codebase files. Resolutions are cached per original path.
+    """
+
+    def __init__(self, keys: Iterable[str] = (), root: str = '', max_cached_paths: int = 10000):
+        """
+        Args:
+            keys: Codebase file paths (the CodeMapper's relative paths)
+            root: Leading directories the keys share that are not part of the
+                codebase layout ('dummy_data/codebase'); matched without them
+            max_cached_paths: Most distinct traceback paths whose resolution is kept
+        """
+        self.root = _Node()
+        self.root_components = path_components(root)
+        self.max_cached_paths = max_cached_paths
+        # original path -> resolved key (or None), most recently used last
+        self._cache = OrderedDict()
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str):
+        """Index a codebase file"""
+        components = self._key_components(key)
+        if not components:
+            return
+        node = self.root
+        path = [node]
+        for component in reversed(components):
+            node = node.children.setdefault(component, _Node())
+            path.append(node)
+        node.key = key
+        for node in path[1:]:
+            if node.best is None or _rank(key) < _rank(node.best):
+                node.best = key
+        self._cache.clear()
+
+    def remove(self, key: str):
+        """Forget a codebase file"""
+        components = self._key_components(key)
+        node = self.root
+        path = [(None, node)]
+        for component in reversed(components):
+            node = node.children.get(component)
+            if node is None:
+                return
+            path.append((component, node))
+        if node.key != key:
+            return
+        node.key = None
+        # Recompute the shortest path below each node, pruning empty branches
+        for i in range(len(path) - 1, 0, -1):
+            component, node = path[i]
+            candidates = [child.best for child in node.children.values()]
+            if node.key is not None:
+                candidates.append(node.key)
+            if not candidates:
+                del path[i - 1][1].children[component]
+                continue
+            node.best = min(candidates, key=_rank)
+        self._cache.clear()
+
+    def resolve(self, path: str) -> Optional[str]:
+        """
+        Codebase file a traceback path refers to
+
+        Args:
+            path: File path as written in the traceback
+
+        Returns:
+            Codebase key with the longest common suffix, or None if no file
+            matches or the path belongs to an installed library
+        """
+        if path in self._cache:
+            self._cache.move_to_end(path)
+            return self._cache[path]
+
+        resolved = None
+        if not is_library_path(path):
+            components = path_components(path)
+            node = self.root
+            depth = 0
+            for component in reversed(components):
+                child = node.children.get(component)
+                if child is None:
+                    break
+                node = child
+                depth += 1
+            # A file name alone is not enough for a deeper path ("/opt/tools/models.py" is not
+            # our "app/models.py") unless a codebase file's whole path below the root matched
+            if depth >= min(2, len(components)) or node.key is not None:
+                resolved = node.best
+
+        self._cache[path] = resolved
+        if len(self._cache) > self.max_cached_paths:
+            self._cache.popitem(last=False)
+        return resolved
+
+    def _key_components(self, key: str) -> List[str]:
+        """Components of a key below the codebase root"""
+        components = path_components(key)
+        root = self.root_components
+        if root and components[:len(root)] == root and len(components) > len(root):
+            return components[len(root):]
+        return components
+
+
+def _rank(key: str):
+    """Order among files sharing a suffix: fewest components first, then by name"""
+    return key.count('/') + key.count('\\'), key
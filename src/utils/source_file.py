@@ -0,0 +1,89 @@
+"""
+Source File - A loaded source file with a compact line-offset index
+"""
+from array import array
+from typing import Iterator, List, Optional
+
+from .symbol_table import SymbolTable
+
+
+class SourceFile:
+    """
+    File text plus the offset of every line start
+
+    Lines are sliced out of the text on demand, so a file costs one string
+    and one integer array instead of a list of line strings.
+    """
+
+    __slots__ = ('path', 'text', 'line_offsets', '_symbols')
+
+    def __init__(self, path: str, text: str, line_offsets: Optional[array] = None,
+                 symbols: Optional[SymbolTable] = None):
+        """
+        Args:
+            path: File path
+            text: File text with '\n' line endings
+            line_offsets: Precomputed line offsets for this text (e.g. from the code index)
+            symbols: Precomputed symbol table for this text
+        """
+        self.path = path
+        self.text = text
+        self.line_offsets = line_offsets if line_offsets is not None else self._index_lines(text)
+        self._symbols = symbols
+
+    @staticmethod
+    def _index_lines(text: str) -> array:
+        """Offsets of every line start, plus the end of the text"""
+        offsets = array('q', [0])
+        newline = text.find('\n')
+        while newline != -1:
+            offsets.append(newline + 1)
+            newline = text.find('\n', newline + 1)
+        if text and not text.endswith('\n'):
+            # Sentinel end offset for a last line without a newline
+            offsets.append(len(text))
+        return offsets
+
+    @staticmethod
+    def decode(data: bytes) -> str:
+        """Decode file bytes the way text-mode open() would (UTF-8, universal newlines)"""
+        text = data.decode('utf-8', errors='replace')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    @classmethod
+    def load(cls, path: str) -> 'SourceFile':
+        """Read a file once (raises OSError if it cannot be read)"""
+        with open(path, 'rb') as f:
+            return cls(path, cls.decode(f.read()))
+
+    @property
+    def symbols(self) -> SymbolTable:
+        """Functions and classes of the file, parsed on first use"""
+        if self._symbols is None:
+            self._symbols = SymbolTable.from_source(self.text)
+        return self._symbols
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_offsets) - 1
+
+    def line(self, line_num: int) -> str:
+        """One line (1-indexed) with its trailing newline, or '' if out of range"""
+        if not 1 <= line_num <= self.line_count:
+            return ''
+        return self.text[self.line_offsets[line_num - 1]:self.line_offsets[line_num]]
+
+    def lines(self, start: int = 0, end: int = None) -> List[str]:
+        """Lines in [start, end) (0-indexed, like a list slice of readlines())"""
+        count = self.line_count
+        end = count if end is None else min(end, count)
+        offsets = self.line_offsets
+        return [self.text[offsets[i]:offsets[i + 1]] for i in range(max(0, start), end)]
+
+    def iter_lines(self) -> Iterator[str]:
+        """All lines in order, with their trailing newlines"""
+        offsets = self.line_offsets
+        for i in range(self.line_count):
+            yield self.text[offsets[i]:offsets[i + 1]]
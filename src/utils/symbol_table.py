@@ -0,0 +1,140 @@
+"""
+Symbol Table - Functions and classes of a Python file with their line ranges, from the AST
+"""
+import ast
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+FUNCTION = 'function'
+CLASS = 'class'
+
+_DEFINITIONS = {ast.FunctionDef: FUNCTION, ast.AsyncFunctionDef: FUNCTION, ast.ClassDef: CLASS}
+
+
+class SymbolTable:
+    """
+    Definitions of a file in start-line order, stored in parallel arrays
+
+    Every symbol knows its parent (the definition it is nested in), so the
+    innermost definition around a line is a bisect on the start lines plus
+    a short walk up the parent chain. Call sites are recorded too (callee
+    name only, resolved across files by CallGraph).
+    """
+
+    __slots__ = ('starts', 'ends', 'parents', 'names', 'qualnames', 'kinds', '_by_name',
+                 'call_scopes', 'call_lines', 'call_names', 'call_on_self')
+
+    def __init__(self):
+        self.starts = array('l')
+        self.ends = array('l')
+        # Index of the enclosing symbol, -1 at module level
+        self.parents = array('l')
+        self.names: List[str] = []
+        self.qualnames: List[str] = []
+        self.kinds: List[str] = []
+        # name and qualname -> symbol indexes in file order
+        self._by_name: Dict[str, List[int]] = {}
+        # Call sites: innermost enclosing symbol (-1 at module level), line,
+        # called name ('execute' for self.db.execute(...)) and whether it was called on self/cls
+        self.call_scopes = array('l')
+        self.call_lines = array('l')
+        self.call_names: List[str] = []
+        self.call_on_self = array('b')
+
+    @classmethod
+    def from_source(cls, text: str) -> 'SymbolTable':
+        """Build the table for a file's text (empty if the file does not parse)"""
+        table = cls()
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            return table
+        table._visit(tree, -1, '')
+        return table
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def symbol(self, index: int) -> Dict:
+        """One symbol as a dict"""
+        return {
+            'name': self.names[index],
+            'qualname': self.qualnames[index],
+            'kind': self.kinds[index],
+            'start_line': self.starts[index],
+            'end_line': self.ends[index]
+        }
+
+    def enclosing(self, line: int, kind: Optional[str] = None) -> Optional[Dict]:
+        """
+        Innermost definition that contains a line, in O(log n + nesting depth)
+
+        Args:
+            line: Line number (1-indexed)
+            kind: Only consider FUNCTION or CLASS definitions
+        """
+        index = bisect_right(self.starts, line) - 1
+        while index >= 0:
+            if self.ends[index] >= line and (kind is None or self.kinds[index] == kind):
+                return self.symbol(index)
+            # Either the symbol ended before the line or has the wrong kind: try its parent.
+            # Siblings in between cannot contain the line because they end before later siblings start.
+            index = self.parents[index]
+        return None
+
+    def find(self, name: str, kind: Optional[str] = None) -> List[Dict]:
+        """
+        Definitions with a name or qualified name ('execute' or 'DatabaseManager.execute')
+
+        Returns:
+            Matching symbols in file order
+        """
+        return [self.symbol(index) for index in self.indexes(name, kind)]
+
+    def indexes(self, name: str, kind: Optional[str] = None) -> List[int]:
+        """Like find, but the symbol indexes"""
+        return [index for index in self._by_name.get(name, ())
+                if kind is None or self.kinds[index] == kind]
+
+    def calls(self):
+        """Call sites as (scope symbol index, line, called name, called on self) tuples"""
+        return zip(self.call_scopes, self.call_lines, self.call_names, self.call_on_self)
+
+    def _visit(self, node: ast.AST, parent: int, prefix: str):
+        """Record definitions in pre-order, which is start-line order"""
+        for child in ast.iter_child_nodes(node):
+            kind = _DEFINITIONS.get(type(child))
+            if kind is None:
+                if isinstance(child, ast.Call):
+                    self._add_call(child, parent)
+                self._visit(child, parent, prefix)
+                continue
+
+            index = len(self.starts)
+            qualname = f"{prefix}{child.name}"
+            self.starts.append(child.lineno)
+            self.ends.append(getattr(child, 'end_lineno', None) or child.lineno)
+            self.parents.append(parent)
+            self.names.append(child.name)
+            self.qualnames.append(qualname)
+            self.kinds.append(kind)
+            self._by_name.setdefault(child.name, []).append(index)
+            if qualname != child.name:
+                self._by_name.setdefault(qualname, []).append(index)
+            self._visit(child, index, f"{qualname}.")
+
+    def _add_call(self, call: ast.Call, scope: int):
+        func = call.func
+        if isinstance(func, ast.Name):
+            name, on_self = func.id, False
+        elif isinstance(func, ast.Attribute):
+            name = func.attr
+            on_self = isinstance(func.value, ast.Name) and func.value.id in ('self', 'cls')
+        else:
+            # e.g. handlers[kind](...): nothing to resolve statically
+            return
+        self.call_scopes.append(scope)
+        self.call_lines.append(call.lineno)
+        self.call_names.append(name)
+        self.call_on_self.append(on_self)
@@ -0,0 +1,223 @@
+"""
+Template Miner - Drain-style online clustering of log messages into templates
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .log_parser import LogRecord, parse_log
+
+WILDCARD = '<*>'
+
+# Tokens with a digit are treated as variables when routing through the tree
+_HAS_DIGIT = re.compile(r'\d')
+
+
+class _Template:
+    """One cluster: its template tokens and occurrence statistics"""
+
+    __slots__ = ('template_id', 'tokens', 'level', 'count', 'first_seen_ms', 'last_seen_ms')
+
+    def __init__(self, template_id: str, tokens: List[str], level: Optional[str] = None):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.level = level
+        self.count = 0
+        self.first_seen_ms = None
+        self.last_seen_ms = None
+
+    @property
+    def text(self) -> str:
+        return ' '.join(self.tokens)
+
+    def to_dict(self) -> Dict:
+        return {
+            'template_id': self.template_id,
+            'template': self.text,
+            'level': self.level,
+            'count': self.count,
+            'first_seen_ms': self.first_seen_ms,
+            'last_seen_ms': self.last_seen_ms
+        }
+
+
+class TemplateMiner:
+    """
+    Assigns each log message a template ID and extracts its parameters
+
+    Follows Drain: messages are routed through a fixed-depth tree keyed by
+    token count and leading tokens, then matched against the templates in
+    that leaf by the share of identical tokens. A match above the similarity
+    threshold merges into the template (differing tokens become <*>);
+    otherwise a new template is created. Each message costs O(depth + leaf size).
+    """
+
+    def __init__(self, depth: int = 4, similarity_threshold: float = 0.4, max_children: int = 100):
+        """
+        Args:
+            depth: Tree depth; depth - 2 leading tokens are used for routing
+            similarity_threshold: Share of matching tokens needed to join a template
+            max_children: Distinct tokens per tree node before new ones share the <*> branch
+        """
+        self.depth = max(depth, 3)
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.total_lines = 0
+        self._templates: Dict[str, _Template] = {}
+        # token count -> token -> ... -> list of templates
+        self._tree: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def add_message(self, message: str, timestamp_ms: Optional[int] = None,
+                    level: Optional[str] = None) -> Tuple[str, List[str], bool]:
+        """
+        Cluster one message
+
+        Returns:
+            (template ID, parameters, whether the template is new)
+        """
+        tokens = message.split()
+        leaf = self._leaf(tokens)
+
+        template, score = None, -1.0
+        for candidate in leaf:
+            candidate_score = self._similarity(candidate.tokens, tokens)
+            if candidate_score > score:
+                template, score = candidate, candidate_score
+
+        is_new = template is None or score < self.similarity_threshold
+        if is_new:
+            template = _Template(f"T{len(self._templates) + 1}", list(tokens), level)
+            self._templates[template.template_id] = template
+            leaf.append(template)
+        else:
+            for i, token in enumerate(tokens):
+                if template.tokens[i] != token:
+                    template.tokens[i] = WILDCARD
+
+        template.count += 1
+        self.total_lines += 1
+        if timestamp_ms is not None:
+            if template.first_seen_ms is None:
+                template.first_seen_ms = timestamp_ms
+            template.last_seen_ms = timestamp_ms
+
+        parameters = [token for token, pattern in zip(tokens, template.tokens) if pattern == WILDCARD]
+        return template.template_id, parameters, is_new
+
+    def add_record(self, record: LogRecord) -> Tuple[str, List[str], bool]:
+        """Cluster the message of a parsed log record"""
+        return self.add_message(record.message, record.timestamp_ms, record.level)
+
+    def template(self, template_id: str) -> Optional[Dict]:
+        """Get one template and its statistics"""
+        template = self._templates.get(template_id)
+        return template.to_dict() if template else None
+
+    def templates(self) -> List[Dict]:
+        """All templates with their statistics, most frequent first"""
+        return sorted((template.to_dict() for template in self._templates.values()),
+                      key=lambda t: t['count'], reverse=True)
+
+    def to_dict(self) -> Dict:
+        """Serialize the miner (JSON-compatible)"""
+        return {
+            'depth': self.depth,
+            'similarity_threshold': self.similarity_threshold,
+            'max_children': self.max_children,
+            'total_lines': self.total_lines,
+            'templates': [dict(template.to_dict(), tokens=template.tokens)
+                          for template in self._templates.values()]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'TemplateMiner':
+        """Restore a miner serialized with to_dict (None gives an empty one)"""
+        if not data:
+            return cls()
+        miner = cls(depth=data.get('depth', 4),
+                    similarity_threshold=data.get('similarity_threshold', 0.4),
+                    max_children=data.get('max_children', 100))
+        miner.total_lines = data.get('total_lines', 0)
+        for entry in data.get('templates', []):
+            template = _Template(entry['template_id'], list(entry['tokens']), entry.get('level'))
+            template.count = entry.get('count', 0)
+            template.first_seen_ms = entry.get('first_seen_ms')
+            template.last_seen_ms = entry.get('last_seen_ms')
+            miner._templates[template.template_id] = template
+            miner._leaf(template.tokens).append(template)
+        return miner
+
+    def _leaf(self, tokens: List[str]) -> List[_Template]:
+        """Find (or create) the leaf a message routes to"""
+        node = self._tree.setdefault(len(tokens), {})
+        for token in tokens[:self.depth - 2]:
+            key = WILDCARD if _HAS_DIGIT.search(token) else token
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])
+
+    @staticmethod
+    def _similarity(template_tokens: List[str], tokens: List[str]) -> float:
+        """Share of positions where the template has exactly the message's token"""
+        if not tokens:
+            return 1.0
+        same = sum(1 for pattern, token in zip(template_tokens, tokens) if pattern == token)
+        return same / len(tokens)
+
+
+def collapse_repeats(log_content: str, max_chars: int = 40_000, keep_tokens: Iterable[str] = (),
+                     keep_lines: Iterable[str] = (), min_count: int = 2) -> str:
+    """
+    Shrink a log that is over a size budget by collapsing runs of repeated records
+
+    Only consecutive records that share a template (and continuation lines)
+    are collapsed, so the log stays in time order. The first record of a run
+    is kept verbatim and followed by a "[×N more: template, last at ...]"
+    line. Records containing a keep token or a keep line are never folded
+    into a run, so the IDs a question asks about and the lines that
+    triggered the analysis always reach the reader unmasked.
+
+    Args:
+        log_content: Log text
+        max_chars: Logs up to this size are returned unchanged
+        keep_tokens: Tokens (e.g. from the question) whose records are kept as is (case-insensitive)
+        keep_lines: Raw lines whose records are kept as is
+        min_count: Shortest run that is collapsed
+    """
+    if len(log_content) <= max_chars:
+        return log_content
+
+    keep_tokens = sorted({token for token in keep_tokens if token}, key=len, reverse=True)
+    # Whole tokens only: "ACC1" must not keep ACC10234
+    keep_pattern = (re.compile(r'(?<![\w-])(?:' + '|'.join(map(re.escape, keep_tokens)) + r')(?![\w-])',
+                               re.IGNORECASE) if keep_tokens else None)
+    keep_lines = {line.strip() for line in keep_lines}
+    miner = TemplateMiner()
+    # Runs of (template key, records); a kept record is a run of its own with key None
+    runs: List[Tuple[Optional[Tuple], List[LogRecord]]] = []
+    for record in parse_log(log_content):
+        key = (miner.add_record(record)[0], record.continuation)
+        if (any(line.strip() in keep_lines for line in record.lines)
+                or (keep_pattern is not None and any(keep_pattern.search(line) for line in record.lines))):
+            key = None
+        if key is not None and runs and runs[-1][0] == key:
+            runs[-1][1].append(record)
+        else:
+            runs.append((key, [record]))
+
+    lines = []
+    for key, records in runs:
+        if len(records) < min_count:
+            for record in records:
+                lines.extend(record.lines)
+            continue
+        lines.extend(records[0].lines)
+        summary = f"  [×{len(records) - 1} more: {miner.template(key[0])['template']}"
+        if records[-1].timestamp:
+            summary += f", last at {records[-1].timestamp}"
+        lines.append(summary + "]")
+
+    return '\n'.join(lines)
@@ -0,0 +1,271 @@
+"""
+Token Index - Inverted index from log tokens (IDs, exceptions, tables, files) to log records
+"""
+import builtins
+import os
+import pickle
+import re
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .log_parser import LogRecord, iter_records
+from .log_reader import DEFAULT_CHUNK_SIZE, offset_fingerprint
+from .log_timestamps import starts_with_timestamp
+
+# One pass over a line picks up, in order of the alternatives:
+#   file names        payment_service.py
+#   exception names   LockTimeoutError, ValueError, Exception
+#   identifiers       PMT20241017091545, ACC10234, conn-7 (a letter first, then a digit)
+#   long numbers      order and transaction numbers
+TOKEN_PATTERN = re.compile(r'\b(?:[\w-]+\.py|(?:[A-Z]\w*)?(?:Error|Exception|Timeout)'
+                           r'|[A-Za-z][\w-]*\d[\w-]*|\d{6,})\b')
+# FROM accounts, INSERT INTO transaction_log, lock on table 'accounts'
+SQL_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN|TABLE|table)\s+[`\'"]?([A-Za-z_]\w*)')
+SQL_TABLE_HINTS = ('FROM', 'INTO', 'UPDATE', 'JOIN', 'TABLE', 'table')
+MIN_TOKEN_LENGTH = 4
+
+_INDEX_VERSION = 2
+
+# Tokens a question can contain that say nothing specific: bare error words and
+# built-in exception classes (Exception, TimeoutError, ...) appear all over a log
+GENERIC_TOKENS = frozenset({'error', 'errors', 'exception', 'exceptions', 'timeout', 'timeouts'} | {
+    name.lower() for name, value in vars(builtins).items()
+    if isinstance(value, type) and issubclass(value, BaseException)})
+
+
+def tokenize(text: str) -> Set[str]:
+    """Indexable tokens of a line (or of a question), lowercased"""
+    tokens = TOKEN_PATTERN.findall(text)
+    if any(hint in text for hint in SQL_TABLE_HINTS):
+        tokens.extend(SQL_TABLE_PATTERN.findall(text))
+    return {token.lower() for token in tokens if len(token) >= MIN_TOKEN_LENGTH}
+
+
+def query_tokens(question: str) -> Set[str]:
+    """Tokens of a question worth searching for (tokenize without GENERIC_TOKENS)"""
+    return tokenize(question) - GENERIC_TOKENS
+
+
+def encode_varint(value: int, out: bytearray):
+    """Append a non-negative integer as a LEB128 varint"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_postings(data: bytes) -> List[int]:
+    """Decode a delta-encoded varint posting list into absolute offsets"""
+    offsets = []
+    value = shift = previous = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        offsets.append(previous)
+        value = shift = 0
+    return offsets
+
+
+class _LogPostings:
+    """Posting lists of one log file: token -> delta-encoded record offsets"""
+
+    def __init__(self, inode: Optional[int] = None):
+        self.inode = inode
+        # End of the last complete line indexed, and a checksum of the bytes before it
+        self.indexed_bytes = 0
+        self.fingerprint = 0
+        # Start of the record the next continuation line belongs to
+        self.record_offset = 0
+        self.postings: Dict[str, bytearray] = {}
+        self.last_offsets: Dict[str, int] = {}
+
+    def add(self, token: str, offset: int) -> bool:
+        """Add a record offset to a token's list (offsets arrive in increasing order); False if already there"""
+        last = self.last_offsets.get(token)
+        if last == offset:
+            return False
+        posting = self.postings.get(token)
+        if posting is None:
+            posting = self.postings[token] = bytearray()
+        encode_varint(offset - (last or 0), posting)
+        self.last_offsets[token] = offset
+        return True
+
+
+class LogTokenIndex:
+    """
+    Inverted index over the records of several logs
+
+    Posting lists hold the byte offsets of the records a token appears in,
+    delta-encoded as varints. Each update only reads what was appended
+    since the previous one, so it can run on every ingestion pass; keep one
+    instance per process rather than reloading the file each time. Updates
+    and searches are serialized, so an instance can be shared between threads.
+    """
+
+    def __init__(self, index_file: str):
+        """
+        Args:
+            index_file: File the index is persisted to
+        """
+        self.index_file = index_file
+        self._logs: Dict[str, _LogPostings] = self._load()
+        self._lock = threading.RLock()
+
+    def update(self, log_paths: Iterable[str]) -> int:
+        """
+        Index the bytes appended to each log since the last update
+
+        The index file is only rewritten when postings were added or a log
+        was (re)started.
+
+        Returns:
+            Number of bytes indexed
+        """
+        indexed = 0
+        changed = False
+        with self._lock:
+            for log_path in log_paths:
+                file_bytes, file_changed = self._update_file(os.path.abspath(log_path))
+                indexed += file_bytes
+                changed = changed or file_changed
+            if changed:
+                self._save()
+        return indexed
+
+    def lookup(self, token: str) -> Dict[str, List[int]]:
+        """
+        Record offsets containing a token
+
+        Returns:
+            Dict of log path -> record byte offsets, in file order
+        """
+        token = token.lower()
+        return {log_path: decode_postings(log.postings[token])
+                for log_path, log in self._logs.items() if token in log.postings}
+
+    def search(self, tokens: Iterable[str], max_records: int = 200) -> Dict[str, List[LogRecord]]:
+        """
+        Records that contain every given token
+
+        Args:
+            tokens: Tokens to match (as produced by tokenize)
+            max_records: Most records returned per log
+
+        Returns:
+            Dict of log path -> matching records in file order (logs without matches omitted)
+        """
+        return {log_path: list(self._read_records(log_path, offsets[:max_records]))
+                for log_path, offsets in self._matching_offsets(tokens).items()}
+
+    def match_count(self, tokens: Iterable[str]) -> int:
+        """Number of records (across all logs) that contain every given token"""
+        return sum(len(offsets) for offsets in self._matching_offsets(tokens).values())
+
+    def _matching_offsets(self, tokens: Iterable[str]) -> Dict[str, List[int]]:
+        """Log path -> sorted offsets of the records containing every token"""
+        tokens = [token.lower() for token in tokens]
+        if not tokens:
+            return {}
+
+        matches = {}
+        with self._lock:
+            for log_path, log in self._logs.items():
+                if any(token not in log.postings for token in tokens):
+                    continue
+                # Intersect starting from the shortest posting list
+                posting_lists = sorted((log.postings[token] for token in tokens), key=len)
+                offsets = set(decode_postings(posting_lists[0]))
+                for posting in posting_lists[1:]:
+                    offsets.intersection_update(decode_postings(posting))
+                if offsets:
+                    matches[log_path] = sorted(offsets)
+        return matches
+
+    def _update_file(self, log_path: str) -> Tuple[int, bool]:
+        """
+        Index the complete lines appended to one log
+
+        Returns:
+            (bytes indexed, whether the log's postings changed)
+        """
+        try:
+            stat = os.stat(log_path)
+        except OSError:
+            return 0, False
+
+        log = self._logs.get(log_path)
+        with open(log_path, 'rb') as f:
+            if (log is None or log.inode != stat.st_ino or stat.st_size < log.indexed_bytes
+                    or offset_fingerprint(f, log.indexed_bytes) != log.fingerprint):
+                # New, rotated or truncated (maybe rewritten past the indexed bytes): index from the beginning
+                log = self._logs[log_path] = _LogPostings(stat.st_ino)
+                changed = True
+            else:
+                changed = False
+            if stat.st_size == log.indexed_bytes:
+                return 0, changed
+
+            start = log.indexed_bytes
+            f.seek(start)
+            position = start
+            remainder = b''
+            while True:
+                chunk = f.read(DEFAULT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines = (remainder + chunk).split(b'\n')
+                # A trailing partial line is indexed once its writer finishes it
+                remainder = lines.pop()
+                for raw in lines:
+                    line = raw.decode('utf-8', errors='replace')
+                    if starts_with_timestamp(line):
+                        log.record_offset = position
+                    for token in tokenize(line):
+                        changed = log.add(token, log.record_offset) or changed
+                    position += len(raw) + 1
+            log.fingerprint = offset_fingerprint(f, position)
+
+        log.indexed_bytes = position
+        return position - start, changed
+
+    @staticmethod
+    def _read_records(log_path: str, offsets: List[int]) -> Iterator[LogRecord]:
+        """Read the records starting at the given offsets"""
+        with open(log_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                lines = [f.readline().decode('utf-8', errors='replace')]
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    line = line.decode('utf-8', errors='replace')
+                    if starts_with_timestamp(line):
+                        break
+                    lines.append(line)
+                yield from iter_records(lines)
+
+    def _load(self) -> Dict[str, _LogPostings]:
+        """Load the persisted index, starting fresh if it is missing or unreadable"""
+        try:
+            with open(self.index_file, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == _INDEX_VERSION:
+                return data['logs']
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError):
+            pass
+        return {}
+
+    def _save(self):
+        """Write the index atomically so a crash never leaves a torn file"""
+        directory = os.path.dirname(self.index_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': _INDEX_VERSION, 'logs': self._logs}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_file)
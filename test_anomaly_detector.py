@@ -2,11 +2,32 @@
 """
 Test script to verify anomaly detection is working correctly
 """
+import gzip
 import json
+import os
+import shutil
+import tempfile
 from src.utils.anomaly_detector import AnomalyDetector
 from src.utils.code_mapper import CodeMapper
+from src.utils.code_watcher import CodeWatcher
+from src.utils.event_histogram import EventHistogram
+from src.utils.log_follower import LogFollower
+from src.utils.log_index import LogTimeIndex
+from src.utils.log_reader import MappedLogReader
+from src.utils.log_source import RotatedLogSet
+from src.utils.metric_baseline import MetricBaseline
+from src.utils.path_resolver import PathResolver
+from src.utils.log_parser import parse_log
+from src.utils.template_miner import TemplateMiner
+from src.utils.token_index import LogTokenIndex
 from src.config import Config
 
+def write_log(path, start, count, mode='w'):
+    """Write ERROR lines numbered start..start+count-1, one second apart"""
+    with open(path, mode) as f:
+        for i in range(start, start + count):
+            f.write(f"2024-10-17 10:{i // 60:02d}:{i % 60:02d},000 ERROR [db.py:{i}] Lock timeout on ACC{10000 + i}\n")
+
 def main():
     print("🧪 Testing Anomaly Detection System\n")
     print("=" * 60)
@@ -62,6 +83,215 @@ def main():
         ctx = code_context['code_contexts'][0]
         print(f"   ✓ Root cause: {ctx['file']} line {ctx['error_line']} in {ctx.get('function', 'unknown')}")
     
+    # A service that always runs at 9/10 connections and 800ms is its normal, not an anomaly
+    print("\n8. Checking adaptive baselines on a steady series...")
+    steady = {'metrics': [{'time': f"09:{i:02d}", 'service': 'steady', 'active_connections': 9,
+                           'max_connections': 10, 'avg_response_time_ms': 800} for i in range(50)]}
+    steady_anomalies = detector.analyze_metrics_adaptive(steady, MetricBaseline())
+    warmed_up = [a for a in steady_anomalies['anomalies'] if a['zscore'] is not None]
+    assert not warmed_up, f"steady series fired {len(warmed_up)} times after warm-up"
+    print(f"   ✓ No anomalies after warm-up ({steady_anomalies['total_anomalies']} from static thresholds while warming up)")
+
+    # A heartbeat logged 20 times a minute for an hour is steady, not a rate jump
+    heartbeat = '\n'.join(f"2024-10-17 10:{minute:02d}:{second * 3:02d},000 INFO [health.py:10] heartbeat ok"
+                          for minute in range(60) for second in range(20))
+    heartbeat_anomalies = detector.analyze_log_templates(parse_log(heartbeat), TemplateMiner())
+    rate_jumps = [a for a in heartbeat_anomalies['anomalies'] if a['type'] == 'template_rate_anomaly']
+    assert not rate_jumps, f"steady template rate fired {len(rate_jumps)} times"
+    print("   ✓ No template rate jumps for a steady heartbeat")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Every line is counted exactly once through appends, a rotation and a copytruncate
+        print("\n9. Following a growing, rotated and truncated log...")
+        live_log = os.path.join(tmp, 'app.log')
+        state_file = os.path.join(tmp, 'follow.json')
+        follower = LogFollower(state_file)
+        write_log(live_log, 0, 5)
+        assert follower.follow(live_log)['error_count'] == 5
+        write_log(live_log, 5, 3, 'a')
+        assert follower.follow(live_log)['error_count'] == 8, "appended lines not picked up"
+        os.rename(live_log, live_log + '.1')
+        write_log(live_log + '.1', 8, 2, 'a')
+        write_log(live_log, 10, 4)
+        assert follower.follow(live_log)['error_count'] == 14, "rotation lost or repeated lines"
+        write_log(live_log, 14, 6)
+        assert follower.follow(live_log)['error_count'] == 20, "copytruncate lost or repeated lines"
+        assert LogFollower(state_file).follow(live_log)['error_count'] == 20, "reloaded state re-read lines"
+        print("   ✓ 20 errors counted once across append, rotation and copytruncate")
+
+        # Shards are merged in file order, so the result is the single-pass one
+        print("\n10. Analyzing the payment log in parallel shards...")
+        payment_log = os.path.join(tmp, 'payment_service.log')
+        with open(payment_log, 'w') as f:
+            f.write(log_content)
+        parallel_anomalies = detector.analyze_log_file_parallel(payment_log, workers=2, min_shard_bytes=1)
+        assert parallel_anomalies == log_anomalies, "parallel result differs from analyze_logs"
+        print("   ✓ Parallel result matches analyze_logs")
+
+        # Lines without a marker are skipped undecoded, which must not change the result
+        print("\n11. Analyzing the payment log through a memory map...")
+        with MappedLogReader(payment_log) as reader:
+            mapped_anomalies = detector.analyze_log_stream(reader)
+        assert mapped_anomalies == log_anomalies, "memory-mapped result differs from analyze_logs"
+        print("   ✓ Memory-mapped result matches analyze_logs")
+
+        # A small interval puts many entries in the index; the second update only extends it
+        print("\n12. Querying a time range through the log time index...")
+        timed_log = os.path.join(tmp, 'timed.log')
+        time_index = LogTimeIndex(timed_log, os.path.join(tmp, 'timed.idx'), interval_bytes=256)
+        write_log(timed_log, 0, 300)
+        time_index.update()
+        write_log(timed_log, 300, 300, 'a')
+        time_index.update()
+        with open(timed_log, 'r') as f:
+            timed_records = parse_log(f.read())
+        start_ms, end_ms = timed_records[123].timestamp_ms, timed_records[456].timestamp_ms
+        expected = [record for record in timed_records if start_ms <= record.timestamp_ms <= end_ms]
+        assert time_index.records(start_ms, end_ms) == expected, "indexed range differs from a full scan"
+        print(f"   ✓ {len(expected)} records in range from {len(time_index)} index entries, matching a full scan")
+
+        print("\n13. Searching the payment log through the token index...")
+        token_index = LogTokenIndex(os.path.join(tmp, 'tokens.idx'))
+        token_index.update([payment_log])
+        payment_records = parse_log(log_content)
+        for tokens in (['PMT20241017091545'], ['PMT20241017091545', 'transaction_handler.py']):
+            found = token_index.search(tokens).get(os.path.abspath(payment_log), [])
+            expected = [record for record in payment_records
+                        if all(token in '\n'.join((record.raw,) + record.continuation) for token in tokens)]
+            assert found == expected, f"token search for {tokens} differs from a full scan"
+        assert token_index.update([payment_log]) == 0, "unchanged log was indexed again"
+        print(f"   ✓ Payment PMT20241017091545 found in {token_index.match_count(['PMT20241017091545'])} records, matching a full scan")
+
+        # Equal mtimes (as after a copy) fall back to the rotation number; .bak is not a segment
+        print("\n14. Reading a rotated log set with a gzip segment...")
+        rotated_log = os.path.join(tmp, 'rotated', 'service.log')
+        os.makedirs(os.path.dirname(rotated_log))
+        write_log(rotated_log + '.2', 0, 10)
+        with open(rotated_log + '.2', 'rb') as src, gzip.open(rotated_log + '.2.gz', 'wb') as dst:
+            dst.write(src.read())
+        os.remove(rotated_log + '.2')
+        write_log(rotated_log + '.1', 10, 10)
+        write_log(rotated_log, 20, 10)
+        write_log(rotated_log + '.bak', 0, 1)
+        for name in os.listdir(os.path.dirname(rotated_log)):
+            os.utime(os.path.join(os.path.dirname(rotated_log), name), (1729150000, 1729150000))
+        log_set = RotatedLogSet(rotated_log)
+        segments = [os.path.basename(path) for path in log_set.segments()]
+        assert segments == ['service.log.2.gz', 'service.log.1', 'service.log'], f"segments out of order: {segments}"
+        line_numbers = [record.source_line for record in parse_log('\n'.join(log_set))]
+        assert line_numbers == list(range(30)), "rotated lines out of order"
+        print(f"   ✓ Segments read oldest first: {', '.join(segments)}")
+
+    # Tracebacks from a deployed container name files under its own root, not dummy_data/codebase
+    print("\n15. Resolving traceback paths to codebase files...")
+    resolved = mapper.path_resolver.resolve('/srv/app/database_manager.py')
+    assert resolved == 'dummy_data/codebase/database_manager.py', f"container path resolved to {resolved}"
+    library = mapper.path_resolver.resolve('/usr/lib/python3.11/site-packages/database_manager.py')
+    assert library is None, f"site-packages path resolved to {library}"
+    resolver = PathResolver(['proj/src/handlers/base.py', 'proj/src/models/base.py'], root='proj/src')
+    assert resolver.resolve('/app/handlers/base.py') == 'proj/src/handlers/base.py'
+    assert resolver.resolve('/venv/lib/python3.11/site-packages/handlers/base.py') is None
+    print(f"   ✓ /srv/app/database_manager.py -> {resolved}; site-packages paths left unresolved")
+
+    print("\n16. Watching a codebase for deployed changes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        codebase = os.path.join(tmp, 'codebase')
+        shutil.copytree(Config.CODEBASE_DIR, codebase)
+        watched_mapper = CodeMapper(codebase)
+        watcher = CodeWatcher(watched_mapper, full_scan_every=1)
+        assert not any(watcher.poll().values()), "unchanged codebase reported changes"
+        refunds = os.path.join(codebase, 'refunds.py')
+        with open(refunds, 'w') as f:
+            f.write("def refund(payment_id):\n    return payment_id\n")
+        added = watcher.poll()['added']
+        assert [path for path in added if path.endswith('refunds.py')], f"new file not picked up: {added}"
+        with open(refunds, 'a') as f:
+            f.write("\n\ndef cancel_refund(refund_id):\n    raise ValueError(refund_id)\n")
+        # Same-second rewrites can keep the mtime; bump it as a deploy would
+        modified_at = os.stat(refunds).st_mtime + 5
+        os.utime(refunds, (modified_at, modified_at))
+        modified = watcher.poll()['modified']
+        assert added == modified, f"edit not picked up: {modified}"
+        found = watched_mapper.search_code(parse_log("2024-10-17 10:00:00,000 ERROR [refunds.py:5] cancel_refund failed"))
+        assert found and found[0]['qualname'] == 'cancel_refund', "edited function not searchable"
+        print(f"   ✓ Added and modified {os.path.basename(added[0])} picked up and searchable")
+
+    # Lock timeouts logged without a traceback still lead to the function that logged them
+    print("\n17. Mapping errors without a stack trace to code...")
+    untraced = [record for record in parse_log(log_content) if record.level == 'ERROR' and not record.continuation]
+    untraced_context = mapper.map_records_to_code(untraced)
+    assert not untraced_context['stack_trace'], "expected no stack trace in these records"
+    retrieved = {(ctx['function'], ctx['error_line']) for ctx in untraced_context['code_contexts']}
+    assert ('DatabaseManager.execute_transaction', 93) in retrieved, f"logged function not retrieved: {retrieved}"
+    print(f"   ✓ {len(untraced)} untraced errors mapped to {len(retrieved)} functions, "
+          f"including DatabaseManager.execute_transaction line 93")
+
+    print("\n18. Grouping repeated log anomalies by fingerprint...")
+    grouped = detector.analyze_logs(log_content, aggregate=True)
+    grouped_hits = sum(group['count'] for group in grouped['anomalies'])
+    assert grouped_hits == log_anomalies['total_anomalies'], "groups lost or double-counted hits"
+    assert grouped['distinct_anomalies'] == len(grouped['anomalies']) <= grouped_hits
+    print(f"   ✓ {grouped_hits} hits in {grouped['distinct_anomalies']} groups")
+
+    print("\n19. Counting log events into the dashboard histogram...")
+    histogram = EventHistogram()
+    streamed = detector.analyze_log_stream(log_content.split('\n'), histogram=histogram)
+    assert streamed == log_anomalies, "histogram pass changed the analysis result"
+    level_totals = dict(histogram.totals('level'))
+    expected_errors = sum(1 for record in parse_log(log_content) if record.level == 'ERROR')
+    assert level_totals.get('ERROR') == expected_errors, f"histogram counted {level_totals.get('ERROR')} errors"
+    keyword_hits = sum(count for _, count in histogram.totals('keyword'))
+    assert keyword_hits == log_anomalies['total_anomalies'], "histogram keyword counts differ from the anomalies"
+    print(f"   ✓ {expected_errors} errors and {keyword_hits} keyword hits in the histogram")
+
+    # Mapping the same log again is served from the snippet cache and gives the same contexts
+    print("\n20. Re-mapping the payment log through the snippet cache...")
+    misses_before = mapper.snippet_stats['misses']
+    repeat_context = mapper.map_error_to_code(log_content)
+    assert repeat_context['code_contexts'] == code_context['code_contexts'], "cached contexts differ"
+    assert repeat_context['frame_stats']['snippet_cache_misses'] == misses_before, "cached snippets were re-read"
+    print(f"   ✓ {repeat_context['frame_stats']['snippet_cache_hits']} snippet cache hits, no new misses")
+
+    # The library frame raised, but the root cause is the deepest frame of our own code
+    print("\n21. Ranking traceback frames past a library frame...")
+    library_traceback = (
+        "2024-10-17 10:00:00,000 ERROR [payment_service.py:44] Payment failed\n"
+        "Traceback (most recent call last):\n"
+        '  File "/app/payment_service.py", line 40, in process_payment\n'
+        "    result = self.handler.execute_transfer(payment)\n"
+        '  File "/srv/app/database_manager.py", line 93, in execute_transaction\n'
+        "    cursor.execute(query)\n"
+        '  File "/usr/lib/python3.11/site-packages/psycopg2/extras.py", line 146, in execute\n'
+        "    return super().execute(query, vars)\n"
+        "psycopg2.errors.LockNotAvailable: could not obtain lock\n")
+    tracebacks = mapper.extract_tracebacks(library_traceback)
+    assert len(tracebacks) == 1, f"expected one traceback, got {len(tracebacks)}"
+    origins = [frame['origin'] for frame in tracebacks[0]['frames']]
+    assert origins == ['project', 'project', 'library'], f"frames labelled {origins}"
+    library_context = mapper.map_error_to_code(library_traceback)
+    root_cause = library_context['code_contexts'][0]
+    assert (root_cause['function'], root_cause['error_line']) == ('execute_transaction', 93), \
+        f"root cause is {root_cause['function']} line {root_cause['error_line']}"
+    assert not [ctx for ctx in library_context['code_contexts'] if 'site-packages' in ctx['file']]
+    print(f"   ✓ Root cause: {root_cause['file']} line {root_cause['error_line']}, library frame skipped")
+
+    # A traceback that stops at the database layer still shows who called into it
+    print("\n22. Walking the call graph up from the failing function...")
+    callers = mapper.find_callers('dummy_data/codebase/database_manager.py', 'DatabaseManager.execute_transaction')
+    direct = [(caller['qualname'], caller['call_line']) for caller in callers if caller['depth'] == 1]
+    assert direct == [('TransactionHandler.execute_transfer', 55)], f"direct callers: {direct}"
+    assert {caller['qualname'] for caller in callers if caller['depth'] == 2} >= {'PaymentService.process_payment'}
+    shallow_traceback = (
+        "2024-10-17 10:00:00,000 ERROR [database_manager.py:93] Transaction failed\n"
+        "Traceback (most recent call last):\n"
+        '  File "/srv/app/database_manager.py", line 93, in execute_transaction\n'
+        "    cursor.execute(query)\n"
+        "TimeoutError: lock wait timeout\n")
+    caller_contexts = mapper.map_error_to_code(shallow_traceback)['caller_contexts']
+    assert caller_contexts and caller_contexts[0]['function'] == 'TransactionHandler.execute_transfer', \
+        "caller snippet not attached"
+    print(f"   ✓ {len(callers)} callers within two calls; {len(caller_contexts)} caller snippets attached")
+
     # Combined summary
     print("\n" + "=" * 60)
     print("📊 SUMMARY")